@@ -0,0 +1,432 @@
+import os
+import time
+import asyncio
+import functools
+import logging
+import contextlib
+from urllib.parse import quote
+
+import httpx
+from a2wsgi import WSGIMiddleware
+from gspread.utils import absolute_range_name, fill_gaps
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+
+import main
+
+# ----------------------------------------------------
+# ASGI 服務模式
+# 五個主要路由與 SSE 事件推播以原生 async 處理；Google Sheets 的讀寫透過共用連線池的非同步 HTTP 連線，
+# 一個緩慢的 Sheets 回應不會卡住其他請求。其餘路由 (例如批次更新) 交給原本的 Flask app。
+#
+# main.task_cache 的鎖可能被 Flask 執行緒在讀取 Sheets 期間持有，SQLite 與壓縮回應也需要時間，
+# 所以凡是會取得這個鎖、存取 SQLite 或壓縮的呼叫一律以 asyncio.to_thread 在執行緒中執行，不阻塞事件迴圈。
+#
+# 啟動方式：uvicorn asgi_app:app --host 0.0.0.0 --port $PORT
+
+SHEETS_API_BASE = "https://sheets.googleapis.com/v4/spreadsheets"
+SHEETS_MAX_CONNECTIONS = int(os.environ.get('SHEETS_MAX_CONNECTIONS', 10))  # 連線池大小
+SHEETS_TIMEOUT = float(os.environ.get('SHEETS_TIMEOUT', 15))                # 單次請求逾時 (秒)
+
+
+class AsyncSheetsClient:
+    """
+    以 httpx.AsyncClient 直接呼叫 Sheets API v4 的非同步用戶端。
+
+    與 gspread 共用同一組憑證，存取權杖只在過期時更新一次。
+    """
+
+    def __init__(self, credentials, spreadsheet_id, worksheet_name):
+        self.credentials = credentials
+        self.worksheet_name = worksheet_name
+        self._http = httpx.AsyncClient(
+            base_url=f"{SHEETS_API_BASE}/{spreadsheet_id}",
+            timeout=SHEETS_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=SHEETS_MAX_CONNECTIONS,
+                max_keepalive_connections=SHEETS_MAX_CONNECTIONS,
+            ),
+        )
+        self._token_lock = asyncio.Lock()
+
+    async def aclose(self):
+        await self._http.aclose()
+
+    async def _auth_headers(self):
+        if not self.credentials.valid:
+            async with self._token_lock:
+                if not self.credentials.valid:
+                    # 與 gspread 共用 main.refresh_credentials 的鎖；refresh 是同步呼叫，放到執行緒中執行
+                    await asyncio.to_thread(main.refresh_credentials)
+        return {"Authorization": f"Bearer {self.credentials.token}"}
+
+    async def _send(self, method, url, **kwargs):
+        response = await self._http.request(method, url, headers=await self._auth_headers(), **kwargs)
+        response.raise_for_status()
+        return response.json()
+
+    async def _request(self, operation, method, url, **kwargs):
+        """經過 main.sheets_scheduler 的配額控制與退避重試後送出請求。"""
+        kind = 'read' if method == "GET" else 'write'
+        return await main.sheets_scheduler.call_async(
+            self._send, kind, method, url, retry_on=(httpx.TransportError,), operation=operation, **kwargs)
+
+    def _range(self, a1_range=None):
+        return absolute_range_name(self.worksheet_name, a1_range)
+
+    async def get_all_values(self):
+        """與 gspread 的 get_all_values() 相同：回傳補齊成矩形的所有資料。"""
+        data = await self._request("get_all_values", "GET", f"/values/{quote(self._range(), safe='')}")
+        return fill_gaps(data.get('values', []))
+
+    async def batch_get(self, ranges):
+        """一次讀取多個範圍，回傳各範圍的資料列。"""
+        data = await self._request("batch_get", "GET", "/values:batchGet", params={
+            "ranges": [self._range(r) for r in ranges],
+            "majorDimension": "ROWS",
+        })
+        return [value_range.get('values', []) for value_range in data.get('valueRanges', [])]
+
+    async def batch_update(self, data):
+        """與 gspread 的 batch_update(data) 相同：一次寫入多個範圍 (RAW，見 main.status_cell_updates)。"""
+        return await self._request("batch_update", "POST", "/values:batchUpdate", json={
+            "valueInputOption": "RAW",
+            "data": [{"range": self._range(item["range"]), "values": item["values"]} for item in data],
+        })
+
+
+class ThreadedSheetsClient:
+    """
+    把同步的工作表 (例如 SHEETS_BACKEND=fake 的假工作表) 包裝成與 AsyncSheetsClient 相同的介面，
+    在執行緒中執行呼叫；工作表本身已經過 main.sheets_scheduler。
+    """
+
+    def __init__(self, worksheet):
+        self.worksheet = worksheet
+
+    async def aclose(self):
+        pass
+
+    async def get_all_values(self):
+        return await asyncio.to_thread(self.worksheet.get_all_values)
+
+    async def batch_get(self, ranges):
+        return await asyncio.to_thread(self.worksheet.batch_get, ranges)
+
+    async def batch_update(self, data):
+        return await asyncio.to_thread(self.worksheet.batch_update, data)
+
+
+sheets = None
+
+
+def current_sheets():
+    """
+    回傳非同步 Sheets 用戶端；main 在背景連線，連線完成後第一次呼叫時才建立。
+    尚未連線時回傳 None。
+    """
+    global sheets
+    if sheets is None:
+        if main.client and main.SHEET_SHARDING == 'none':
+            sheets = AsyncSheetsClient(main.client.http_client.auth, main.spreadsheet_id, main.WORKSHEET_NAME)
+        elif main.sheet is not None:
+            # 假工作表或分片工作表：以執行緒呼叫同步的介面
+            sheets = ThreadedSheetsClient(main.sheet)
+    return sheets
+
+# 同時到達的 /get_tasks 共用同一次同步
+_inflight_sync = None
+
+
+async def _sync_tasks():
+    global _inflight_sync
+    try:
+        known, ranges = await asyncio.to_thread(main.task_cache.sync_plan)
+        started = time.perf_counter()
+        if ranges is None:
+            values = await current_sheets().get_all_values()
+        else:
+            values = await current_sheets().batch_get(ranges)
+        main.TASKS_STAGE_SECONDS.observe(time.perf_counter() - started, "fetch")
+        await asyncio.to_thread(main.task_cache.apply_sync, known, ranges, values)
+    finally:
+        _inflight_sync = None
+
+
+async def ensure_tasks_fresh():
+    """任務快取過期時以非同步方式同步；同時間只會有一次進行中的讀取。"""
+    global _inflight_sync
+    if await asyncio.to_thread(main.task_cache.is_fresh):
+        main.CACHE_REQUESTS.inc("task_cache", "hit")
+        return
+    main.CACHE_REQUESTS.inc("task_cache", "miss")
+    if _inflight_sync is None:
+        _inflight_sync = asyncio.ensure_future(_sync_tasks())
+    # shield：某個請求被取消時，不影響其他正在等待同一次讀取的請求
+    await asyncio.shield(_inflight_sync)
+
+
+@contextlib.asynccontextmanager
+async def sheet_rows_locked():
+    """
+    共用持有 main.sheet_rows_lock；只有封存工作正在刪除列時才需要等待，
+    等待放在執行緒中，不阻塞事件迴圈。等待期間被取消時，取得鎖後立即釋放。
+    """
+    acquiring = asyncio.ensure_future(asyncio.to_thread(main.sheet_rows_lock.acquire_shared))
+    try:
+        await asyncio.shield(acquiring)
+    except asyncio.CancelledError:
+        acquiring.add_done_callback(lambda _: main.sheet_rows_lock.release_shared())
+        raise
+    try:
+        yield
+    finally:
+        main.sheet_rows_lock.release_shared()
+
+
+# ----------------------------------------------------
+# 路由定義 (對應 main.py 中的 1～5 號與 7 號路由)
+
+def timed(route):
+    """記錄原生路由的處理時間 (與 Flask 路由共用 main.HTTP_REQUEST_SECONDS)。"""
+    def decorator(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(request):
+            started = time.perf_counter()
+            response = await endpoint(request)
+            main.HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, route, request.method,
+                                              response.status_code)
+            return response
+        return wrapper
+    return decorator
+
+
+def not_ready_response():
+    return JSONResponse({"status": "error", "message": "伺服器正在連線至 Google Sheets，請稍後再試。"}, 503,
+                        headers={"Retry-After": str(main.NOT_READY_RETRY_AFTER)})
+
+
+def write_pending_response(message):
+    return JSONResponse({"status": "error", "message": message}, 409,
+                        headers={"Retry-After": str(main.WRITE_PENDING_RETRY_AFTER)})
+
+
+def sheets_busy_response():
+    return JSONResponse({"status": "error", "message": "Google Sheets 目前忙碌中，請稍後再試。"}, 503,
+                        headers={"Retry-After": str(main.sheets_scheduler.retry_after())})
+
+
+@timed('/')
+async def home(request):
+    status, body, headers = main.HOME_PAGE.render(
+        request.headers.get('accept-encoding'), request.headers.get('if-none-match'))
+    return Response(body, status_code=status, headers=headers, media_type='text/html; charset=utf-8')
+
+
+@timed('/submit_report')
+async def submit_data_api(request):
+    if not main.accepting_reports():
+        return not_ready_response()
+
+    try:
+        data = await request.json()
+    except Exception:
+        logging.error("請求資料解析失敗：不是有效的 JSON 格式。")
+        return JSONResponse({"status": "error", "message": "請求必須是 JSON 格式。請檢查網頁前端的 Content-Type。"}, 400)
+
+    try:
+        try:
+            row = main.build_report_row(data)
+        except ValueError as e:
+            logging.error(f"報修資料不正確: {e}")
+            return JSONResponse({"status": "error", "message": str(e)}, 400)
+
+        # 排入寫入佇列或寫入本機資料庫，不在請求中等待 Sheets 回應；重複送出直接回傳原受理編號
+        key = main.submission_key(data, request.headers.get('Idempotency-Key') or data.get('idempotencyKey'))
+        ticket, duplicate = await asyncio.to_thread(main.store_report_once, row, key)
+        if duplicate:
+            logging.info(f"重複送出的報修，回傳原受理編號 ({ticket})：{row}")
+            return JSONResponse({"status": "success", "message": "設備報修資料已成功送出！", "ticket": ticket,
+                                 "duplicate": True}, 202)
+
+        logging.info(f"已受理報修資料 ({ticket})：{row}")
+        return JSONResponse({"status": "success", "message": "設備報修資料已成功送出！", "ticket": ticket}, 202)
+
+    except Exception as e:
+        logging.error(f"寫入 Google Sheets 時發生錯誤: {e}")
+        return JSONResponse({"status": "error", "message": f"提交失敗：{str(e)}，可能是 Sheets API 限制或連線問題。"}, 500)
+
+
+@timed('/tasks')
+async def student_tasks_page(request):
+    status, body, headers = main.TASKS_PAGE.render(
+        request.headers.get('accept-encoding'), request.headers.get('if-none-match'))
+    return Response(body, status_code=status, headers=headers, media_type='text/html; charset=utf-8')
+
+
+@timed('/get_tasks')
+async def get_tasks_api(request):
+    if not main.storage_ready():
+        return not_ready_response()
+
+    try:
+        params = main.parse_task_query(request.query_params)
+    except ValueError as e:
+        return JSONResponse({"status": "error", "message": f"無效的查詢參數：{str(e)}"}, 400)
+
+    try:
+        # 本機資料庫模式下直接在執行緒中同步讀取；否則先以非同步方式讀取 Sheets
+        if not main.local_store:
+            await ensure_tasks_fresh()
+        status, body, headers = await asyncio.to_thread(
+            main.render_tasks, request.scope.get('query_string', b''), params,
+            request.headers.get('accept-encoding'), request.headers.get('if-none-match'),
+            refresh=bool(main.local_store))
+        return Response(body, status_code=status, headers=headers, media_type='application/json')
+
+    except Exception as e:
+        logging.error(f"讀取 Google Sheets 時發生錯誤: {e}")
+        if main.is_rate_limited(e):
+            return sheets_busy_response()
+        return JSONResponse({"status": "error", "message": f"讀取任務失敗：{str(e)}，請檢查 Sheets 權限。"}, 500)
+
+
+def patch_task_cache(updates, completed_at):
+    for rowIndex, status in updates.items():
+        main.task_cache.update_status(rowIndex, status, completed_at[rowIndex])
+
+
+@timed('/update_status')
+async def update_status_api(request):
+    if not main.storage_ready():
+        return not_ready_response()
+
+    try:
+        try:
+            data = await request.json()
+        except ValueError:
+            data = None
+        try:
+            parsed = main.parse_status_update(data)
+        except ValueError as e:
+            return JSONResponse({"status": "error", "message": f"無效的請求資料：{str(e)}。"}, 400)
+        task_id, _, newStatus = parsed
+
+        if main.local_store:
+            updates, errors, _ = await asyncio.to_thread(main.resolve_status_updates, [parsed])
+            if errors:
+                return JSONResponse({"status": "error", "message": f"更新狀態失敗：{errors[0]}。"}, 404)
+            await asyncio.to_thread(main.store_statuses, updates)
+        else:
+            # 查列號到寫入完成之間，封存工作不會移動工作表的列
+            async with sheet_rows_locked():
+                # 以非同步方式同步快取後再查受理編號；找不到時可能是其他行程剛寫入的，再同步一次
+                await ensure_tasks_fresh()
+                updates, errors, writing = await asyncio.to_thread(
+                    main.resolve_status_updates, [parsed], refresh=False)
+                if errors:
+                    await asyncio.to_thread(main.task_cache.expire)
+                    await ensure_tasks_fresh()
+                    updates, errors, writing = await asyncio.to_thread(
+                        main.resolve_status_updates, [parsed], refresh=False)
+                if writing:
+                    return write_pending_response(f"更新狀態失敗：{writing[0]}。")
+                if errors:
+                    return JSONResponse({"status": "error", "message": f"更新狀態失敗：{errors[0]}。"}, 404)
+                if updates:
+                    # 狀態與完成時間以一次 batchUpdate 寫入
+                    completed_at = await asyncio.to_thread(main.completion_times, updates)
+                    await current_sheets().batch_update(main.status_cell_updates(updates, completed_at))
+                    await asyncio.to_thread(patch_task_cache, updates, completed_at)
+
+        target = task_id or f"第 {parsed[1]} 列"
+        logging.info(f"成功更新 {target} 的狀態為: {newStatus}")
+        return JSONResponse({"status": "success", "message": f"任務狀態已成功更新為「{newStatus}」！"}, 200)
+
+    except Exception as e:
+        logging.error(f"更新 Google Sheets 時發生錯誤: {e}")
+        if main.is_rate_limited(e):
+            return sheets_busy_response()
+        return JSONResponse({"status": "error", "message": f"更新狀態失敗：{str(e)}。"}, 500)
+
+
+class AsyncEventSubscriber:
+    """在事件迴圈中等待事件的 SSE 訂閱者；事件由其他執行緒發布，透過 call_soon_threadsafe 轉交。"""
+
+    def __init__(self, maxsize):
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize)
+        self._overflowed = False
+
+    def push(self, event):
+        self._loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self._overflowed = True
+
+    async def get(self, timeout):
+        if self._overflowed:
+            self._overflowed = False
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            return (main.task_cache.version, "resync", {"version": main.task_cache.version})
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+@timed('/task_events')
+async def task_events_api(request):
+    """SSE：每個連線只佔用一個協程，不佔用執行緒。"""
+    try:
+        last_event_id = int(request.headers.get('last-event-id') or request.query_params.get('lastEventId'))
+    except (TypeError, ValueError):
+        last_event_id = None
+    subscriber = main.task_events.subscribe(AsyncEventSubscriber(main.SSE_QUEUE_SIZE), last_event_id)
+
+    async def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                event = await subscriber.get(main.SSE_HEARTBEAT_INTERVAL)
+                yield main.format_sse(event) if event else ": keepalive\n\n"
+        finally:
+            main.task_events.unsubscribe(subscriber)
+
+    return StreamingResponse(stream(), media_type='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    """關閉時釋放非同步 Sheets 用戶端的連線池 (用戶端在 Sheets 連線後才建立，見 current_sheets)。"""
+    try:
+        yield
+    finally:
+        if sheets:
+            await sheets.aclose()
+
+
+app = Starlette(
+    routes=[
+        Route('/', home),
+        Route('/submit_report', submit_data_api, methods=['POST']),
+        Route('/tasks', student_tasks_page),
+        Route('/get_tasks', get_tasks_api, methods=['GET']),
+        Route('/update_status', update_status_api, methods=['POST']),
+        Route('/task_events', task_events_api, methods=['GET']),
+        # 其餘路由交給原本的 Flask app (在執行緒池中執行)
+        Mount('/', app=WSGIMiddleware(main.app)),
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])],
+    lifespan=lifespan,
+)
@@ -0,0 +1,218 @@
+"""
+路由負載／基準測試
+
+以記憶體內的假工作表 (SHEETS_BACKEND=fake) 在本機測量各路由的延遲與吞吐量，不需要 Google 憑證。
+每一種資料量都在獨立的子行程中執行，彼此的快取不互相影響。
+
+範例：
+    python benchmark.py                                  # 1k / 10k / 100k 列，並行 8
+    python benchmark.py --rows 10000 --concurrency 32 --requests 500
+    FAKE_SHEETS_LATENCY_MS=150 FAKE_SHEETS_ERROR_RATE=0.02 python benchmark.py
+    python benchmark.py --url http://localhost:8000      # 測量已啟動的服務 (例如 uvicorn asgi_app:app)
+
+輸出每個路由的 p50 / p95 / p99 延遲、每秒請求數、錯誤數，以及平均每個請求的 Sheets API 呼叫次數
+(由 /sheets_stats 的排程器統計計算，包含背景寫入)。
+"""
+import os
+import sys
+import json
+import time
+import random
+import logging
+import tempfile
+import argparse
+import datetime
+import subprocess
+import concurrent.futures
+
+from fake_sheets import sample_ticket
+
+ROUTES = ['/', '/tasks', '/submit_report', '/get_tasks', '/update_status']
+DEFAULT_ROWS = '1000,10000,100000'
+STATUSES = ["待處理", "處理中", "已完成"]
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def build_request(route, rows, args):
+    """回傳 (method, path, json_body)。"""
+    if route == '/submit_report':
+        return 'POST', route, {
+            "reporterName": f"壓測{random.randint(1, 99999)}",
+            "deviceLocation": "電腦教室",
+            "problemDescription": "基準測試",
+            "helperTeacher": "無指定",
+        }
+    if route == '/get_tasks':
+        return 'GET', f"{route}?{args.get_tasks_query}" if args.get_tasks_query else route, None
+    if route == '/update_status':
+        return 'POST', route, {
+            "id": sample_ticket(random.randrange(max(1, rows))),
+            "newStatus": random.choice(STATUSES),
+        }
+    return 'GET', route, None
+
+
+class FlaskTarget:
+    """在同一個行程內以 Flask test client 呼叫 main.app。"""
+
+    def __init__(self):
+        import main
+        # 每個請求的 INFO log 會影響測量結果
+        logging.getLogger().setLevel(logging.WARNING)
+        self.main = main
+        self.app = main.app
+        # Sheets 在背景連線；等暖機完成再開始計時
+        main.sheets_connector.warmed_up.wait(60)
+
+    def send(self, method, path, body):
+        client = self.app.test_client()
+        response = client.open(path, method=method, json=body)
+        response.close()
+        return response.status_code
+
+    def sheets_calls(self):
+        stats = self.main.sheets_scheduler.stats()
+        return stats['read']['calls'] + stats['write']['calls']
+
+    def drain(self):
+        """等背景寫入完成，讓呼叫次數包含寫入佇列或同步器的 Sheets 請求。"""
+        if self.main.replicator:
+            self.main.replicator.replicate_once()
+            return
+        deadline = time.monotonic() + 60
+        while self.main.write_queue.pending_count() and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+
+class HttpTarget:
+    """以 HTTP 呼叫已啟動的服務。"""
+
+    def __init__(self, base_url, concurrency):
+        import httpx
+        self.http = httpx.Client(base_url=base_url, timeout=60,
+                                 limits=httpx.Limits(max_connections=concurrency))
+
+    def send(self, method, path, body):
+        return self.http.request(method, path, json=body).status_code
+
+    def sheets_calls(self):
+        stats = self.http.get('/sheets_stats').json()['scheduler']
+        return stats['read']['calls'] + stats['write']['calls']
+
+    def drain(self):
+        time.sleep(1)
+
+
+def run_route(target, route, rows, args):
+    """以 args.concurrency 個並行請求送出 args.requests 個請求，回傳統計結果。"""
+
+    def one(_):
+        method, path, body = build_request(route, rows, args)
+        started = time.perf_counter()
+        try:
+            status = target.send(method, path, body)
+        except Exception:
+            status = None
+        return time.perf_counter() - started, status
+
+    for _ in range(args.warmup):
+        one(None)
+
+    calls_before = target.sheets_calls()
+    started = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(args.concurrency) as pool:
+        results = list(pool.map(one, range(args.requests)))
+    elapsed = time.perf_counter() - started
+    target.drain()
+    calls = target.sheets_calls() - calls_before
+
+    latencies = sorted(latency for latency, _ in results)
+    errors = sum(1 for _, status in results if status is None or status >= 400)
+    return {
+        "route": route,
+        "rows": rows,
+        "requests": len(results),
+        "errors": errors,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "rps": len(results) / elapsed if elapsed else 0.0,
+        "sheets_calls_per_request": calls / len(results) if results else 0.0,
+    }
+
+
+def print_results(results, rows_label, file=sys.stdout):
+    print(f"\n資料量：{rows_label}", file=file)
+    print(f"{'route':<16}{'reqs':>7}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>10}{'calls/req':>11}",
+          file=file)
+    for r in results:
+        print(f"{r['route']:<16}{r['requests']:>7}{r['errors']:>8}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}"
+              f"{r['p99_ms']:>10.1f}{r['rps']:>10.1f}{r['sheets_calls_per_request']:>11.3f}", file=file)
+
+
+def run_worker(args):
+    """子行程：在假工作表上依序測量每個路由。"""
+    target = FlaskTarget()
+    results = [run_route(target, route, args.worker_rows, args) for route in args.routes]
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False))
+    else:
+        print_results(results, f"{args.worker_rows} 列")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="以假工作表測量各路由的延遲與吞吐量。")
+    parser.add_argument('--rows', default=DEFAULT_ROWS, help=f"逗號分隔的資料量 (預設 {DEFAULT_ROWS})")
+    parser.add_argument('--concurrency', type=int, default=8, help="並行請求數 (預設 8)")
+    parser.add_argument('--requests', type=int, default=200, help="每個路由的請求數 (預設 200)")
+    parser.add_argument('--warmup', type=int, default=3, help="每個路由正式計時前的暖身請求數")
+    parser.add_argument('--routes', default=','.join(ROUTES), help="要測量的路由，逗號分隔")
+    parser.add_argument('--get-tasks-query', default='', help="/get_tasks 的查詢字串，例如 sort=open_first&limit=30")
+    parser.add_argument('--url', help="測量已啟動的服務，而不是在本行程內建立假工作表")
+    parser.add_argument('--json', action='store_true', help="以 JSON 輸出結果")
+    parser.add_argument('--worker-rows', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    args.routes = [route.strip() for route in args.routes.split(',') if route.strip()]
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.worker_rows is not None:
+        return run_worker(args)
+
+    print(f"{datetime.datetime.now():%Y-%m-%d %H:%M:%S} 並行 {args.concurrency}，每個路由 {args.requests} 個請求",
+          file=sys.stderr)
+
+    if args.url:
+        target = HttpTarget(args.url, args.concurrency)
+        # 遠端服務的資料量未知；/update_status 的列號範圍取 --rows 的第一個值
+        rows = int(args.rows.split(',')[0])
+        results = [run_route(target, route, rows, args) for route in args.routes]
+        if args.json:
+            print(json.dumps(results, ensure_ascii=False))
+        else:
+            print_results(results, args.url)
+        return
+
+    for rows in [int(r) for r in args.rows.split(',') if r.strip()]:
+        env = dict(os.environ, SHEETS_BACKEND='fake', FAKE_SHEETS_ROWS=str(rows))
+        # 預設不讓排程器的配額限制影響測量；要模擬真實配額時自行設定這兩個環境變數
+        env.setdefault('SHEETS_READS_PER_MINUTE', '1000000')
+        env.setdefault('SHEETS_WRITES_PER_MINUTE', '1000000')
+        env.setdefault('SQLITE_PATH', os.path.join(tempfile.mkdtemp(), 'reports.db'))
+        worker_argv = [sys.executable, os.path.abspath(__file__), '--worker-rows', str(rows),
+                       '--concurrency', str(args.concurrency), '--requests', str(args.requests),
+                       '--warmup', str(args.warmup), '--routes', ','.join(args.routes),
+                       '--get-tasks-query', args.get_tasks_query] + (['--json'] if args.json else [])
+        subprocess.run(worker_argv, env=env, check=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,276 @@
+import os
+import re
+import time
+import random
+import threading
+import collections
+from types import SimpleNamespace
+
+import gspread
+
+# ----------------------------------------------------
+# 記憶體內的假工作表
+# 設定 SHEETS_BACKEND=fake 時，main.py 以此取代 Google Sheets，
+# 不需要憑證與網路即可測量各路由的延遲與吞吐量 (見 benchmark.py)。
+#
+# 可用的環境變數：
+#   FAKE_SHEETS_ROWS：預先產生的報修資料筆數 (不含標題列)
+#   FAKE_SHEETS_LATENCY_MS：每次 API 呼叫的基本延遲 (毫秒)
+#   FAKE_SHEETS_LATENCY_PER_1K_ROWS_MS：讀取時每 1000 列額外增加的延遲 (毫秒)
+#   FAKE_SHEETS_ERROR_RATE：每次呼叫隨機失敗的機率 (0～1)，失敗時回傳 503
+#   FAKE_SHEETS_QUOTA_PER_MINUTE：每分鐘可呼叫次數，超過時回傳 429 (0 表示不限制)
+
+HEADER_ROW = ["時間戳記", "報修人姓名", "設備位置", "問題描述", "協辦老師", "處理狀態", "受理編號", "完成時間"]
+
+SAMPLE_LOCATIONS = ["101 教室", "102 教室", "電腦教室", "圖書館", "體育館", "實驗室"]
+SAMPLE_TEACHERS = ["無指定", "王老師", "陳老師", "林老師"]
+SAMPLE_STATUSES = ["待處理", "待處理", "處理中", "已完成"]
+
+
+class FakeSheetsError(Exception):
+    """模擬 Sheets API 錯誤；與 gspread 的 APIError 一樣帶有 response.status_code。"""
+
+    def __init__(self, status_code, message):
+        super().__init__(f"{status_code}: {message}")
+        self.response = SimpleNamespace(status_code=status_code)
+
+
+def sample_ticket(i):
+    """第 i 筆範例資料的受理編號。"""
+    return f"{i:012x}"
+
+
+def sample_rows(count, seed=0):
+    """產生 count 筆格式與真實報修資料相同的資料列 (含 G 欄的受理編號與已完成報修 H 欄的完成時間)。"""
+    rng = random.Random(seed)
+    start = time.mktime((2025, 1, 1, 8, 0, 0, 0, 0, -1))
+    rows = []
+    for i in range(count):
+        timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(start + i * 600))
+        location, teacher, status = (rng.choice(SAMPLE_LOCATIONS), rng.choice(SAMPLE_TEACHERS),
+                                     rng.choice(SAMPLE_STATUSES))
+        completed_at = ""
+        if status == "已完成":
+            completed_at = time.strftime('%Y-%m-%d %H:%M:%S',
+                                         time.localtime(start + i * 600 + rng.randint(600, 7 * 86400)))
+        rows.append([
+            timestamp,
+            f"學生{i:05d}",
+            location,
+            f"設備故障描述 #{i}",
+            teacher,
+            status,
+            sample_ticket(i),
+            completed_at,
+        ])
+    return rows
+
+
+def _parse_cell(a1):
+    """'B12' -> (欄, 列)；只有欄名時列為 None。"""
+    match = re.fullmatch(r"([A-Z]*)(\d*)", a1.upper())
+    col = 0
+    for ch in match.group(1):
+        col = col * 26 + ord(ch) - 64
+    return col or 1, int(match.group(2)) if match.group(2) else None
+
+
+def _user_entered(value):
+    """
+    模擬以 USER_ENTERED 寫入的值：Sheets 會把看起來像日期時間的文字存成日期值，
+    讀回時是工作表的顯示格式 (台灣地區設定，例如 "2025/1/5 下午 3:04:05")。
+    """
+    match = re.fullmatch(r"(\d{4})-(\d{2})-(\d{2}) (\d{2}):(\d{2}):(\d{2})", str(value))
+    if not match:
+        return value
+    year, month, day, hour, minute, second = map(int, match.groups())
+    noon = "上午" if hour < 12 else "下午"
+    return f"{year}/{month}/{day} {noon} {(hour - 1) % 12 + 1}:{minute:02d}:{second:02d}"
+
+
+class FakeWorksheet:
+    """
+    實作 main.py 用到的 gspread Worksheet 方法的記憶體工作表。
+
+    每個方法都會先模擬網路延遲與錯誤，並記錄在 calls 中，供基準測試計算每個請求的 API 呼叫次數。
+    """
+
+    def __init__(self, rows=None, title="工作表1", latency_ms=0.0, latency_per_1k_rows_ms=0.0,
+                 error_rate=0.0, quota_per_minute=0, sheet_id=0, header=HEADER_ROW):
+        self.title = title
+        self.id = sheet_id
+        self.latency = latency_ms / 1000.0
+        self.latency_per_row = latency_per_1k_rows_ms / 1000.0 / 1000.0
+        self.error_rate = error_rate
+        self.quota_per_minute = quota_per_minute
+        self.calls = collections.Counter()
+        self._rows = ([list(header)] if header else []) + [list(row) for row in (rows or [])]
+        self._lock = threading.Lock()
+        self._recent_calls = collections.deque()  # 最近一分鐘內的呼叫時間，用於模擬配額
+
+    @classmethod
+    def from_env(cls, title):
+        return cls(
+            rows=sample_rows(int(os.environ.get('FAKE_SHEETS_ROWS', 0))),
+            title=title,
+            latency_ms=float(os.environ.get('FAKE_SHEETS_LATENCY_MS', 0)),
+            latency_per_1k_rows_ms=float(os.environ.get('FAKE_SHEETS_LATENCY_PER_1K_ROWS_MS', 0)),
+            error_rate=float(os.environ.get('FAKE_SHEETS_ERROR_RATE', 0)),
+            quota_per_minute=int(os.environ.get('FAKE_SHEETS_QUOTA_PER_MINUTE', 0)),
+        )
+
+    def _simulate(self, method, rows_touched=0):
+        """記錄呼叫，並依設定模擬延遲、配額限制與隨機錯誤。"""
+        with self._lock:
+            self.calls[method] += 1
+            now = time.monotonic()
+            while self._recent_calls and now - self._recent_calls[0] > 60:
+                self._recent_calls.popleft()
+            over_quota = self.quota_per_minute and len(self._recent_calls) >= self.quota_per_minute
+            if not over_quota:
+                self._recent_calls.append(now)
+        delay = self.latency + rows_touched * self.latency_per_row
+        if delay:
+            time.sleep(delay)
+        if over_quota:
+            raise FakeSheetsError(429, "Quota exceeded for quota metric 'Read requests'")
+        if self.error_rate and random.random() < self.error_rate:
+            raise FakeSheetsError(503, "The service is currently unavailable.")
+
+    def _slice(self, a1_range):
+        """
+        讀取 A1 範圍 (可含工作表名稱)，回傳資料列。
+        與 Sheets API 一樣省略尾端的空白：每一列尾端的空白儲存格不回傳，尾端的空白列也不回傳。
+        """
+        a1_range = a1_range.split('!')[-1]
+        start, _, end = a1_range.partition(':')
+        col1, row1 = _parse_cell(start)
+        col2, row2 = _parse_cell(end or start)
+        row1 = row1 or 1
+        row2 = row2 or len(self._rows)
+        values = []
+        for row in self._rows[row1 - 1:row2]:
+            cells = row[col1 - 1:col2]
+            while cells and cells[-1] == '':
+                cells.pop()
+            values.append(cells)
+        while values and not values[-1]:
+            values.pop()
+        return values
+
+    # 讀取
+
+    def get_all_values(self):
+        with self._lock:
+            width = max((len(row) for row in self._rows), default=0)
+            values = [list(row) + [''] * (width - len(row)) for row in self._rows]
+        self._simulate('get_all_values', len(values))
+        return values
+
+    def get(self, a1_range, **kwargs):
+        with self._lock:
+            values = self._slice(a1_range)
+        self._simulate('get', len(values))
+        return values
+
+    get_values = get
+
+    def batch_get(self, ranges, **kwargs):
+        with self._lock:
+            values = [self._slice(a1_range) for a1_range in ranges]
+        self._simulate('batch_get', sum(len(v) for v in values))
+        return values
+
+    def col_values(self, col, **kwargs):
+        with self._lock:
+            values = [row[col - 1] if len(row) >= col else '' for row in self._rows]
+        while values and not values[-1]:
+            values.pop()
+        self._simulate('col_values', len(values))
+        return values
+
+    # 寫入
+
+    def append_rows(self, rows, **kwargs):
+        self._simulate('append_rows', len(rows))
+        with self._lock:
+            first = len(self._rows) + 1
+            self._rows.extend(list(row) for row in rows)
+            last = len(self._rows)
+        return {"updates": {"updatedRange": f"'{self.title}'!A{first}:H{last}", "updatedRows": len(rows)}}
+
+    def append_row(self, row, **kwargs):
+        return self.append_rows([row], **kwargs)
+
+    def _set(self, row, col, value):
+        while len(self._rows) < row:
+            self._rows.append([])
+        cells = self._rows[row - 1]
+        if len(cells) < col:
+            cells.extend([''] * (col - len(cells)))
+        cells[col - 1] = value
+
+    def update_cell(self, row, col, value):
+        self._simulate('update_cell', 1)
+        with self._lock:
+            self._set(row, col, value)
+        return {"updatedCells": 1}
+
+    def batch_update(self, data, raw=True, **kwargs):
+        self._simulate('batch_update', len(data))
+        with self._lock:
+            for item in data:
+                col, row = _parse_cell(item['range'].split('!')[-1].split(':')[0])
+                for i, values in enumerate(item['values']):
+                    for j, value in enumerate(values):
+                        self._set(row + i, col + j, value if raw else _user_entered(value))
+        return {"totalUpdatedCells": sum(len(v) for item in data for v in item['values'])}
+
+    def _delete_rows(self, start_index, end_index):
+        """刪除第 start_index + 1 到 end_index 列 (與 Sheets API 的 deleteDimension 相同，索引從 0 開始)。"""
+        with self._lock:
+            del self._rows[start_index:end_index]
+
+    def total_calls(self):
+        with self._lock:
+            return sum(self.calls.values())
+
+
+class FakeSpreadsheet:
+    """只實作 main.py 用到的試算表層級操作：取得、新增工作表，以及以 batch_update 刪除列。"""
+
+    def __init__(self, worksheet):
+        self._worksheets = [worksheet]
+        self._template = worksheet
+
+    def _simulate(self, method):
+        self._template._simulate(method)
+
+    def worksheets(self):
+        self._simulate('worksheets')
+        return list(self._worksheets)
+
+    def worksheet(self, title):
+        self._simulate('worksheet')
+        for worksheet in self._worksheets:
+            if worksheet.title == title:
+                return worksheet
+        raise gspread.WorksheetNotFound(title)
+
+    def add_worksheet(self, title, rows, cols, **kwargs):
+        self._simulate('add_worksheet')
+        template = self._template
+        worksheet = FakeWorksheet(
+            title=title, latency_ms=template.latency * 1000, error_rate=template.error_rate,
+            sheet_id=max(w.id for w in self._worksheets) + 1, header=None)
+        worksheet.calls = template.calls
+        self._worksheets.append(worksheet)
+        return worksheet
+
+    def batch_update(self, body):
+        self._simulate('batch_update')
+        by_id = {worksheet.id: worksheet for worksheet in self._worksheets}
+        for req in body.get('requests', []):
+            dimension = req['deleteDimension']['range']
+            by_id[dimension['sheetId']]._delete_rows(dimension['startIndex'], dimension['endIndex'])
+        return {"replies": [{} for _ in body.get('requests', [])]}
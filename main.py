@@ -1,11 +1,40 @@
+import io
 import os
+import re
+import csv
+import gzip
 import json
+import queue
+import base64
+import hashlib
+import operator
+import bisect
+import time
+import heapq
+import math
+import uuid
+import asyncio
+import random
+import sqlite3
+import atexit
+import contextlib
+import concurrent.futures
 import gspread
+import requests
 import logging
 import datetime
-from flask import Flask, request, jsonify, Response, escape
+import threading
+import collections
+import unicodedata
+try:
+    import fcntl
+except ImportError:  # Windows 沒有 fcntl；本機資料庫模式只能以單一 worker 執行
+    fcntl = None
+from flask import Flask, request, jsonify, Response, g
+from werkzeug.http import parse_accept_header, parse_etags, quote_etag
 from flask_cors import CORS 
 from oauth2client.service_account import ServiceAccountCredentials
+from google.auth.transport.requests import Request as GoogleAuthRequest
 
 # 設定日誌等級，方便在 Render 上除錯
 logging.basicConfig(level=logging.INFO)
@@ -21,224 +50,3427 @@ scope = [
     "https://www.googleapis.com/auth/drive",
 ]
 
+# 資料來源：google (預設) 或 fake (記憶體內的假工作表，用於本機測試與基準測試，見 fake_sheets.py)
+SHEETS_BACKEND = os.environ.get('SHEETS_BACKEND', 'google').lower()
+
 # 全域變數用於儲存 gspread client 和工作表
 client = None
+spreadsheet = None  # 試算表本身 (新增封存工作表、刪除列時使用)
 sheet = None
+credentials = None  # 解析過的服務帳戶憑證；重新連線時直接沿用
 
 def initialize_gspread():
-    """初始化 Google Sheets 連線。"""
-    global client, sheet
+    """初始化 Google Sheets 連線 (由 SheetsConnector 在背景呼叫，失敗時會重試)。"""
+    global client, spreadsheet, sheet, credentials
     
-    if client:
+    if sheet is not None:
         return True 
 
+    if SHEETS_BACKEND == 'fake':
+        import fake_sheets
+        worksheet = fake_sheets.FakeWorksheet.from_env(WORKSHEET_NAME)
+        spreadsheet = ScheduledWorksheet(fake_sheets.FakeSpreadsheet(worksheet), sheets_scheduler)
+        sheet = (ShardedWorksheet(spreadsheet, WORKSHEET_NAME) if SHEET_SHARDING != 'none'
+                 else ScheduledWorksheet(worksheet, sheets_scheduler))
+        logging.info(f"使用記憶體內的假工作表 (SHEETS_BACKEND=fake)。工作表名稱: {WORKSHEET_NAME}")
+        return True
+
     try:
-        creds_json = os.environ.get('SERVICE_ACCOUNT_CREDENTIALS')
-        if not creds_json:
-            logging.error("致命錯誤：找不到 SERVICE_ACCOUNT_CREDENTIALS 環境變數。")
-            return False
-
-        # 嘗試解析 JSON 憑證
-        creds_dict = json.loads(creds_json)
-        creds = ServiceAccountCredentials.from_json_keyfile_dict(
-            creds_dict,
-            scope
-        )
-        client = gspread.authorize(creds)
+        if credentials is None:
+            creds_json = os.environ.get('SERVICE_ACCOUNT_CREDENTIALS')
+            if not creds_json:
+                logging.error("致命錯誤：找不到 SERVICE_ACCOUNT_CREDENTIALS 環境變數。")
+                return False
+
+            # 嘗試解析 JSON 憑證
+            creds_dict = json.loads(creds_json)
+            credentials = ServiceAccountCredentials.from_json_keyfile_dict(
+                creds_dict,
+                scope
+            )
+        if client is None:
+            client = gspread.authorize(credentials)
         
-        # 嘗試打開試算表並選取工作表
-        sheet = client.open_by_key(spreadsheet_id).worksheet(WORKSHEET_NAME)
-        logging.info(f"成功連線到 Google Sheets。工作表名稱: {WORKSHEET_NAME}")
+        # 嘗試打開試算表並選取工作表；之後所有工作表操作都經過排程器
+        spreadsheet = ScheduledWorksheet(sheets_scheduler.call('read', client.open_by_key, spreadsheet_id), sheets_scheduler)
+        if SHEET_SHARDING != 'none':
+            sheet = ShardedWorksheet(spreadsheet, WORKSHEET_NAME)
+        else:
+            sheet = ScheduledWorksheet(spreadsheet.worksheet(WORKSHEET_NAME), sheets_scheduler)
+        logging.info(f"成功連線到 Google Sheets。工作表名稱: {WORKSHEET_NAME} (分片: {SHEET_SHARDING})")
         return True
 
     except Exception as e:
         logging.error(f"連線到 Google Sheets 或打開工作表時發生錯誤: {e}")
         return False
 
+# ----------------------------------------------------
+# 效能指標
+# 各路由與每一次 Sheets API 呼叫的耗時記錄在記憶體內的直方圖與計數器，由 /metrics 以 Prometheus 文字格式輸出。
+# 記錄一次只需要一次 bisect 與一個短暫的鎖，不影響請求的延遲。
+METRICS_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Histogram:
+    """依標籤分組的延遲直方圖 (秒)。"""
+
+    def __init__(self, name, help_text, label_names=(), buckets=METRICS_LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series = {}  # 標籤值 -> [各區間的次數, 總和, 次數]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextlib.contextmanager
+    def time(self, *labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = [(labels, list(counts), total, count) for labels, (counts, total, count) in self._series.items()]
+        for labels, counts, total, count in sorted(series):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, labels, [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, labels)} {count}")
+        return lines
+
+
+class Counter:
+    """依標籤分組的累計計數器。"""
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values = collections.Counter()
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] += amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        lines.extend(f"{self.name}{_format_labels(self.label_names, labels)} {value}" for labels, value in values)
+        return lines
+
+
+class Gauge:
+    """
+    輸出時才讀取數值的量測值；fn 回傳數字，或 {標籤值 tuple: 數字}。
+    數值來自其他模組已累計的計數時，metric_type 設為 counter。
+    """
+
+    def __init__(self, name, help_text, fn, label_names=(), metric_type="gauge"):
+        self.name = name
+        self.help_text = help_text
+        self.fn = fn
+        self.label_names = tuple(label_names)
+        self.metric_type = metric_type
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.metric_type}"]
+        try:
+            value = self.fn()
+        except Exception as e:
+            logging.warning(f"讀取指標 {self.name} 失敗: {e}")
+            return lines
+        items = value.items() if isinstance(value, dict) else [((), value)]
+        lines.extend(f"{self.name}{_format_labels(self.label_names, labels)} {v}" for labels, v in sorted(items))
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, *args, **kwargs):
+        return self.register(Histogram(*args, **kwargs))
+
+    def counter(self, *args, **kwargs):
+        return self.register(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs):
+        return self.register(Gauge(*args, **kwargs))
+
+    def render(self):
+        """輸出 Prometheus 文字格式。"""
+        return "\n".join(line for metric in self._metrics for line in metric.render()) + "\n"
+
+
+metrics = MetricsRegistry()
+
+HTTP_REQUEST_SECONDS = metrics.histogram(
+    "http_request_duration_seconds", "各路由處理請求的時間", ("route", "method", "status"))
+SHEETS_CALL_SECONDS = metrics.histogram(
+    "sheets_api_call_duration_seconds", "每一次 Sheets API 呼叫的時間 (不含等待配額)", ("operation", "outcome"))
+SHEETS_QUOTA_WAIT_SECONDS = metrics.histogram(
+    "sheets_quota_wait_seconds", "呼叫 Sheets API 前等待配額的時間", ("kind",))
+TASKS_STAGE_SECONDS = metrics.histogram(
+    "get_tasks_stage_duration_seconds", "/get_tasks 各階段的時間：fetch、parse、query、encode、compress", ("stage",))
+CACHE_REQUESTS = metrics.counter(
+    "cache_requests_total", "各快取的命中與未命中次數", ("cache", "result"))
+
+# ----------------------------------------------------
+# Sheets API 排程器
+# 所有 Google Sheets 呼叫都經過同一個排程器：以權杖桶 (token bucket) 控制每分鐘的讀取與寫入次數，
+# 遇到 429 或 5xx 以加入隨機抖動的指數退避重試；等待配額時，使用者操作優先於背景工作。
+SHEETS_READS_PER_MINUTE = float(os.environ.get('SHEETS_READS_PER_MINUTE', 60))
+SHEETS_WRITES_PER_MINUTE = float(os.environ.get('SHEETS_WRITES_PER_MINUTE', 60))
+SHEETS_BURST = float(os.environ.get('SHEETS_BURST', 10))                # 權杖桶容量 (可連續發出的請求數)
+SHEETS_MAX_RETRIES = int(os.environ.get('SHEETS_MAX_RETRIES', 5))
+SHEETS_BACKOFF_BASE = float(os.environ.get('SHEETS_BACKOFF_BASE', 1))   # 第一次重試的等待上限 (秒)
+SHEETS_BACKOFF_MAX = float(os.environ.get('SHEETS_BACKOFF_MAX', 32))
+# ASGI 服務在事件迴圈中等待配額時，最久隔幾秒重新檢查一次是否輪到自己
+SHEETS_ASYNC_POLL_INTERVAL = float(os.environ.get('SHEETS_ASYNC_POLL_INTERVAL', 0.05))
+
+# 等待配額時的優先順序 (數字越小越優先)
+LANE_USER = 0
+LANE_BACKGROUND = 1
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+_lane_context = threading.local()
+
+
+def mark_background_thread():
+    """讓目前執行緒之後的 Sheets 呼叫都排在背景優先順序。"""
+    _lane_context.lane = LANE_BACKGROUND
+
+
+def current_lane():
+    return getattr(_lane_context, 'lane', LANE_USER)
+
+
+@contextlib.contextmanager
+def background_lane():
+    """這段期間內目前執行緒的 Sheets 呼叫排在背景優先順序，結束後還原。"""
+    previous = current_lane()
+    _lane_context.lane = LANE_BACKGROUND
+    try:
+        yield
+    finally:
+        _lane_context.lane = previous
+
+
+def sheets_error_status(e):
+    """取出 Sheets API 錯誤的 HTTP 狀態碼 (gspread 與 httpx 的例外都適用)。"""
+    return getattr(getattr(e, 'response', None), 'status_code', None)
+
+
+def is_retryable_sheets_error(e):
+    return (sheets_error_status(e) in RETRYABLE_STATUS_CODES
+            or isinstance(e, (requests.ConnectionError, requests.Timeout)))
+
+
+def is_rate_limited(e):
+    """重試後仍被 Sheets 以配額限制拒絕。"""
+    return sheets_error_status(e) == 429
+
+
+def backoff_delay(attempt):
+    """第 attempt 次重試的等待秒數 (full jitter)。"""
+    return random.uniform(0, min(SHEETS_BACKOFF_MAX, SHEETS_BACKOFF_BASE * 2 ** attempt))
+
+
+class TokenBucket:
+    """每分鐘補充固定數量權杖的權杖桶 (呼叫端負責加鎖)。"""
+
+    def __init__(self, per_minute, capacity):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_take(self):
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def seconds_until_token(self):
+        self._refill()
+        return max(0.0, (1 - self.tokens) / self.rate) if self.rate > 0 else 1.0
+
+
+class SheetsScheduler:
+    """
+    Sheets API 呼叫的共用排程器。
+
+    讀取與寫入各有一個權杖桶與一個依優先順序排列的等待佇列；
+    call() 取得權杖後才執行呼叫，遇到可重試的錯誤會退避後重新排隊。
+    """
+
+    def __init__(self, reads_per_minute, writes_per_minute, burst):
+        self._cond = threading.Condition()
+        self._buckets = {
+            'read': TokenBucket(reads_per_minute, burst),
+            'write': TokenBucket(writes_per_minute, burst),
+        }
+        self._waiting = {'read': [], 'write': []}   # heap: (lane, 排隊序號)
+        self._seq = 0
+        # 統計資料
+        self.calls = collections.Counter()           # 'read' / 'write' -> 實際發出的請求數
+        self.retries = collections.Counter()
+        self.failures = collections.Counter()
+        self.wait_seconds = collections.Counter()    # 累計等待配額的秒數
+        self.max_wait_seconds = collections.Counter()
+
+    def acquire(self, kind, lane=None):
+        """等待直到取得一個 kind ('read' 或 'write') 的權杖，回傳等待的秒數。"""
+        lane = current_lane() if lane is None else lane
+        started = time.monotonic()
+        bucket = self._buckets[kind]
+        waiting = self._waiting[kind]
+        with self._cond:
+            self._seq += 1
+            entry = (lane, self._seq)
+            heapq.heappush(waiting, entry)
+            try:
+                while True:
+                    if waiting[0] == entry and bucket.try_take():
+                        heapq.heappop(waiting)
+                        break
+                    timeout = bucket.seconds_until_token() if waiting[0] == entry else None
+                    self._cond.wait(timeout)
+            except BaseException:
+                waiting.remove(entry)
+                heapq.heapify(waiting)
+                raise
+            finally:
+                # 讓下一位排隊者重新檢查是否輪到自己
+                self._cond.notify_all()
+            return self._record_wait(kind, started)
+
+    async def acquire_async(self, kind, lane=LANE_USER):
+        """
+        acquire() 的非同步版本：在事件迴圈中以 asyncio.sleep 等待，不佔用執行緒。
+        配額用盡時排隊的請求若各佔一個預設執行緒池的執行緒，其他放到執行緒中的工作 (快取、SQLite、產生回應)
+        也會跟著卡住；與 acquire() 共用同一個等待佇列，優先順序不變。
+        """
+        started = time.monotonic()
+        bucket = self._buckets[kind]
+        waiting = self._waiting[kind]
+        with self._cond:
+            self._seq += 1
+            entry = (lane, self._seq)
+            heapq.heappush(waiting, entry)
+        try:
+            while True:
+                with self._cond:
+                    if waiting[0] == entry and bucket.try_take():
+                        heapq.heappop(waiting)
+                        self._cond.notify_all()
+                        return self._record_wait(kind, started)
+                    # 還沒輪到自己時無法得知要等多久，定期重新檢查
+                    delay = bucket.seconds_until_token() if waiting[0] == entry else SHEETS_ASYNC_POLL_INTERVAL
+                await asyncio.sleep(min(max(delay, 0.001), SHEETS_ASYNC_POLL_INTERVAL))
+        except BaseException:
+            with self._cond:
+                if entry in waiting:
+                    waiting.remove(entry)
+                    heapq.heapify(waiting)
+                self._cond.notify_all()
+            raise
+
+    def _record_wait(self, kind, started):
+        """記錄一次取得權杖的等待時間 (需持有 self._cond)，回傳等待的秒數。"""
+        waited = time.monotonic() - started
+        SHEETS_QUOTA_WAIT_SECONDS.observe(waited, kind)
+        self.calls[kind] += 1
+        self.wait_seconds[kind] += waited
+        self.max_wait_seconds[kind] = max(self.max_wait_seconds[kind], waited)
+        return waited
+
+    def call(self, kind, fn, *args, idempotent=True, **kwargs):
+        """
+        在配額內執行 fn，遇到 429 / 5xx 或連線錯誤時退避重試。
+        idempotent 為 False 的呼叫 (附加列、刪除列等) 只在被 429 拒絕時重試：5xx 或逾時時請求可能已經執行，
+        重送會重複附加或多刪資料，直接拋出例外，交給呼叫端確認結果。
+        """
+        operation = getattr(fn, '__name__', kind)
+        for attempt in range(SHEETS_MAX_RETRIES + 1):
+            self.acquire(kind)
+            started = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+                SHEETS_CALL_SECONDS.observe(time.perf_counter() - started, operation, "ok")
+                return result
+            except Exception as e:
+                SHEETS_CALL_SECONDS.observe(time.perf_counter() - started, operation, "error")
+                retryable = is_retryable_sheets_error(e) if idempotent else is_rate_limited(e)
+                if attempt >= SHEETS_MAX_RETRIES or not retryable:
+                    self.failures[kind] += 1
+                    raise
+                self.retries[kind] += 1
+                delay = backoff_delay(attempt)
+                logging.warning(f"Sheets API {kind} 失敗 ({e})，{delay:.1f} 秒後重試")
+                time.sleep(delay)
+
+    async def call_async(self, fn, kind, *args, retry_on=(), operation=None, **kwargs):
+        """
+        call() 的非同步版本，供 ASGI 服務使用：fn 為 coroutine function。
+        以 acquire_async() 在事件迴圈中等待權杖，不阻塞事件迴圈也不佔用執行緒；retry_on 為額外可重試的例外類別 (例如 httpx 的連線錯誤)，
+        operation 為記錄在指標中的操作名稱。
+        """
+        operation = operation or getattr(fn, '__name__', kind)
+        for attempt in range(SHEETS_MAX_RETRIES + 1):
+            await self.acquire_async(kind)
+            started = time.perf_counter()
+            try:
+                result = await fn(*args, **kwargs)
+                SHEETS_CALL_SECONDS.observe(time.perf_counter() - started, operation, "ok")
+                return result
+            except Exception as e:
+                SHEETS_CALL_SECONDS.observe(time.perf_counter() - started, operation, "error")
+                if attempt >= SHEETS_MAX_RETRIES or not (is_retryable_sheets_error(e) or isinstance(e, retry_on)):
+                    self.failures[kind] += 1
+                    raise
+                self.retries[kind] += 1
+                delay = backoff_delay(attempt)
+                logging.warning(f"Sheets API {kind} 失敗 ({e})，{delay:.1f} 秒後重試")
+                await asyncio.sleep(delay)
+
+    def retry_after(self):
+        """建議用戶端幾秒後再試 (Retry-After 標頭)。"""
+        with self._cond:
+            wait = max(bucket.seconds_until_token() for bucket in self._buckets.values())
+        return max(1, math.ceil(wait))
+
+    def stats(self):
+        """回傳各類請求的佇列長度、等待時間與重試次數等統計。"""
+        with self._cond:
+            return {
+                kind: {
+                    "queueDepth": len(self._waiting[kind]),
+                    "queueDepthByLane": {
+                        "user": sum(1 for lane, _ in self._waiting[kind] if lane == LANE_USER),
+                        "background": sum(1 for lane, _ in self._waiting[kind] if lane == LANE_BACKGROUND),
+                    },
+                    "availableTokens": round(self._buckets[kind].tokens, 2),
+                    "calls": self.calls[kind],
+                    "retries": self.retries[kind],
+                    "failures": self.failures[kind],
+                    "totalWaitSeconds": round(self.wait_seconds[kind], 3),
+                    "maxWaitSeconds": round(self.max_wait_seconds[kind], 3),
+                }
+                for kind in ('read', 'write')
+            }
+
+
+sheets_scheduler = SheetsScheduler(SHEETS_READS_PER_MINUTE, SHEETS_WRITES_PER_MINUTE, SHEETS_BURST)
+
+# gspread Worksheet 與 Spreadsheet 中會發出 API 請求的方法，依讀寫分類
+SHEETS_READ_METHODS = {'get_all_values', 'get_values', 'get', 'batch_get', 'col_values', 'row_values', 'acell', 'cell',
+                       'worksheet', 'worksheets'}
+SHEETS_WRITE_METHODS = {'append_row', 'append_rows', 'update', 'update_cell', 'batch_update', 'batch_clear',
+                        'delete_rows', 'insert_rows', 'add_rows', 'add_worksheet'}
+# 寫入固定儲存格的值，重送結果相同，可以放心重試；Spreadsheet 的 batch_update (刪除列等結構性修改) 不在此列
+SHEETS_IDEMPOTENT_WRITE_METHODS = {'update', 'update_cell', 'batch_update'}
+
+
+class ScheduledWorksheet:
+    """包裝 gspread 的 Worksheet (或 Spreadsheet)，讓每一次 API 呼叫都經過 SheetsScheduler。"""
+
+    def __init__(self, worksheet, scheduler):
+        self._worksheet = worksheet
+        self._scheduler = scheduler
+        self._is_spreadsheet = hasattr(worksheet, 'worksheets')
+
+    def __getattr__(self, name):
+        attr = getattr(self._worksheet, name)
+        if name in SHEETS_READ_METHODS:
+            kind, idempotent = 'read', True
+        elif name in SHEETS_WRITE_METHODS:
+            kind = 'write'
+            idempotent = name in SHEETS_IDEMPOTENT_WRITE_METHODS and not self._is_spreadsheet
+        else:
+            return attr
+        return lambda *args, **kwargs: self._scheduler.call(kind, attr, *args, idempotent=idempotent, **kwargs)
+
+
+# ----------------------------------------------------
+# 依時間分片的工作表 (選用)
+# SHEET_SHARDING=month 或 term 時，新報修寫入「設備報修_2026-10」(每月) 或「設備報修_115-1」(每學期) 等分片工作表，
+# 原本的「設備報修」工作表 (若存在) 保留為最舊的分片，單一工作表不會無限制地長大。
+# ShardedWorksheet 把所有分片依時間順序接成一張虛擬工作表：第 1 列是標題，之後依序是各分片的資料列，
+# 列號的意義與單一工作表相同，寫入佇列、任務快取與狀態更新都不需要知道分片的存在；
+# 跨分片的讀取在執行緒池中同時送出，再依順序合併。
+SHEET_SHARDING = os.environ.get('SHEET_SHARDING', 'none')                   # none、month 或 term
+if SHEET_SHARDING not in ('none', 'month', 'term'):
+    logging.error(f"無效的 SHEET_SHARDING：{SHEET_SHARDING}，改為不分片。")
+    SHEET_SHARDING = 'none'
+SHARD_READ_WORKERS = int(os.environ.get('SHARD_READ_WORKERS', 8))          # 同時讀取幾個分片
+SHARD_REFRESH_INTERVAL = float(os.environ.get('SHARD_REFRESH_INTERVAL', 60))  # 至少隔幾秒才重新列出分片
+SHARD_KEY_PATTERNS = {"month": re.compile(r"^\d{4}-\d{2}$"), "term": re.compile(r"^\d{2,3}-[12]$")}
+SHEET_HEADER_ROW = ["時間戳記", "報修人姓名", "設備位置", "問題描述", "協辦老師", "處理狀態", "受理編號", "完成時間"]
+A1_RANGE_PATTERN = re.compile(r"^([A-Z]+)(\d*)(?::([A-Z]+)(\d*))?$")
+
+
+def shard_key(timestamp):
+    """時間戳記所屬的分片名稱後綴 (例如 2026-10 或 115-1)；無法判斷時回傳 None。"""
+    key = semester_of(timestamp) if SHEET_SHARDING == 'term' else str(timestamp)[:7]
+    return key if key and SHARD_KEY_PATTERNS[SHEET_SHARDING].match(key) else None
+
+
+def shard_sort_key(key):
+    # 原本的單一工作表 (key 為空字串) 排在最前面；其餘依數字大小排序 ("99-2" 早於 "100-1")
+    return tuple(int(part) for part in re.findall(r"\d+", key))
+
+
+class ShardedWorksheet:
+    """
+    把多張分片工作表當成一張工作表使用，實作 main.py 用到的 gspread Worksheet 方法。
+
+    新資料一律附加到最新的分片；送出時間晚於最新分片時才建立新的分片，因此虛擬列號與單一工作表一樣只會在尾端增加。
+    各分片的資料列數在讀取時更新，用來把虛擬列號換算成分片內的列號。
+    """
+
+    def __init__(self, spreadsheet, base_title):
+        self.spreadsheet = spreadsheet
+        self.base_title = base_title
+        self.prefix = f"{base_title}_"
+        self._shards = []         # [(key, 工作表)]，依時間排序；原本的單一工作表 key 為 ""
+        self._lengths = {}        # key -> 資料列數 (不含標題列)
+        self._listed_at = float("-inf")
+        self._lock = threading.RLock()
+        self._pool = concurrent.futures.ThreadPoolExecutor(SHARD_READ_WORKERS, thread_name_prefix="shard-read")
+        self.refresh()
+
+    def refresh(self):
+        """重新列出分片工作表 (其他 worker 可能已建立新的分片)。"""
+        pattern = SHARD_KEY_PATTERNS[SHEET_SHARDING]
+        shards = []
+        for worksheet in self.spreadsheet.worksheets():
+            if worksheet.title == self.base_title:
+                shards.append(("", worksheet))
+            elif worksheet.title.startswith(self.prefix) and pattern.match(worksheet.title[len(self.prefix):]):
+                shards.append((worksheet.title[len(self.prefix):], worksheet))
+        shards.sort(key=lambda shard: shard_sort_key(shard[0]))
+        with self._lock:
+            known = dict(self._shards)
+            self._shards = [(key, known.get(key) or ScheduledWorksheet(worksheet, sheets_scheduler))
+                            for key, worksheet in shards]
+            self._listed_at = time.monotonic()
+
+    def _refresh_if_stale(self):
+        if time.monotonic() - self._listed_at >= SHARD_REFRESH_INTERVAL:
+            self.refresh()
+
+    def _fan_out(self, fn, items):
+        """在執行緒池中對每個項目呼叫 fn，依原順序回傳結果；沿用呼叫端的排程優先順序。"""
+        items = list(items)
+        if len(items) <= 1:
+            return [fn(item) for item in items]
+        lane = current_lane()
+
+        def run(item):
+            _lane_context.lane = lane
+            return fn(item)
+        return list(self._pool.map(run, items))
+
+    def _layout(self):
+        """回傳 [(key, 工作表, 第一筆資料的虛擬列號, 資料列數), ...]；必要時先讀取各分片的列數。"""
+        with self._lock:
+            shards = list(self._shards)
+            unknown = [(key, worksheet) for key, worksheet in shards if key not in self._lengths]
+        if unknown:
+            counts = self._fan_out(lambda shard: len(shard[1].col_values(1)), unknown)
+            with self._lock:
+                for (key, _), count in zip(unknown, counts):
+                    self._lengths[key] = max(0, count - 1)
+        with self._lock:
+            layout = []
+            start = 2
+            for key, worksheet in shards:
+                length = self._lengths.get(key, 0)
+                layout.append((key, worksheet, start, length))
+                start += length
+            return layout
+
+    def _pieces(self, a1_range):
+        """
+        把虛擬工作表的範圍拆成各分片的範圍，回傳 [(工作表, 分片內的範圍, 應有列數或 None), ...]。
+        最後一個分片的範圍可以超出已知的列數 (例如讀取新增的資料列)，應有列數為 None。
+        """
+        col1, row1, col2, row2 = A1_RANGE_PATTERN.match(a1_range.split('!')[-1]).groups()
+        if col2 is None:
+            # 單一儲存格
+            col2, row2 = col1, row1
+        row1 = int(row1) if row1 else 1
+        row2 = int(row2) if row2 else None
+        layout = self._layout()
+        pieces = []
+        if row1 == 1:
+            # 標題列取自最舊的分片
+            pieces.append((layout[0][1], f"{col1}1:{col2}1", 1))
+            row1 = 2
+        for i, (_, worksheet, start, length) in enumerate(layout):
+            last = i == len(layout) - 1
+            lo = max(row1, start)
+            hi = row2 if last else min(row2 or float("inf"), start + length - 1)
+            if hi is not None and lo > hi:
+                continue
+            local_lo = lo - start + 2
+            if hi is None:
+                pieces.append((worksheet, f"{col1}{local_lo}:{col2}", None))
+            else:
+                pieces.append((worksheet, f"{col1}{local_lo}:{col2}{hi - start + 2}", None if last else hi - lo + 1))
+        return pieces
+
+    def _locate(self, row):
+        """虛擬列號 -> (工作表, 分片內的列號)。"""
+        layout = self._layout()
+        if row == 1:
+            return layout[0][1], 1
+        for i, (_, worksheet, start, length) in enumerate(layout):
+            if row < start + length or i == len(layout) - 1:
+                return worksheet, row - start + 2
+
+    @staticmethod
+    def _merge(pieces, results):
+        """依序串接各分片的讀取結果；中間的分片補齊被省略的結尾空白列，讓列號對齊。"""
+        values = []
+        for (_, _, expected), rows in zip(pieces, results):
+            rows = [list(row) for row in rows]
+            if expected is not None:
+                rows.extend([] for _ in range(expected - len(rows)))
+            values.extend(rows)
+        while values and not any(values[-1]):
+            values.pop()
+        return values
+
+    # 讀取
+
+    def get_all_values(self):
+        self._refresh_if_stale()
+        with self._lock:
+            shards = list(self._shards)
+        results = self._fan_out(lambda shard: shard[1].get_all_values(), shards)
+        with self._lock:
+            for (key, _), values in zip(shards, results):
+                self._lengths[key] = max(0, len(values) - 1)
+        all_data = [list(results[0][0])] if results and results[0] else [list(SHEET_HEADER_ROW)]
+        for values in results:
+            all_data.extend(list(row) for row in values[1:])
+        width = max(len(row) for row in all_data)
+        return [row + [''] * (width - len(row)) for row in all_data]
+
+    def get(self, a1_range, **kwargs):
+        pieces = self._pieces(a1_range)
+        return self._merge(pieces, self._fan_out(lambda piece: piece[0].get(piece[1], **kwargs), pieces))
+
+    get_values = get
+
+    def batch_get(self, ranges, **kwargs):
+        # 新增的資料列可能在其他 worker 剛建立的分片中
+        self._refresh_if_stale()
+        split = [self._pieces(a1_range) for a1_range in ranges]
+        # 同一個分片的所有範圍合併成一次 batch_get，各分片同時讀取
+        by_worksheet = collections.OrderedDict()
+        for pieces in split:
+            for worksheet, local_range, _ in pieces:
+                by_worksheet.setdefault(id(worksheet), (worksheet, []))[1].append(local_range)
+        fetched = dict(zip(by_worksheet, self._fan_out(
+            lambda item: iter(item[0].batch_get(item[1], **kwargs)), by_worksheet.values())))
+        return [self._merge(pieces, [next(fetched[id(worksheet)]) for worksheet, _, _ in pieces])
+                for pieces in split]
+
+    def col_values(self, col, **kwargs):
+        layout = self._layout()
+        results = self._fan_out(lambda shard: shard[1].col_values(col, **kwargs), layout)
+        values = list(results[0][:1]) if results and results[0] else []
+        for i, ((_, _, _, length), shard_values) in enumerate(zip(layout, results)):
+            rows = list(shard_values[1:])
+            if i < len(layout) - 1:
+                rows.extend([''] * (length - len(rows)))
+            values.extend(rows)
+        while values and not values[-1]:
+            values.pop()
+        return values
+
+    # 寫入
+
+    def _create_shard(self, key):
+        title = f"{self.prefix}{key}"
+        try:
+            worksheet = self.spreadsheet.worksheet(title)
+        except gspread.WorksheetNotFound:
+            worksheet = self.spreadsheet.add_worksheet(title=title, rows=1000, cols=SHEET_COLUMN_COUNT)
+            logging.info(f"已建立分片工作表：{title}")
+        # 建立後寫入標題列失敗時不會自動重試 (附加不是冪等的)，下次建立時補上
+        if not worksheet.get("A1:H1"):
+            worksheet.append_rows([SHEET_HEADER_ROW], value_input_option='RAW')
+        self.refresh()
+
+    def append_rows(self, rows, **kwargs):
+        """附加到最新的分片；第一筆資料的時間晚於最新分片時先建立新的分片。回傳以虛擬列號表示的範圍。"""
+        with self._lock:
+            newest = self._shards[-1][0] if self._shards else None
+        key = shard_key(rows[0][0]) if rows else None
+        if newest is None or (key and shard_sort_key(key) > shard_sort_key(newest)):
+            self._create_shard(key or shard_key(taiwan_timestamp()))
+        layout = self._layout()
+        newest, worksheet, start, _ = layout[-1]
+        result = worksheet.append_rows(rows, **kwargs)
+        local_first = first_row_of_range(result.get('updates', {}).get('updatedRange', ''))
+        with self._lock:
+            if local_first is None:
+                # 無法得知寫入位置，下次使用時重新讀取列數
+                self._lengths.pop(newest, None)
+                return {"updates": {"updatedRows": len(rows)}}
+            self._lengths[newest] = local_first - 1 + len(rows) - 1
+        first = start + local_first - 2
+        return {"updates": {"updatedRange": f"'{self.base_title}'!A{first}:H{first + len(rows) - 1}",
+                            "updatedRows": len(rows)}}
+
+    def append_row(self, row, **kwargs):
+        return self.append_rows([row], **kwargs)
+
+    def update_cell(self, row, col, value):
+        worksheet, local_row = self._locate(row)
+        return worksheet.update_cell(local_row, col, value)
+
+    def batch_update(self, data, **kwargs):
+        by_worksheet = collections.OrderedDict()
+        for item in data:
+            col, row = A1_RANGE_PATTERN.match(item['range'].split('!')[-1]).group(1, 2)
+            worksheet, local_row = self._locate(int(row))
+            by_worksheet.setdefault(id(worksheet), (worksheet, []))[1].append(
+                dict(item, range=f"{col}{local_row}"))
+        return self._fan_out(lambda item: item[0].batch_update(item[1], **kwargs), by_worksheet.values())
+
+    def delete_rows(self, ranges):
+        """刪除虛擬列號區間 [(起, 迄), ...] (需由大到小排列)，換算成各分片的 deleteDimension 一次送出。"""
+        layout = self._layout()
+        delete_requests, deleted = [], collections.Counter()
+        for first, last in ranges:
+            for key, worksheet, start, length in reversed(layout):
+                lo, hi = max(first, start), min(last, start + length - 1)
+                if lo > hi:
+                    continue
+                delete_requests.append({"deleteDimension": {"range": {
+                    "sheetId": worksheet.id, "dimension": "ROWS",
+                    "startIndex": lo - start + 1, "endIndex": hi - start + 2,
+                }}})
+                deleted[key] += hi - lo + 1
+        try:
+            self.spreadsheet.batch_update({"requests": delete_requests})
+        except Exception:
+            # 不確定是否已刪除，下次使用時重新讀取各分片的列數
+            with self._lock:
+                self._lengths.clear()
+            raise
+        with self._lock:
+            for key, count in deleted.items():
+                self._lengths[key] = max(0, self._lengths.get(key, 0) - count)
+
+
+# ----------------------------------------------------
+# Sheets 連線 (背景暖機與重新連線)
+# 啟動時不在匯入階段等待 Google Sheets：網頁可以立即提供，連線、預先載入任務清單與更新存取權杖都在背景進行；
+# 連線失敗時以指數退避持續重試，不需要重新啟動服務。
+SHEETS_CONNECT_RETRY_MAX_DELAY = float(os.environ.get('SHEETS_CONNECT_RETRY_MAX_DELAY', 60))
+TOKEN_REFRESH_MARGIN = float(os.environ.get('TOKEN_REFRESH_MARGIN', 300))  # 存取權杖到期前幾秒更新
+
+_token_lock = threading.Lock()
+
+
+def refresh_credentials(force=False):
+    """
+    存取權杖過期 (或即將過期) 時更新。gspread 與 ASGI 的非同步用戶端共用同一組憑證，
+    由這個函式加鎖更新，同一時間只會有一次更新請求。
+    """
+    auth = client.http_client.auth if client else None
+    if auth is None:
+        return
+    with _token_lock:
+        if force or not auth.valid:
+            auth.refresh(GoogleAuthRequest())
+
+
+def seconds_until_token_refresh():
+    auth = client.http_client.auth if client else None
+    expiry = getattr(auth, 'expiry', None)
+    if expiry is None:
+        return None
+    remaining = (expiry - datetime.datetime.utcnow()).total_seconds()
+    return max(0.0, remaining - TOKEN_REFRESH_MARGIN)
+
+
+class SheetsConnector:
+    """
+    負責 Google Sheets 連線的背景執行緒。
+
+    連線成功前以指數退避重試；連線後預先載入任務清單 (或完成本機資料庫的首次匯入)，
+    之後在存取權杖到期前主動更新，讓請求不必等待權杖更新。
+    """
+
+    def __init__(self, max_delay):
+        self.max_delay = max_delay
+        self.connected = threading.Event()
+        self.warmed_up = threading.Event()
+        self.attempts = 0
+        self.last_error = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sheets-connector", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def status(self):
+        return {
+            "connected": self.connected.is_set(),
+            "warmedUp": self.warmed_up.is_set(),
+            "attempts": self.attempts,
+            "lastError": self.last_error,
+        }
+
+    def _run(self):
+        mark_background_thread()
+        delay = 1
+        while not self._stop.is_set():
+            self.attempts += 1
+            if initialize_gspread():
+                self.last_error = None
+                self.connected.set()
+                break
+            self.last_error = f"第 {self.attempts} 次連線失敗"
+            logging.warning(f"Google Sheets 尚未連線，{delay} 秒後重試。")
+            self._stop.wait(delay)
+            delay = min(delay * 2, self.max_delay)
+        else:
+            return
+
+        self._warm_up()
+
+        # 在權杖到期前主動更新；沒有權杖 (例如假工作表) 時結束執行緒
+        while True:
+            wait = seconds_until_token_refresh()
+            if wait is None or self._stop.wait(wait):
+                return
+            try:
+                refresh_credentials(force=True)
+            except Exception as e:
+                logging.error(f"更新 Google 存取權杖時發生錯誤: {e}")
+                if self._stop.wait(min(60, self.max_delay)):
+                    return
+
+    def _warm_up(self):
+        try:
+            if pending_local_store is not None:
+                open_local_store(pending_local_store)
+            task_cache.get_tasks()
+            self.warmed_up.set()
+            logging.info("已預先載入任務清單。")
+        except Exception as e:
+            # 預先載入失敗不影響服務，第一個請求會再同步一次
+            self.last_error = f"預先載入任務清單失敗: {e}"
+            logging.error(self.last_error)
+
+
+sheets_connector = SheetsConnector(SHEETS_CONNECT_RETRY_MAX_DELAY)
+sheets_connected = sheets_connector.connected
+
+
+# ----------------------------------------------------
+# 任務清單快取
+# /get_tasks 不再每次都讀取整張工作表，而是在 TTL 內直接回傳解析好的任務清單；
+# 寫入與狀態更新會同步修補快取，讓學生看到的資料保持最新。
+TASKS_CACHE_TTL = float(os.environ.get('TASKS_CACHE_TTL', 30))  # 秒；設為 0 即停用快取
+# 同步模式：incremental 只讀取新增列與狀態欄；full 每次讀取整張工作表
+TASKS_SYNC_MODE = os.environ.get('TASKS_SYNC_MODE', 'incremental')
+# 增量模式下，每隔多久仍做一次完整同步，以校正工作表中被手動刪除或修改的資料
+TASKS_FULL_SYNC_INTERVAL = float(os.environ.get('TASKS_FULL_SYNC_INTERVAL', 600))
+
+# 「狀態」欄位對應 Sheets 的 F 列，在 gspread 中列號 (col) 從 1 開始數，所以 F 列是 6
+STATUS_COLUMN_INDEX = 6
+TICKET_COLUMN_INDEX = 7  # G 列：送出時產生的受理編號，作為任務不會隨列號改變的 ID
+COMPLETED_AT_COLUMN_INDEX = 8  # H 列：狀態改為「已完成」的時間，用於統計修復所需的時間
+SHEET_COLUMN_COUNT = COMPLETED_AT_COLUMN_INDEX
+COMPLETED_STATUS = "已完成"
+
+
+def taiwan_now():
+    """目前的台灣時間 (不含時區資訊的 datetime)；伺服器本身的時區通常是 UTC。"""
+    return datetime.datetime.utcnow() + datetime.timedelta(hours=8)
+
+
+def taiwan_timestamp():
+    """目前的台灣時間，格式與工作表的時間戳記相同。"""
+    return taiwan_now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def parse_task_row(row_index, row):
+    """把工作表中的一列轉成任務 dict；資料不完整時回傳 None。"""
+    # 確保 row 至少有 6 個元素 (時間, 姓名, 位置, 描述, 協辦老師, 狀態)
+    if len(row) < 6:
+        return None
+    return {
+        "rowIndex": row_index, # 在 Sheets 中的實際列號，用於後續更新
+        "timestamp": row[0],
+        "reporterName": row[1],
+        "deviceLocation": row[2],
+        "problemDescription": row[3],
+        "helperTeacher": row[4], # 協辦老師 (E 列, 索引 4)
+        "status": row[5], # 狀態 (F 列, 索引 5)
+        "id": row[6] if len(row) > 6 else "", # 受理編號 (G 列, 索引 6)；舊資料沒有編號
+        "completedAt": row[7] if len(row) > 7 else "" # 完成時間 (H 列, 索引 7)
+    }
+
+
+def parse_task_rows(all_data):
+    """解析 get_all_values() 的結果 (第一列為標題)，回傳任務清單。"""
+    tasks_list = []
+    # 從第 2 列開始，所以 row_index 從 2 開始
+    for i, row in enumerate(all_data[1:], start=2):
+        task = parse_task_row(i, row)
+        # 忽略不完整的報修記錄
+        if task:
+            tasks_list.append(task)
+    return tasks_list
+
+
+# ----------------------------------------------------
+# 任務事件推播 (Server-Sent Events)
+# 任務快取每次新增任務或更新狀態時發布一則事件，/task_events 把事件推送給開著 /tasks 的頁面，
+# 頁面只需更新有變動的卡片，不必重新下載整份清單，也不會因為多開分頁而增加 Sheets 讀取。
+SSE_HEARTBEAT_INTERVAL = float(os.environ.get('SSE_HEARTBEAT_INTERVAL', 15))  # 沒有事件時每隔幾秒送一次保持連線
+SSE_QUEUE_SIZE = int(os.environ.get('SSE_QUEUE_SIZE', 256))                    # 每個連線最多暫存幾則事件
+SSE_HISTORY_SIZE = int(os.environ.get('SSE_HISTORY_SIZE', 256))                # 保留幾則事件供斷線重連時補送
+
+
+def format_sse(event):
+    """把 (id, 類型, 資料) 轉成 text/event-stream 格式。"""
+    event_id, event_type, data = event
+    return f"id: {event_id}\nevent: {event_type}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class EventSubscriber:
+    """一個 SSE 連線的事件佇列；消化不及 (佇列滿了) 時改為通知前端整份重新載入。"""
+
+    def __init__(self, maxsize):
+        self.queue = queue.Queue(maxsize)
+        self.overflowed = False
+
+    def push(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout):
+        """取得下一則事件；逾時回傳 None。"""
+        if self.overflowed:
+            self.overflowed = False
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            return (task_cache.version, "resync", {"version": task_cache.version})
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class TaskEventBus:
+    """把任務變動事件分送給所有訂閱中的連線，並保留最近的事件供重連時補送。"""
+
+    def __init__(self, history_size):
+        self._subscribers = set()
+        self._history = collections.deque(maxlen=history_size)
+        self._lock = threading.Lock()
+
+    def publish(self, event_id, event_type, data):
+        event = (event_id, event_type, data)
+        with self._lock:
+            self._history.append(event)
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber.push(event)
+
+    def subscribe(self, subscriber, last_event_id=None):
+        """
+        加入訂閱。提供 last_event_id (前端重連時的 Last-Event-ID) 時，
+        補送之後的事件；補送不完整，或 last_event_id 比目前最新的事件還新
+        (伺服器重新啟動後版本號從頭計算)，就改送 resync，請前端重新載入。
+        """
+        with self._lock:
+            if last_event_id is not None:
+                newest = self._history[-1][0] if self._history else task_cache.version
+                if last_event_id > newest:
+                    subscriber.push((newest, "resync", {"version": newest}))
+                elif self._history and self._history[0][0] <= last_event_id + 1:
+                    for event in self._history:
+                        if event[0] > last_event_id:
+                            subscriber.push(event)
+                elif last_event_id < task_cache.version:
+                    subscriber.push((task_cache.version, "resync", {"version": task_cache.version}))
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+
+task_events = TaskEventBus(SSE_HISTORY_SIZE)
+
+# ----------------------------------------------------
+# 建立次要索引的欄位，/get_tasks 可用這些欄位篩選
+INDEXED_TASK_FIELDS = ("status", "deviceLocation", "helperTeacher")
+
+# /get_tasks 支援的排序方式：row 依列號 (預設)、open_first 未完成優先、oldest / newest 依時間
+TASK_SORT_KEYS = {
+    "row": lambda task: (task["rowIndex"],),
+    "open_first": lambda task: (task["status"] == COMPLETED_STATUS, task["rowIndex"]),
+    "oldest": lambda task: (task["timestamp"], task["rowIndex"]),
+    "newest": lambda task: (task["timestamp"], task["rowIndex"]),
+}
+
+# 單次查詢最多回傳幾筆
+MAX_TASKS_PAGE_SIZE = int(os.environ.get('MAX_TASKS_PAGE_SIZE', 500))
+
+
+# 各排序方式的排序鍵中每個值的型別 (search 為 /search 的 (分數, 列號))；用來檢查用戶端送回的 cursor
+CURSOR_KEY_TYPES = {
+    "row": (int,),
+    "open_first": (bool, int),
+    "oldest": (str, int),
+    "newest": (str, int),
+    "search": ((int, float), int),
+}
+
+
+def encode_cursor(sort, sort_key):
+    """把排序方式與排序鍵編碼成可放在網址中的 cursor 字串。"""
+    return base64.urlsafe_b64encode(json.dumps([sort, list(sort_key)]).encode()).decode()
+
+
+def decode_cursor(cursor, sort):
+    """
+    還原 encode_cursor() 產生的 cursor，回傳排序鍵。
+    格式錯誤、型別不符，或 cursor 不是以同一種排序方式產生時丟出 ValueError。
+    """
+    try:
+        cursor_sort, sort_key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError("無效的 cursor")
+    if cursor_sort != sort:
+        raise ValueError("cursor 與排序方式不符，請從第一頁重新查詢")
+    types = CURSOR_KEY_TYPES[sort]
+    # bool 是 int 的子類別，需要分開檢查
+    if not (isinstance(sort_key, list) and len(sort_key) == len(types) and all(
+            isinstance(value, expected) and (expected is bool) == isinstance(value, bool)
+            for value, expected in zip(sort_key, types))):
+        raise ValueError("無效的 cursor")
+    return tuple(sort_key)
+
+
+# 工作表中的時間除了本程式寫入的 ISO 格式，也可能是 Sheets 的日期顯示格式：
+# 以 USER_ENTERED 寫入 (舊版的狀態更新或手動輸入) 的時間會被存成日期值，讀回的是顯示用的文字
+SHEET_TIME_FORMATS = ("%Y/%m/%d %H:%M:%S", "%Y/%m/%d %p %I:%M:%S")
+
+
+def parse_sheet_time(text):
+    """把工作表中的時間文字轉成 datetime，無法解析時丟出 ValueError。"""
+    try:
+        return datetime.datetime.fromisoformat(text)
+    except ValueError:
+        pass
+    text = text.replace("上午", "AM").replace("下午", "PM")
+    for fmt in SHEET_TIME_FORMATS:
+        try:
+            return datetime.datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+    raise ValueError(f"無法解析的時間：{text}")
+
+
+def fix_seconds(task):
+    """從送出到完成所經過的秒數；未完成或時間格式不正確時回傳 None。"""
+    if task["status"] != COMPLETED_STATUS or not task["completedAt"]:
+        return None
+    try:
+        started = parse_sheet_time(task["timestamp"])
+        completed = parse_sheet_time(task["completedAt"])
+    except ValueError:
+        return None
+    return max(0.0, (completed - started).total_seconds())
+
+
+class TaskStats:
+    """
+    任務清單的彙總統計：各狀態、各地點、各協辦老師的筆數，以及修復所需時間的排序清單。
+
+    隨任務快取的每一次新增與狀態變更一起增減，完整同步時重建；
+    查詢時只需走過各分組，不必掃描所有任務。
+    """
+
+    def __init__(self):
+        self.by_status = collections.Counter()
+        self.by_location = collections.defaultdict(collections.Counter)  # 地點 -> {狀態: 筆數}
+        self.by_teacher = collections.defaultdict(collections.Counter)   # 協辦老師 -> {狀態: 筆數}
+        self.fix_seconds = []  # 已完成任務的修復秒數，保持排序以便直接取中位數
+
+    def add(self, task):
+        self._count(task, 1)
+        seconds = fix_seconds(task)
+        if seconds is not None:
+            bisect.insort(self.fix_seconds, seconds)
+
+    def remove(self, task):
+        self._count(task, -1)
+        seconds = fix_seconds(task)
+        if seconds is not None:
+            i = bisect.bisect_left(self.fix_seconds, seconds)
+            if i < len(self.fix_seconds) and self.fix_seconds[i] == seconds:
+                del self.fix_seconds[i]
+
+    def _count(self, task, delta):
+        status = task["status"]
+        self.by_status[status] += delta
+        self.by_location[task["deviceLocation"]][status] += delta
+        self.by_teacher[task["helperTeacher"]][status] += delta
+
+    @staticmethod
+    def _groups(counters):
+        groups = {}
+        for name, counts in counters.items():
+            counts = {status: n for status, n in counts.items() if n > 0}
+            if counts:
+                total = sum(counts.values())
+                groups[name] = {"total": total, "open": total - counts.get(COMPLETED_STATUS, 0), "byStatus": counts}
+        return groups
+
+    def _fix_percentile(self, p):
+        values = self.fix_seconds
+        if not values:
+            return None
+        return round(values[min(len(values) - 1, int(p / 100 * len(values)))] / 3600, 2)
+
+    def snapshot(self):
+        by_status = {status: n for status, n in self.by_status.items() if n > 0}
+        total = sum(by_status.values())
+        return {
+            "total": total,
+            "open": total - by_status.get(COMPLETED_STATUS, 0),
+            "byStatus": by_status,
+            "byLocation": self._groups(self.by_location),
+            "byTeacher": self._groups(self.by_teacher),
+            "timeToFix": {
+                "count": len(self.fix_seconds),
+                "medianHours": self._fix_percentile(50),
+                "p90Hours": self._fix_percentile(90),
+            },
+        }
+
+
+# 全文搜尋：英數字以整個字詞為單位，中文等其他文字以相鄰兩字 (bigram) 為單位，不需要斷詞
+SEARCH_TOKEN_PATTERN = re.compile(r"[0-9a-z]+|[^\W\d_a-z]+")
+SEARCH_FIELD_WEIGHTS = {"deviceLocation": 2.0, "problemDescription": 1.0}
+
+
+def search_tokens(text):
+    """
+    把文字切成搜尋用的詞元，回傳 [[詞元, ...], ...]，每一段連續的文字一組。
+    英數字 (全形會先轉成半形、不分大小寫) 整段為一個詞元；其他文字每相鄰兩字一個詞元，只有一個字時就是該字。
+    """
+    groups = []
+    for run in SEARCH_TOKEN_PATTERN.findall(unicodedata.normalize("NFKC", text).lower()):
+        if run.isascii() or len(run) == 1:
+            groups.append([run])
+        else:
+            groups.append([run[i:i + 2] for i in range(len(run) - 1)])
+    return groups
+
+
+class TaskSearchIndex:
+    """
+    設備位置與問題描述的倒排索引：詞元 -> {列號: 權重}。
+
+    新增任務時逐筆加入，完整同步時重建；狀態變更不影響文字，不需要更新。
+    """
+
+    def __init__(self):
+        self._postings = collections.defaultdict(dict)
+        self._bigrams_by_char = collections.defaultdict(set)  # 單字 -> 含有這個字的 bigram，用於單字查詢
+        self._count = 0
+
+    def add(self, task):
+        row_index = task["rowIndex"]
+        for field, weight in SEARCH_FIELD_WEIGHTS.items():
+            for group in search_tokens(task[field]):
+                for token in group:
+                    postings = self._postings[token]
+                    postings[row_index] = postings.get(row_index, 0.0) + weight
+                    if len(token) == 2 and not token.isascii():
+                        self._bigrams_by_char[token[0]].add(token)
+                        self._bigrams_by_char[token[1]].add(token)
+        self._count += 1
+
+    def _matches(self, token):
+        """回傳含有這個查詢詞元的 {列號: 權重}；單一個中文字也比對含有它的 bigram。"""
+        if len(token) != 1 or token.isascii():
+            return self._postings.get(token, {})
+        matches = dict(self._postings.get(token, {}))
+        for bigram in self._bigrams_by_char.get(token, ()):
+            for row_index, weight in self._postings[bigram].items():
+                matches[row_index] = matches.get(row_index, 0.0) + weight
+        return matches
+
+    def search(self, query):
+        """
+        回傳符合查詢中所有詞元的 {列號: 分數}。
+        分數為各詞元的權重乘上 idf 的總和：越少任務含有的詞元越有鑑別力。
+        """
+        tokens = {token for group in search_tokens(query) for token in group}
+        if not tokens:
+            return {}
+        # 從最少任務含有的詞元開始取交集，候選數量一開始就是最小的
+        postings = sorted((self._matches(token) for token in tokens), key=len)
+        if not postings[0]:
+            return {}
+        scores = None
+        for matches in postings:
+            idf = math.log(1 + self._count / len(matches))
+            if scores is None:
+                scores = {row_index: weight * idf for row_index, weight in matches.items()}
+            else:
+                scores = {row_index: score + matches[row_index] * idf
+                          for row_index, score in scores.items() if row_index in matches}
+        return scores
+
+
+class TaskCache:
+    """
+    讀取穿透 (read-through) 的任務清單快取。
+
+    過期或失效後的第一個請求會重新同步工作表，其他同時到達的請求等待同一次同步的結果。
+    增量模式下只讀取新增的資料列與既有資料列的狀態欄 (F 列)，並定期做一次完整同步校正。
+
+    本機資料庫模式下不使用 TTL，而是比對資料庫的序號：序號改變 (包含其他 worker 的寫入) 時
+    只讀取序號較新的列；版本號直接採用資料庫的序號，讓所有 worker 的 ETag 與 SSE 事件編號一致。
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._tasks = None
+        self._by_row = {}        # 列號 -> 任務在 self._tasks 中的位置
+        self._by_id = {}         # 受理編號 -> 列號
+        self._index = {}         # 欄位 -> {值: 列號集合}
+        self._by_time = []
+        self.stats = TaskStats()
+        self.search_index = TaskSearchIndex()
+        self._last_row = 0       # 快取內容涵蓋到工作表的第幾列
+        self._seq = None         # 本機資料庫模式：快取內容對應的資料庫序號
+        self._loaded_at = 0.0
+        self._full_synced_at = 0.0
+        self._lock = threading.RLock()
+        # 任務清單的版本號：任何新增或狀態變更都會加一，用來產生 ETag
+        self.version = 0
+
+    def _is_fresh(self):
+        if local_store is not None:
+            return self._tasks is not None and self._seq == local_store.current_seq()
+        return self._tasks is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    def is_fresh(self):
+        with self._lock:
+            return self._is_fresh()
+
+    def sync_plan(self):
+        """
+        決定下一次同步要讀取的範圍，回傳 (目前已知的列數, ranges)。
+        ranges 為 None 代表要用 get_all_values() 完整同步，否則以 batch_get(ranges) 增量同步。
+        """
+        with self._lock:
+            if (self._tasks is None
+                    or TASKS_SYNC_MODE != 'incremental'
+                    or time.monotonic() - self._full_synced_at >= TASKS_FULL_SYNC_INTERVAL):
+                return self._last_row, None
+            known = self._last_row
+            ranges = [f"A{known + 1}:H"]
+            if known >= 2:
+                # 狀態、受理編號與完成時間欄：編號對不上代表工作表有列被插入或刪除
+                ranges.insert(0, f"F2:H{known}")
+            return known, ranges
+
+    def apply_sync(self, known, ranges, values):
+        """套用 sync_plan() 所規劃範圍的讀取結果。"""
+        with self._lock, TASKS_STAGE_SECONDS.time("parse"):
+            if ranges is None:
+                self._full_sync(values)
+            elif known == self._last_row:
+                if not self._incremental_sync(known, values):
+                    # 列號已經移動，既有的列號索引不可信，改做完整同步
+                    self.invalidate()
+                    return
+            else:
+                # 讀取期間已有其他資料寫入快取，這次結果可能重疊，留待下次重新同步
+                return
+            self._loaded_at = time.monotonic()
+
+    def _ensure_fresh(self):
+        """快取過期時從 Google Sheets 同步 (呼叫前須持有 self._lock)。"""
+        if self._is_fresh():
+            CACHE_REQUESTS.inc("task_cache", "hit")
+            return
+        CACHE_REQUESTS.inc("task_cache", "miss")
+        if local_store is not None:
+            self._sync_local()
+            return
+        # 增量同步發現列號移動時，接著做一次完整同步
+        for _ in range(2):
+            known, ranges = self.sync_plan()
+            with TASKS_STAGE_SECONDS.time("fetch"):
+                values = sheet.get_all_values() if ranges is None else sheet.batch_get(ranges)
+            self.apply_sync(known, ranges, values)
+            if self._is_fresh():
+                return
+
+    def _sync_local(self):
+        """
+        從本機資料庫同步 (呼叫前須持有 self._lock)：第一次完整載入，之後只套用序號大於上次同步的新增與修改。
+        """
+        if self._tasks is None or self._seq is None:
+            with TASKS_STAGE_SECONDS.time("fetch"):
+                seq, all_data = local_store.snapshot()
+            with TASKS_STAGE_SECONDS.time("parse"):
+                self._full_sync(all_data, version=seq)
+        else:
+            with TASKS_STAGE_SECONDS.time("fetch"):
+                seq, changes = local_store.changes_since(self._seq)
+            with TASKS_STAGE_SECONDS.time("parse"):
+                for row_index, row, row_seq in changes:
+                    # 讓這筆變更的事件編號等於它在資料庫中的序號
+                    self.version = row_seq - 1
+                    if row_index in self._by_row:
+                        self._patch_status(row_index, row[STATUS_COLUMN_INDEX - 1],
+                                           row[COMPLETED_AT_COLUMN_INDEX - 1])
+                    else:
+                        self._append_task(parse_task_row(row_index, row))
+                        self._last_row = max(self._last_row, row_index)
+        self.version = seq
+        self._seq = seq
+
+    def current_version(self, refresh=True):
+        """回傳目前的版本號；refresh 為 True 時，快取過期會先同步。"""
+        with self._lock:
+            if refresh:
+                self._ensure_fresh()
+            return self.version
+
+    def rows_for_ids(self, task_ids, refresh=True, force=False):
+        """
+        以受理編號查詢目前的列號，回傳 {受理編號: 列號}；找不到的編號不列入。
+        force 為 True 時即使快取未過期也先同步一次 (例如編號是其他行程剛寫入的)。
+        """
+        with self._lock:
+            if force:
+                self.expire()
+            if refresh or force:
+                self._ensure_fresh()
+            return {task_id: self._by_id[task_id] for task_id in task_ids if task_id in self._by_id}
+
+    def get_tasks(self):
+        """回傳完整的任務清單 (依工作表列號排序)。"""
+        with self._lock:
+            self._ensure_fresh()
+            return list(self._tasks)
+
+    def query(self, filters=None, since=None, until=None, sort="row", cursor=None, limit=None, refresh=True):
+        """
+        以索引篩選任務後排序、分頁。
+
+        filters 為 {欄位: [可接受的值, ...]}，欄位限 INDEXED_TASK_FIELDS；
+        since / until 為時間戳記字串 (含兩端)；cursor 為上一頁回傳的 nextCursor。
+        回傳 (本頁任務, 下一頁 cursor 或 None, 符合條件的總筆數, 版本號)。
+        refresh 為 False 時直接使用現有快取 (由呼叫端負責事先同步)。
+        """
+        with self._lock:
+            if refresh:
+                self._ensure_fresh()
+            version = self.version
+            rows = self._matching_rows(filters, since, until)
+            if rows is None:
+                tasks = list(self._tasks)
+            else:
+                tasks = [self._tasks[self._by_row[row_index]] for row_index in rows]
+
+        sort_key = TASK_SORT_KEYS[sort]
+        descending = sort == "newest"
+        tasks.sort(key=sort_key, reverse=descending)
+        total = len(tasks)
+        if cursor is not None:
+            if descending:
+                tasks = [t for t in tasks if sort_key(t) < cursor]
+            else:
+                tasks = [t for t in tasks if sort_key(t) > cursor]
+        if limit and len(tasks) > limit:
+            tasks = tasks[:limit]
+            return tasks, encode_cursor(sort, sort_key(tasks[-1])), total, version
+        return tasks, None, total, version
+
+    def _matching_rows(self, filters, since, until):
+        """以索引找出符合篩選條件與時間區間的列號集合；沒有任何條件時回傳 None (需持有 self._lock)。"""
+        rows = None
+        for field, values in (filters or {}).items():
+            index = self._index[field]
+            matched = set().union(*(index.get(v, ()) for v in values))
+            rows = matched if rows is None else rows & matched
+        if since or until:
+            lo = bisect.bisect_left(self._by_time, (since,)) if since else 0
+            hi = bisect.bisect_right(self._by_time, (until, float("inf"))) if until else len(self._by_time)
+            matched = {row_index for _, row_index in self._by_time[lo:hi]}
+            rows = matched if rows is None else rows & matched
+        return rows
+
+    def search(self, text, filters=None, since=None, until=None, cursor=None, limit=None, refresh=True):
+        """
+        以倒排索引搜尋設備位置與問題描述，依分數由高到低 (同分時較新的在前) 排序、分頁。
+        filters、since、until 與 query() 相同；
+        回傳 (本頁任務 (含 score), 下一頁 cursor 或 None, 符合條件的總筆數, 版本號)。
+        """
+        with self._lock:
+            if refresh:
+                self._ensure_fresh()
+            version = self.version
+            scores = self.search_index.search(text)
+            rows = self._matching_rows(filters, since, until)
+            if rows is not None:
+                scores = {row_index: score for row_index, score in scores.items() if row_index in rows}
+            total = len(scores)
+            # 依 (分數, 列號) 由大到小；只取出這一頁需要的筆數，不必排序全部結果
+            items = scores.items()
+            if cursor is not None:
+                last = tuple(cursor)
+                items = [(row_index, score) for row_index, score in items if (score, row_index) < last]
+            by_rank = operator.itemgetter(1, 0)
+            ranked = heapq.nlargest(limit + 1, items, key=by_rank) if limit else sorted(items, key=by_rank, reverse=True)
+            page = ranked[:limit] if limit else ranked
+            tasks = [dict(self._tasks[self._by_row[row_index]], score=score) for row_index, score in page]
+        next_cursor = encode_cursor("search", [page[-1][1], page[-1][0]]) if limit and len(ranked) > limit else None
+        return tasks, next_cursor, total, version
+
+    def _full_sync(self, all_data, version=None):
+        """以整張工作表的內容重建快取；version 為新內容的版本號，預設由內容是否改變決定。"""
+        old_tasks, old_version = self._tasks, self.version
+        self._set_tasks(parse_task_rows(all_data))
+        if version is None:
+            # 內容與原本相同時不更動版本號，讓前端的 ETag 繼續有效
+            version = old_version if old_tasks == self._tasks else old_version + 1
+        self.version = version
+        if old_tasks is not None and self.version != old_version:
+            # 無法得知確切變動了哪些任務，請前端重新載入
+            task_events.publish(self.version, "resync", {"version": self.version})
+        self._last_row = len(all_data)
+        self._full_synced_at = time.monotonic()
+
+    def _incremental_sync(self, known, results):
+        """
+        套用上次同步後新增的資料列，以及既有資料列的狀態欄。
+        既有資料列的受理編號與快取不一致 (工作表有列被插入、刪除或重新排序) 時不做任何修改，回傳 False。
+        """
+        new_rows = results[-1]
+
+        if known >= 2:
+            # 結尾的空白儲存格不會出現在回傳結果中，視為空字串
+            cells = [(list(cell) + ["", "", ""])[:3] for cell in results[0]]
+            cells.extend(["", "", ""] for _ in range(known - 1 - len(cells)))
+            for row_index, (_, task_id, _) in enumerate(cells, start=2):
+                i = self._by_row.get(row_index)
+                if (self._tasks[i]["id"] if i is not None else "") != task_id:
+                    return False
+            for row_index, (status, _, completed_at) in enumerate(cells, start=2):
+                self._patch_status(row_index, status, completed_at)
+
+        for i, row in enumerate(new_rows, start=known + 1):
+            # 範圍讀取不會補齊欄位，補成與 get_all_values() 相同的欄數
+            self._append_task(parse_task_row(i, list(row) + [""] * (SHEET_COLUMN_COUNT - len(row))))
+        self._last_row = known + len(new_rows)
+        return True
+
+    def _set_tasks(self, tasks):
+        self._tasks = []
+        self._by_row = {}
+        self._by_id = {}
+        self._index = {field: collections.defaultdict(set) for field in INDEXED_TASK_FIELDS}
+        self._by_time = []       # 依 (時間戳記, 列號) 排序，用於日期區間查詢
+        self.stats = TaskStats()
+        self.search_index = TaskSearchIndex()
+        for task in tasks:
+            self._append_task(task, notify=False)
+
+    def _append_task(self, task, notify=True):
+        if task:
+            row_index = task["rowIndex"]
+            self._by_row[row_index] = len(self._tasks)
+            if task["id"]:
+                self._by_id[task["id"]] = row_index
+            self._tasks.append(task)
+            self.version += 1
+            if notify:
+                task_events.publish(self.version, "task_added", task)
+            for field in INDEXED_TASK_FIELDS:
+                self._index[field][task[field]].add(row_index)
+            # 新資料通常時間最晚，insort 幾乎都是直接加在尾端
+            bisect.insort(self._by_time, (task["timestamp"], row_index))
+            self.stats.add(task)
+            self.search_index.add(task)
+
+    def _patch_status(self, row_index, new_status, completed_at=None):
+        """更新狀態；completed_at 為 None 時保留原本的完成時間。"""
+        i = self._by_row.get(row_index)
+        if i is None:
+            return
+        old_task = self._tasks[i]
+        if completed_at is None:
+            completed_at = old_task["completedAt"]
+        if old_task["status"] == new_status and old_task["completedAt"] == completed_at:
+            return
+        # 換成新的 dict，避免其他執行緒正在序列化舊的物件
+        self._tasks[i] = dict(old_task, status=new_status, completedAt=completed_at)
+        self._index["status"][old_task["status"]].discard(row_index)
+        self._index["status"][new_status].add(row_index)
+        self.stats.remove(old_task)
+        self.stats.add(self._tasks[i])
+        self.version += 1
+        task_events.publish(self.version, "status_changed", self._tasks[i])
+
+    def expire(self):
+        """讓下一次讀取重新同步 (增量模式下仍只讀取新增列與狀態欄)。"""
+        with self._lock:
+            self._loaded_at = float("-inf")
+
+    def invalidate(self):
+        """讓下一次讀取做完整同步 (保留舊資料以便比對版本)。"""
+        with self._lock:
+            self._loaded_at = float("-inf")
+            self._full_synced_at = float("-inf")
+            self._seq = None
+
+    def add_rows(self, first_row, rows):
+        """寫入佇列成功附加資料後呼叫，把新資料列補進快取。"""
+        with self._lock:
+            if self._tasks is None:
+                return
+            if local_store is not None:
+                # 列號由資料庫決定；直接讀取資料庫的變更，一併取得其他 worker 同時寫入的資料
+                self._sync_local()
+                return
+            # 無法確定列號，或工作表在這段期間被其他人改動過，直接讓快取失效
+            if first_row is None or first_row != self._last_row + 1:
+                self.invalidate()
+                return
+            for i, row in enumerate(rows, start=first_row):
+                self._append_task(parse_task_row(i, row))
+            self._last_row = first_row + len(rows) - 1
+
+    def update_status(self, row_index, new_status, completed_at=None):
+        """狀態更新成功後呼叫，修補快取中對應的任務。"""
+        with self._lock:
+            if self._tasks is None:
+                return
+            if local_store is not None:
+                self._sync_local()
+            else:
+                self._patch_status(row_index, new_status, completed_at)
+
+    def completed_at(self, row_indexes):
+        """回傳快取中這些列目前的完成時間 {列號: 完成時間}；未完成或不在快取中的列不列入。"""
+        with self._lock:
+            result = {}
+            for row_index in row_indexes:
+                i = self._by_row.get(row_index)
+                if i is not None and self._tasks[i]["completedAt"]:
+                    result[row_index] = self._tasks[i]["completedAt"]
+            return result
+
+    def stats_snapshot(self, refresh=True):
+        """回傳 (統計結果, 版本號)；只讀取已維護好的彙總，與資料筆數無關。"""
+        with self._lock:
+            if refresh:
+                self._ensure_fresh()
+            return self.stats.snapshot(), self.version
+
+
+task_cache = TaskCache(TASKS_CACHE_TTL)
+
+# ----------------------------------------------------
+# /get_tasks 回應快取與壓縮
+# 同一版本、同一組查詢參數的回應內容不會改變，序列化與壓縮後的結果可以直接重用。
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))  # 小於此大小 (bytes) 不壓縮
+RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', 64))
+
+try:
+    import brotli  # 選用套件；沒有安裝時只提供 gzip
+except ImportError:
+    brotli = None
+
+
+def compress_body(body, encoding):
+    """以指定的編碼壓縮回應內容。"""
+    if encoding == 'br':
+        return brotli.compress(body)
+    return gzip.compress(body, compresslevel=6)
+
+
+class TaskResponseCache:
+    """
+    依版本號保存 /get_tasks 已序列化 (與壓縮) 的回應內容。
+
+    版本號改變時整個快取清空，因此不需要個別失效。
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._version = None
+        self._entries = collections.OrderedDict()  # (查詢字串, 前端接受的編碼) -> (內容, 實際使用的編碼)
+        self._lock = threading.Lock()
+
+    def get(self, version, query, encoding):
+        with self._lock:
+            if version != self._version:
+                return None
+            entry = self._entries.get((query, encoding))
+            if entry is not None:
+                self._entries.move_to_end((query, encoding))
+            return entry
+
+    def put(self, version, query, encoding, entry):
+        with self._lock:
+            if version != self._version:
+                # 只保留最新版本；較舊版本的結果直接捨棄
+                if self._version is not None and version < self._version:
+                    return
+                self._version = version
+                self._entries.clear()
+            self._entries[(query, encoding)] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+task_responses = TaskResponseCache(RESPONSE_CACHE_SIZE)
+
+
+# 工作表模式下版本號在每次啟動時從 0 開始 (每個 worker 也各自計算)，
+# ETag 加上每次啟動都不同的 epoch，重新部署後才不會把舊版本的回應誤判為 304
+TASKS_ETAG_EPOCH = uuid.uuid4().hex[:8]
+
+
+def task_etag(version, query):
+    """同一版本、同一組查詢參數共用一個 ETag；本機資料庫模式下 epoch 跟著資料庫，所有 worker 一致。"""
+    epoch = local_store.epoch if local_store is not None else TASKS_ETAG_EPOCH
+    return f"{epoch}-v{version}-{hashlib.md5(query).hexdigest()[:8]}"
+
+
+def parse_task_query(args, cursor_sort=None):
+    """
+    解析 /get_tasks 的查詢參數 (args 需提供 get()，例如 request.args)，
+    回傳可直接傳給 TaskCache.query() 的參數 dict；參數無效時丟出 ValueError。
+    cursor_sort 為 cursor 應有的排序方式，預設與 sort 參數相同 (/search 傳入 "search")。
+    """
+    filters = {}
+    for field in INDEXED_TASK_FIELDS:
+        if args.get(field):
+            filters[field] = [v for v in args.get(field).split(',') if v]
+    since = args.get('since') or None
+    until = args.get('until') or None
+    # 只給日期時，包含當天整天
+    if until and len(until) == 10:
+        until += " 23:59:59"
+    sort = args.get('sort') or 'row'
+    if sort not in TASK_SORT_KEYS:
+        raise ValueError(f"不支援的排序方式：{sort}")
+    limit = int(args.get('limit')) if args.get('limit') else None
+    if limit is not None and not 1 <= limit <= MAX_TASKS_PAGE_SIZE:
+        raise ValueError(f"limit 必須介於 1 到 {MAX_TASKS_PAGE_SIZE} 之間")
+    cursor = decode_cursor(args.get('cursor'), cursor_sort or sort) if args.get('cursor') else None
+    return {"filters": filters, "since": since, "until": until, "sort": sort, "cursor": cursor, "limit": limit}
+
+
+def render_tasks(query, params, accept_encoding, if_none_match, refresh=True):
+    """
+    產生 /get_tasks 的回應，回傳 (狀態碼, 內容, 標頭)。
+
+    版本沒變就直接回 304，不需要查詢、序列化或讀取 Sheets；
+    refresh 為 False 時不在這裡同步工作表 (ASGI 模式會事先以非同步方式同步)。
+    """
+    version = task_cache.current_version(refresh)
+    if parse_etags(if_none_match).contains_weak(task_etag(version, query)):
+        CACHE_REQUESTS.inc("etag", "hit")
+        return 304, b'', {'ETag': quote_etag(task_etag(version, query), weak=True), 'Cache-Control': 'no-cache'}
+
+    accepted = parse_accept_header(accept_encoding).best_match(['br', 'gzip'] if brotli else ['gzip'])
+    cached = task_responses.get(version, query, accepted)
+    if cached:
+        CACHE_REQUESTS.inc("response_cache", "hit")
+        body, encoding = cached
+    else:
+        CACHE_REQUESTS.inc("response_cache", "miss")
+        with TASKS_STAGE_SECONDS.time("query"):
+            # 上面取得版本號時已經同步過，這裡不再檢查快取是否過期
+            tasks_list, next_cursor, total, version = task_cache.query(refresh=False, **params)
+        with TASKS_STAGE_SECONDS.time("encode"):
+            body = app.json.dumps({
+                "status": "success", "version": version, "tasks": tasks_list,
+                "total": total, "nextCursor": next_cursor,
+            }).encode('utf-8')
+        encoding = accepted if accepted and len(body) >= COMPRESS_MIN_SIZE else None
+        if encoding:
+            with TASKS_STAGE_SECONDS.time("compress"):
+                body = compress_body(body, encoding)
+        task_responses.put(version, query, accepted, (body, encoding))
+
+    headers = {
+        'ETag': quote_etag(task_etag(version, query), weak=True),
+        'Vary': 'Accept-Encoding',
+        'Cache-Control': 'no-cache',
+    }
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    return 200, body, headers
+
+# ----------------------------------------------------
+# 報修寫入佇列 (write-behind)
+# 每筆報修不再直接呼叫 append_row，而是先放進佇列，由背景執行緒
+# 累積到一定筆數或時間後，以一次 append_rows 寫入，降低 Sheets 寫入配額的消耗。
+WRITE_BATCH_SIZE = int(os.environ.get('WRITE_BATCH_SIZE', 20))           # 累積幾筆就立即寫入
+WRITE_MAX_BATCH_ROWS = int(os.environ.get('WRITE_MAX_BATCH_ROWS', 200))  # 一次 append_rows 最多寫入幾筆
+WRITE_FLUSH_INTERVAL = float(os.environ.get('WRITE_FLUSH_INTERVAL', 2))  # 最久等待幾秒就寫入
+WRITE_RETRY_MAX_DELAY = float(os.environ.get('WRITE_RETRY_MAX_DELAY', 60))  # 重試等待的上限 (秒)
+# 被 Sheets 以 400 拒絕 (資料本身無效，重試也不會成功) 的報修移到這個檔案，不阻擋後面的報修寫入
+WRITE_DEAD_LETTER_PATH = os.environ.get(
+    'WRITE_DEAD_LETTER_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'write_dead_letter.jsonl'))
+
+
+def new_ticket_id():
+    """產生回傳給前端的受理編號。"""
+    return uuid.uuid4().hex[:12]
+
+
+class ReportWriteQueue:
+    """
+    依序收集待寫入的報修資料列，由單一背景執行緒批次寫入 Google Sheets。
+
+    佇列中的資料只有在確認寫入成功後才會移除，因此寫入失敗時會保留原順序重試；
+    重試前會先比對工作表末端，若上一次其實已經寫入 (例如回應逾時)，就不再重複寫入。
+    被 Sheets 判定為無效資料 (400) 的那一批改為逐筆寫入，找出無效的報修移到 WRITE_DEAD_LETTER_PATH，
+    其餘照常寫入。
+    """
+
+    def __init__(self, batch_size, flush_interval, max_batch_rows=WRITE_MAX_BATCH_ROWS):
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        # 佇列中累積超過 batch_size 筆時 (例如批次匯入)，一次最多寫入 max_batch_rows 筆
+        self.max_batch_rows = max(self.batch_size, max_batch_rows)
+        self._pending = collections.deque()  # 元素為 (ticket, row, 排入時間)
+        self._inflight = set()               # 正在寫入的那一批的受理編號
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self.dead_lettered = 0               # 累計無法寫入、移到 WRITE_DEAD_LETTER_PATH 的筆數
+
+    def start(self):
+        """啟動背景寫入執行緒 (重複呼叫不會產生多個執行緒)。"""
+        with self._cond:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="report-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=10):
+        """要求背景執行緒把剩餘資料寫完後結束。"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def submit(self, ticket, row):
+        """把一筆資料列 (含受理編號) 排入佇列，立即回傳受理編號。"""
+        return self.submit_many([(ticket, row)])[0]
+
+    def submit_many(self, entries):
+        """把多筆 (受理編號, 資料列) 一次排入佇列，讓它們盡量在同一批寫入，回傳受理編號清單。"""
+        now = time.monotonic()
+        with self._cond:
+            self._pending.extend((ticket, row, now) for ticket, row in entries)
+            # 喚醒背景執行緒，讓它重新計算距離下次寫入還要等多久
+            self._cond.notify_all()
+        return [ticket for ticket, _ in entries]
+
+    def pending_count(self):
+        with self._cond:
+            return len(self._pending)
+
+    def pending_tickets(self):
+        """佇列中與正在寫入 (含剛寫入、任務快取還沒加入) 的受理編號。"""
+        with self._cond:
+            return {ticket for ticket, _, _ in self._pending} | self._inflight
+
+    def patch_pending(self, ticket, new_status):
+        """
+        修改仍在佇列中、尚未開始寫入的報修的狀態，回傳是否找到。
+        正在寫入的那一批不能修改，寫入完成後即可用列號更新。
+        """
+        with self._cond:
+            for entry_ticket, row, _ in self._pending:
+                if entry_ticket == ticket and ticket not in self._inflight:
+                    row[STATUS_COLUMN_INDEX - 1] = new_status
+                    # 未完成時不補上空白的 H 欄，與新報修的資料列相同 (Sheets 讀回時也不會有尾端的空白)
+                    completed_at = completion_time(new_status)
+                    row[COMPLETED_AT_COLUMN_INDEX - 1:] = [completed_at] if completed_at else []
+                    return True
+        return False
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive() and not self._stopping
+
+    def _next_batch(self):
+        """等待直到達到筆數或時間門檻，回傳佇列最前面的一批 (不移除)。"""
+        with self._cond:
+            while True:
+                if self._pending:
+                    waited = time.monotonic() - self._pending[0][2]
+                    if (len(self._pending) >= self.batch_size
+                            or waited >= self.flush_interval
+                            or self._stopping):
+                        return [self._pending[i] for i in range(min(self.max_batch_rows, len(self._pending)))]
+                    self._cond.wait(self.flush_interval - waited)
+                elif self._stopping:
+                    return None
+                else:
+                    self._cond.wait()
+
+    def _run(self):
+        mark_background_thread()
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            # 啟動後 Sheets 尚未連線時，先保留在佇列中
+            while sheet is None and not sheets_connected.wait(1):
+                pass
+            with self._cond:
+                self._inflight = {ticket for ticket, _, _ in batch}
+            first_row, rows = self._flush_with_retry(batch)
+            with self._cond:
+                for _ in batch:
+                    self._pending.popleft()
+            if rows:
+                task_cache.add_rows(first_row, rows)
+            with self._cond:
+                self._inflight = set()
+
+    def _flush_with_retry(self, batch):
+        """
+        寫入一批資料，失敗時以指數退避重試，直到確認寫入為止。
+        回傳 (第一筆在工作表中的列號 (無法得知或不連續時為 None), 實際寫入的資料列)。
+        """
+        rows = [row for _, row, _ in batch]
+        delay = 1
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                if attempt > 1:
+                    last_row = find_written_tail(rows)
+                    if last_row:
+                        logging.info(f"上一次寫入其實已成功，略過重試：{len(rows)} 筆")
+                        return last_row - len(rows) + 1, rows
+                result = sheet.append_rows(rows)
+                logging.info(f"批次寫入 {len(rows)} 筆報修資料：{[ticket for ticket, _, _ in batch]}")
+                return first_row_of_range(result.get('updates', {}).get('updatedRange', '')), rows
+            except Exception as e:
+                if sheets_error_status(e) == 400:
+                    return self._flush_one_by_one(batch, e)
+                logging.error(f"批次寫入 Google Sheets 失敗 (第 {attempt} 次)，{delay} 秒後重試: {e}")
+                time.sleep(delay)
+                delay = min(delay * 2, WRITE_RETRY_MAX_DELAY)
+
+    def _flush_one_by_one(self, batch, error):
+        """整批被判定為無效資料時逐筆寫入，把無效的報修移到 dead letter，回傳值與 _flush_with_retry() 相同。"""
+        if len(batch) == 1:
+            self._dead_letter(batch[0], error)
+            return None, []
+        logging.warning(f"批次寫入的資料被 Google Sheets 拒絕，改為逐筆寫入以找出無效的報修: {error}")
+        written = []
+        for entry in batch:
+            written.extend(self._flush_with_retry([entry])[1])
+        return None, written
+
+    def _dead_letter(self, entry, error):
+        ticket, row, _ = entry
+        self.dead_lettered += 1
+        logging.error(f"報修 {ticket} 被 Google Sheets 拒絕，無法寫入，已移到 {WRITE_DEAD_LETTER_PATH}: {error}，{row}")
+        try:
+            with open(WRITE_DEAD_LETTER_PATH, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({"ticket": ticket, "row": row, "error": str(error), "at": taiwan_timestamp()},
+                                   ensure_ascii=False) + "\n")
+        except OSError as e:
+            logging.error(f"無法寫入 {WRITE_DEAD_LETTER_PATH}: {e}")
+
+
+def find_written_tail(rows):
+    """
+    檢查工作表最後幾列是否就是這一批資料，是的話回傳最後一列的列號。
+    Sheets API 讀取時會省略每一列尾端的空白儲存格 (例如未完成報修的 H 欄)，比對前兩邊都補齊到 A～H 欄。
+    """
+    last_row = len(sheet.col_values(1))
+    if last_row < len(rows):
+        return None
+    tail = sheet.get(f"A{last_row - len(rows) + 1}:H{last_row}")
+
+    def normalize(values):
+        return [[str(v) for v in (list(r) + [""] * SHEET_COLUMN_COUNT)[:SHEET_COLUMN_COUNT]] for r in values]
+    if normalize(tail) == normalize(rows):
+        return last_row
+    return None
+
+
+def first_row_of_range(a1_range):
+    """從 A1 表示法 (例如 "'設備報修'!A5:G7") 取出起始列號。"""
+    match = re.search(r"![A-Z]+(\d+)", a1_range)
+    return int(match.group(1)) if match else None
+
+
+write_queue = ReportWriteQueue(WRITE_BATCH_SIZE, WRITE_FLUSH_INTERVAL, WRITE_MAX_BATCH_ROWS)
+
+# ----------------------------------------------------
+# 本機 SQLite 主要儲存 (選用)
+# STORAGE_MODE=sqlite 時，報修與狀態更新先寫入本機 SQLite (WAL 模式)，讀取也直接由 SQLite 提供；
+# 背景的同步執行緒再批次寫入「設備報修」工作表，並把在工作表上直接修改的內容同步回來。
+# 如此一來請求不必等待 Google 的回應，Sheets 暫時無法連線時系統也能繼續運作。
+STORAGE_MODE = os.environ.get('STORAGE_MODE', 'sheets')                  # sheets 或 sqlite
+SQLITE_PATH = os.environ.get('SQLITE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'reports.db'))
+REPLICATION_INTERVAL = float(os.environ.get('REPLICATION_INTERVAL', 5))   # 每隔幾秒把本機變更寫入工作表
+RECONCILE_INTERVAL = float(os.environ.get('RECONCILE_INTERVAL', 300))     # 每隔幾秒讀取工作表比對手動修改
+REPLICATION_BATCH_SIZE = int(os.environ.get('REPLICATION_BATCH_SIZE', 200))
+# 多個 worker (例如 gunicorn -w 4) 共用同一個 SQLITE_PATH 時，以檔案鎖選出唯一的 leader 連線 Google Sheets；
+# 其他 worker 只讀寫本機資料庫，每隔 LOCAL_STORE_POLL_INTERVAL 秒檢查其他 worker 的寫入並推送 SSE 事件
+LOCAL_STORE_POLL_INTERVAL = float(os.environ.get('LOCAL_STORE_POLL_INTERVAL', 1))
+LEADER_RETRY_INTERVAL = float(os.environ.get('LEADER_RETRY_INTERVAL', 5))   # 非 leader 每隔幾秒嘗試接手
+
+LOCAL_STORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    id INTEGER PRIMARY KEY,               -- 對外的列號 (rowIndex) 為 id + 1，與工作表的列號編排一致
+    ticket TEXT,
+    timestamp TEXT NOT NULL,
+    reporter_name TEXT NOT NULL,
+    device_location TEXT NOT NULL,
+    problem_description TEXT NOT NULL,
+    helper_teacher TEXT NOT NULL,
+    status TEXT NOT NULL,
+    completed_at TEXT,
+    sheet_row INTEGER,                    -- 在工作表中的列號；NULL 代表尚未寫入工作表，負數代表已不在工作表上
+    status_dirty INTEGER NOT NULL DEFAULT 0, -- 1 代表狀態已在本機修改、尚未寫入工作表
+    seq INTEGER NOT NULL DEFAULT 0        -- 最後一次新增或修改時的序號 (見 store_meta)
+);
+CREATE UNIQUE INDEX IF NOT EXISTS reports_sheet_row ON reports(sheet_row);
+CREATE INDEX IF NOT EXISTS reports_status_dirty ON reports(status_dirty) WHERE status_dirty = 1;
+-- seq：每新增或修改一筆報修就加一；多個 worker 以此得知其他 worker 是否寫入過，以及寫入了哪些列
+-- imported：是否已完成首次從工作表匯入 (1 為已匯入)
+-- epoch：建立資料庫時產生的亂數，放在 ETag 中；資料庫重建後序號從頭計算，舊的 ETag 也不會被誤認
+CREATE TABLE IF NOT EXISTS store_meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO store_meta (key, value) VALUES ('seq', 0);
+INSERT OR IGNORE INTO store_meta (key, value) VALUES ('imported', 0);
+INSERT OR IGNORE INTO store_meta (key, value) VALUES ('epoch', abs(random() % 4294967296));
+"""
+
+# 與工作表 A～H 欄的順序相同
+REPORT_COLUMNS = ("timestamp, reporter_name, device_location, problem_description, helper_teacher, status, ticket, "
+                  "completed_at")
+
+
+class LocalStore:
+    """
+    以 SQLite (WAL 模式) 保存報修資料的本機資料庫。
+
+    每個執行緒使用自己的連線；WAL 模式下讀取不會被寫入阻擋。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(LOCAL_STORE_SCHEMA)
+        # 舊版資料庫沒有完成時間欄與序號欄
+        columns = {column[1] for column in conn.execute("PRAGMA table_info(reports)")}
+        if "completed_at" not in columns:
+            conn.execute("ALTER TABLE reports ADD COLUMN completed_at TEXT")
+        if "seq" not in columns:
+            conn.execute("ALTER TABLE reports ADD COLUMN seq INTEGER NOT NULL DEFAULT 0")
+        conn.execute("CREATE INDEX IF NOT EXISTS reports_seq ON reports(seq)")
+        conn.execute("UPDATE store_meta SET value = 1 WHERE key = 'imported' AND EXISTS (SELECT 1 FROM reports)")
+        epoch, = conn.execute("SELECT value FROM store_meta WHERE key = 'epoch'").fetchone()
+        self.epoch = f"{epoch:08x}"
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # isolation_level=None：自行以 BEGIN / COMMIT 控制交易
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def is_imported(self):
+        return bool(self._conn().execute("SELECT value FROM store_meta WHERE key = 'imported'").fetchone()[0])
+
+    @staticmethod
+    def _reserve_seq(conn, count):
+        """在目前的交易中保留 count 個連續的序號，回傳第一個。"""
+        conn.execute("UPDATE store_meta SET value = value + ? WHERE key = 'seq'", (count,))
+        last, = conn.execute("SELECT value FROM store_meta WHERE key = 'seq'").fetchone()
+        return last - count + 1
+
+    def current_seq(self):
+        return self._conn().execute("SELECT value FROM store_meta WHERE key = 'seq'").fetchone()[0]
+
+    def snapshot(self):
+        """在同一個讀取交易中回傳 (目前的序號, get_all_values() 形式的完整資料)。"""
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            return self.current_seq(), self.get_all_values()
+        finally:
+            conn.execute("COMMIT")
+
+    def changes_since(self, seq):
+        """回傳 (目前的序號, 序號大於 seq 的 [(列號, row, 序號), ...])，依序號排序。"""
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            rows = conn.execute(
+                f"SELECT id, {REPORT_COLUMNS}, seq FROM reports WHERE seq > ? ORDER BY seq", (seq,)).fetchall()
+            return self.current_seq(), [
+                (report_id + 1, [value or "" for value in row[:-1]], row[-1]) for report_id, *row in rows]
+        finally:
+            conn.execute("COMMIT")
+
+    def import_sheet(self, all_data):
+        """
+        以工作表的完整內容 (get_all_values() 的結果) 建立初始資料，工作表第 r 列對應 id = r - 1。
+        已經匯入過 (例如由另一個 worker 完成) 時不做任何事。
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT value FROM store_meta WHERE key = 'imported'").fetchone()[0]:
+                conn.execute("ROLLBACK")
+                return
+            conn.execute("UPDATE store_meta SET value = 1 WHERE key = 'imported'")
+            seq = self._reserve_seq(conn, max(0, len(all_data) - 1))
+            for row_index, row in enumerate(all_data[1:], start=2):
+                row = (list(row) + [""] * SHEET_COLUMN_COUNT)[:SHEET_COLUMN_COUNT]
+                conn.execute(
+                    f"INSERT INTO reports (id, {REPORT_COLUMNS}, sheet_row, seq) "
+                    f"VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (row_index - 1, *row, row_index, seq + row_index - 2))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def insert_reports(self, rows):
+        """在同一個交易中新增多筆報修 (row 的 G 欄為受理編號)，回傳第一筆的列號；各筆的列號連續。"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            first_row = None
+            seq = self._reserve_seq(conn, len(rows))
+            for offset, row in enumerate(rows):
+                cur = conn.execute(f"INSERT INTO reports ({REPORT_COLUMNS}, seq) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                   (*(list(row) + [""] * SHEET_COLUMN_COUNT)[:SHEET_COLUMN_COUNT], seq + offset))
+                first_row = first_row or cur.lastrowid + 1
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return first_row
+
+    def update_statuses(self, updates, completed_at):
+        """
+        更新多筆狀態 ({列號: 新狀態}) 與完成時間 ({列號: 完成時間})；
+        任何一列不存在時全部不更新，並丟出 LookupError。
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            seq = self._reserve_seq(conn, len(updates))
+            for offset, (row_index, new_status) in enumerate(updates.items()):
+                cur = conn.execute(
+                    "UPDATE reports SET status = ?, completed_at = ?, status_dirty = 1, seq = ? WHERE id = ?",
+                    (new_status, completed_at[row_index], seq + offset, row_index - 1))
+                if cur.rowcount == 0:
+                    raise LookupError(f"找不到第 {row_index} 列的報修記錄")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def get_all_values(self):
+        """回傳與 get_all_values() 相同形式的資料：第一列為標題，之後第 i 個位置是 id 為 i 的報修。"""
+        rows = self._conn().execute(f"SELECT id, {REPORT_COLUMNS} FROM reports ORDER BY id").fetchall()
+        all_data = [["時間戳記", "報修人", "設備位置", "問題描述", "協辦老師", "狀態", "受理編號", "完成時間"]]
+        for report_id, *row in rows:
+            # id 有缺號時以空列補位，讓列號維持 id + 1
+            all_data.extend([] for _ in range(report_id - len(all_data)))
+            all_data.append([value or "" for value in row])
+        return all_data
+
+    def iter_rows(self, chunk_rows):
+        """依列號分批產生 [(列號, row), ...]，每批最多 chunk_rows 筆，不會一次載入整個資料表。"""
+        last_id = 0
+        while True:
+            rows = self._conn().execute(
+                f"SELECT id, {REPORT_COLUMNS} FROM reports WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, chunk_rows)).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield [(report_id + 1, [value or "" for value in row]) for report_id, *row in rows]
+
+    def unreplicated_reports(self, limit):
+        """回傳尚未寫入工作表的報修 [(id, row), ...]，依 id 排序。"""
+        rows = self._conn().execute(
+            f"SELECT id, {REPORT_COLUMNS} FROM reports WHERE sheet_row IS NULL ORDER BY id LIMIT ?",
+            (limit,)).fetchall()
+        return [(report_id, [value or "" for value in row]) for report_id, *row in rows]
+
+    def mark_replicated(self, report_ids, first_sheet_row):
+        """
+        記下這批報修寫入工作表的列號，回傳原本記錄在這些列號上、因而被移開的報修筆數。
+        工作表有列被手動刪除或插入時，其他報修記錄的列號已經過時；先把它們標記為位置不明 (負數)，
+        再由 remap_sheet_rows() 依受理編號找回正確的列號。
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            displaced = 0
+            for offset, report_id in enumerate(report_ids):
+                sheet_row = first_sheet_row + offset
+                displaced += conn.execute("UPDATE reports SET sheet_row = -id WHERE sheet_row = ? AND id != ?",
+                                          (sheet_row, report_id)).rowcount
+                conn.execute("UPDATE reports SET sheet_row = ? WHERE id = ?", (sheet_row, report_id))
+            conn.execute("COMMIT")
+            return displaced
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def remap_sheet_rows(self, tickets, timestamps=None):
+        """
+        以工作表 G 欄目前的內容 (tickets[i] 為第 i + 1 列的受理編號) 重新對應各筆報修的列號，回傳有變更的筆數。
+        工作表上找不到受理編號的報修 (例如整列被手動刪除) 改標記為負數列號：不會被當成尚未寫入而重新附加，
+        也不會再寫入狀態。沒有受理編號的舊資料只在有提供 A 欄 (timestamps) 時檢查：時間戳記與所記錄的列對不上時，
+        改對應到唯一一列同樣沒有受理編號、時間戳記相同的列，找不到則同樣標記為負數列號。
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            moved = self._remap_sheet_rows(conn, tickets, timestamps)
+            conn.execute("COMMIT")
+            return moved
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _remap_sheet_rows(conn, tickets, timestamps=None):
+        rows_by_ticket = {ticket: sheet_row for sheet_row, ticket in enumerate(tickets[1:], start=2) if ticket}
+        rows_by_timestamp = collections.defaultdict(list)
+        for sheet_row, timestamp in enumerate((timestamps or [])[1:], start=2):
+            if not (tickets[sheet_row - 1] if sheet_row <= len(tickets) else ""):
+                rows_by_timestamp[timestamp].append(sheet_row)
+        moved = []
+        for report_id, ticket, timestamp, sheet_row in conn.execute(
+                "SELECT id, coalesce(ticket, ''), timestamp, sheet_row FROM reports "
+                "WHERE sheet_row IS NOT NULL").fetchall():
+            if ticket:
+                new_row = rows_by_ticket.get(ticket, -report_id)
+            elif timestamps is not None and (
+                    sheet_row <= 0 or sheet_row > len(timestamps) or timestamps[sheet_row - 1] != timestamp):
+                candidates = rows_by_timestamp.get(timestamp, [])
+                new_row = candidates[0] if len(candidates) == 1 else -report_id
+            else:
+                continue
+            if new_row != sheet_row:
+                moved.append((report_id, new_row))
+        # 先全部移開再重新指定，避免兩筆互換列號時違反唯一索引
+        conn.executemany("UPDATE reports SET sheet_row = -id WHERE id = ?", [(report_id,) for report_id, _ in moved])
+        for report_id, new_row in moved:
+            if new_row > 0:
+                # 目標列上若記錄著沒有受理編號的舊資料，它的列號同樣已經過時
+                conn.execute("UPDATE reports SET sheet_row = -id WHERE sheet_row = ?", (new_row,))
+                conn.execute("UPDATE reports SET sheet_row = ? WHERE id = ?", (new_row, report_id))
+        if moved:
+            logging.warning(f"工作表的列已被移動，已依受理編號重新對應 {len(moved)} 筆報修的列號")
+        return len(moved)
+
+    def dirty_statuses(self, limit):
+        """
+        回傳已在本機修改、尚未寫入工作表的狀態 [(id, 工作表列號, 狀態, 完成時間, 時間戳記, 受理編號), ...]；
+        不在工作表上的報修不列入。
+        """
+        return self._conn().execute(
+            "SELECT id, sheet_row, status, coalesce(completed_at, ''), timestamp, coalesce(ticket, '') FROM reports "
+            "WHERE status_dirty = 1 AND sheet_row > 0 ORDER BY id LIMIT ?", (limit,)).fetchall()
+
+    def clear_dirty(self, written):
+        """狀態寫入工作表後呼叫；寫入期間若又被修改，保留 dirty 標記等下次再寫。"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "UPDATE reports SET status_dirty = 0 WHERE id = ? AND status = ?",
+                [(report_id, status) for report_id, _, status, *_ in written])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def reconcile(self, all_data):
+        """
+        以工作表的完整內容比對本機資料：
+        工作表上被修改的狀態 (且本機沒有未寫入的修改) 寫回本機；工作表上直接新增的列匯入本機。
+        回傳 (狀態有變更的 [(列號, 狀態, 完成時間), ...], 新匯入的筆數)。
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # 先依受理編號修正被手動插入或刪除的列造成的列號偏移
+            self._remap_sheet_rows(
+                conn, [row[TICKET_COLUMN_INDEX - 1] if len(row) >= TICKET_COLUMN_INDEX else "" for row in all_data],
+                [row[0] if row else "" for row in all_data])
+            known = {
+                sheet_row: (report_id, status, completed_at or "", dirty, ticket)
+                for report_id, sheet_row, status, completed_at, dirty, ticket in conn.execute(
+                    "SELECT id, sheet_row, status, completed_at, status_dirty, ticket FROM reports "
+                    "WHERE sheet_row IS NOT NULL")
+            }
+            changed = []
+            imported = 0
+            for sheet_row, row in enumerate(all_data[1:], start=2):
+                row = (list(row) + [""] * SHEET_COLUMN_COUNT)[:SHEET_COLUMN_COUNT]
+                if sheet_row in known:
+                    report_id, status, completed_at, dirty, ticket = known[sheet_row]
+                    if ticket and row[6] != ticket:
+                        # 工作表上的列已經移動，這一列不是本機記錄的那筆報修，不覆寫狀態
+                        logging.warning(f"工作表第 {sheet_row} 列的受理編號與本機記錄 ({ticket}) 不符，略過同步")
+                        continue
+                    if not dirty and (row[5], row[7]) != (status, completed_at):
+                        conn.execute("UPDATE reports SET status = ?, completed_at = ?, seq = ? WHERE id = ?",
+                                     (row[5], row[7], self._reserve_seq(conn, 1), report_id))
+                        changed.append((report_id + 1, row[5], row[7]))
+                elif any(row):
+                    conn.execute(
+                        f"INSERT INTO reports ({REPORT_COLUMNS}, sheet_row, seq) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (*row, sheet_row, self._reserve_seq(conn, 1)))
+                    imported += 1
+            conn.execute("COMMIT")
+            return changed, imported
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+class SheetReplicator:
+    """
+    背景同步執行緒：把本機的新報修與狀態修改批次寫入工作表，並定期把工作表上的手動修改同步回本機。
+    """
+
+    def __init__(self, store, interval, reconcile_interval, batch_size):
+        self.store = store
+        self.interval = interval
+        self.reconcile_interval = reconcile_interval
+        self.batch_size = batch_size
+        self._stop = threading.Event()
+        self._thread = None
+        # 上一次 append_rows 失敗，結果不明；啟動時也視為不明，因為前一個 leader 可能在寫入途中結束
+        self._append_uncertain = True
+        self._reconciled_at = time.monotonic()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sheet-replicator", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        """停止前再同步一次，盡量把本機變更寫入工作表。"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self):
+        mark_background_thread()
+        while True:
+            stopping = self._stop.wait(self.interval)
+            if sheet:
+                try:
+                    self.replicate_once()
+                except Exception as e:
+                    logging.error(f"同步本機資料到 Google Sheets 時發生錯誤: {e}")
+            if stopping:
+                return
+
+    def replicate_once(self):
+        self._push_reports()
+        self._push_statuses()
+        if time.monotonic() - self._reconciled_at >= self.reconcile_interval:
+            self._reconcile()
+
+    def _push_reports(self):
+        while True:
+            pending = self.store.unreplicated_reports(self.batch_size)
+            if not pending:
+                return
+            report_ids = [report_id for report_id, _ in pending]
+            rows = [row for _, row in pending]
+            first_row = None
+            if self._append_uncertain:
+                # 上一次寫入可能其實已成功，先比對工作表末端，避免重複寫入
+                last_row = find_written_tail(rows)
+                if last_row:
+                    first_row = last_row - len(rows) + 1
+            if first_row is None:
+                self._append_uncertain = True
+                result = sheet.append_rows(rows)
+                first_row = first_row_of_range(result.get('updates', {}).get('updatedRange', ''))
+            if first_row is None:
+                # 無法得知寫入位置，交給下一次比對時處理
+                first_row = len(sheet.col_values(1)) - len(rows) + 1
+            if self.store.mark_replicated(report_ids, first_row):
+                # 有列號被佔用，代表工作表的列被手動刪除或插入過
+                self.store.remap_sheet_rows(sheet.col_values(TICKET_COLUMN_INDEX))
+            # 記錄好列號後才算寫入確定；在這之前失敗，下次仍先比對工作表末端
+            self._append_uncertain = False
+            logging.info(f"已同步 {len(rows)} 筆報修到 Google Sheets (第 {first_row} 列起)")
+
+    def _push_statuses(self):
+        while True:
+            dirty = self.store.dirty_statuses(self.batch_size)
+            if not dirty:
+                return
+            # 寫入前確認每一列仍是同一筆報修 (受理編號相同；沒有編號的舊資料比對時間戳記)，
+            # 工作表的列被手動移動過時先依受理編號重新對應，避免把狀態寫到別人的報修上
+            timestamps, tickets = sheet.batch_get(["A:A", "G:G"])
+            timestamps = [cell[0] if cell else "" for cell in timestamps]
+            tickets = [cell[0] if cell else "" for cell in tickets]
+            verified = [
+                item for item in dirty
+                if item[1] <= len(timestamps)
+                and (tickets[item[1] - 1] if item[1] <= len(tickets) else "") == item[5]
+                and (item[5] or timestamps[item[1] - 1] == item[4])
+            ]
+            if len(verified) < len(dirty):
+                moved = self.store.remap_sheet_rows(tickets, timestamps)
+                if not verified:
+                    if not moved:
+                        return
+                    # 重新對應後下一輪再寫；仍對不上的報修已標記為不在工作表上，不會再列入
+                    continue
+            sheet.batch_update(
+                status_cell_updates({sheet_row: status for _, sheet_row, status, *_ in verified},
+                                    {sheet_row: completed_at for _, sheet_row, _, completed_at, *_ in verified}))
+            self.store.clear_dirty(verified)
+            logging.info(f"已同步 {len(verified)} 筆狀態到 Google Sheets")
+
+    def _reconcile(self):
+        # 變更會取得新的序號，任務快取下次讀取時自然會套用，不必在這裡修補
+        changed, imported = self.store.reconcile(sheet.get_all_values())
+        self._reconciled_at = time.monotonic()
+        if changed or imported:
+            logging.info(f"已從工作表同步 {len(changed)} 筆狀態修改、匯入 {imported} 筆新資料")
+
+
+local_store = None
+replicator = None
+
+
+pending_local_store = None  # 等待首次匯入完成才能開放讀寫的本機資料庫
+_local_store_lock = threading.Lock()
+
+
+def initialize_local_store():
+    """
+    STORAGE_MODE=sqlite 時開啟本機資料庫。
+    資料庫還沒匯入過就要先從工作表匯入既有資料：由 leader 在 Sheets 連線後完成，其他 worker 等待匯入完成；
+    在那之前不開放讀寫，以免新資料的列號與匯入的資料衝突。
+    """
+    global pending_local_store
+    store = LocalStore(SQLITE_PATH)
+    if not store.is_imported() and sheet is None:
+        pending_local_store = store
+        logging.info("本機 SQLite 尚未匯入資料，等待 Google Sheets 連線後匯入既有資料。")
+        return
+    open_local_store(store)
+
+
+def open_local_store(store):
+    global local_store, pending_local_store
+    with _local_store_lock:
+        if local_store is not None:
+            return
+        if not store.is_imported():
+            if sheet is None:
+                return
+            store.import_sheet(sheet.get_all_values())
+            logging.info("已從 Google Sheets 匯入既有資料到本機 SQLite。")
+        local_store = store
+        pending_local_store = None
+    if coordinator.is_leader():
+        start_replicator()
+
+
+def start_replicator():
+    """由 leader 啟動本機資料庫與工作表之間的背景同步 (只會啟動一次)。"""
+    global replicator
+    with _local_store_lock:
+        if replicator is not None or local_store is None:
+            return
+        replicator = SheetReplicator(local_store, REPLICATION_INTERVAL, RECONCILE_INTERVAL, REPLICATION_BATCH_SIZE)
+    replicator.start()
+    atexit.register(replicator.stop)
+
+
+class WorkerCoordinator:
+    """
+    多個 worker 共用本機資料庫時的協調者。
+
+    以 lock_path 的檔案鎖 (flock) 選出唯一的 leader：只有 leader 連線 Google Sheets、完成首次匯入並執行
+    背景同步，所以 worker 數量增加時 Sheets API 的用量不會跟著增加。leader 結束時檔案鎖隨之釋放，
+    其他 worker 在 retry_interval 秒內接手。每個 worker 也在背景輪詢資料庫序號，
+    讓其他 worker 寫入的資料即時出現在自己的任務快取與 SSE 事件中。
+    沒有 fcntl 的平台 (Windows) 無法協調，直接視為 leader，只能以單一 worker 執行。
+    """
+
+    def __init__(self, lock_path, poll_interval, retry_interval):
+        self.lock_path = lock_path
+        self.poll_interval = poll_interval
+        self.retry_interval = retry_interval
+        self._lock_file = None
+        self._leader = threading.Event()
+        self._on_elected = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def is_leader(self):
+        return self._leader.is_set()
+
+    def role(self):
+        return "leader" if self.is_leader() else "follower"
+
+    def start(self, on_elected):
+        """嘗試成為 leader，並啟動背景執行緒；on_elected 在成為 leader 時呼叫一次。"""
+        self._on_elected = on_elected
+        self._try_elect()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="worker-coordinator", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _try_elect(self):
+        if self.is_leader():
+            return
+        if fcntl is not None:
+            lock_file = open(self.lock_path, 'a')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return
+            # 保持檔案開啟，行程結束時作業系統會釋放鎖
+            self._lock_file = lock_file
+        self._leader.set()
+        logging.info(f"worker {os.getpid()} 成為 leader，負責連線 Google Sheets 與同步本機資料庫。")
+        self._on_elected()
+
+    def _run(self):
+        elect_at = time.monotonic() + self.retry_interval
+        while not self._stop.wait(self.poll_interval):
+            try:
+                if time.monotonic() >= elect_at:
+                    self._try_elect()
+                    elect_at = time.monotonic() + self.retry_interval
+                if pending_local_store is not None:
+                    # 等待中的首次匯入可能已由 leader 完成
+                    open_local_store(pending_local_store)
+                if local_store is not None:
+                    task_cache.current_version()
+            except Exception as e:
+                logging.error(f"同步其他 worker 的變更時發生錯誤: {e}")
+
+
+coordinator = WorkerCoordinator(SQLITE_PATH + ".leader", LOCAL_STORE_POLL_INTERVAL, LEADER_RETRY_INTERVAL)
+
+
+def become_leader():
+    """成為 leader 後才連線 Google Sheets；本機資料庫已開啟時接手背景同步。"""
+    start_replicator()
+    sheets_connector.start()
+    atexit.register(sheets_connector.stop)
+
+
+def storage_ready():
+    """是否能處理讀寫請求 (本機資料庫模式下不需要 Sheets 連線)。"""
+    return local_store is not None or sheet is not None
+
+
+def accepting_reports():
+    """是否能受理新的報修：寫入佇列模式下，Sheets 連線前的報修會先保留在佇列中。"""
+    return local_store is not None or (STORAGE_MODE != 'sqlite' and write_queue.is_running())
+
+
+def store_report(row, ticket=None):
+    """保存一筆報修，回傳受理編號。"""
+    return store_reports([row], [ticket or new_ticket_id()])[0]
+
+
+def store_reports(rows, tickets):
+    """一次保存多筆報修 (tickets 為各筆的受理編號)，回傳受理編號清單。"""
+    # 受理編號寫在 G 欄，之後以編號 (而非會移動的列號) 找到這筆報修
+    rows = [list(row) + [ticket] for row, ticket in zip(rows, tickets)]
+    if local_store:
+        task_cache.add_rows(local_store.insert_reports(rows), rows)
+        return list(tickets)
+    # 排入寫入佇列，由背景執行緒批次附加到工作表的最後一行
+    return write_queue.submit_many(list(zip(tickets, rows)))
+
+
+def completion_time(new_status, previous=""):
+    """狀態改為「已完成」時的完成時間；已經完成的任務保留原本的時間，其他狀態清空。"""
+    if new_status != COMPLETED_STATUS:
+        return ""
+    return previous or taiwan_timestamp()
+
+
+def completion_times(updates):
+    """為狀態更新 ({列號: 新狀態}) 算出每一列的完成時間 {列號: 完成時間}。"""
+    previous = task_cache.completed_at(updates.keys())
+    return {rowIndex: completion_time(newStatus, previous.get(rowIndex, ""))
+            for rowIndex, newStatus in updates.items()}
+
+
+def status_cell_updates(updates, completed_at):
+    """
+    狀態 (F 欄) 與完成時間 (H 欄) 的 batch_update 資料；兩欄中間隔著受理編號，分開寫入。
+    以 RAW (batch_update 的預設) 寫入，與新增報修相同：USER_ENTERED 會把完成時間存成日期值，讀回時變成顯示格式。
+    """
+    data = []
+    for rowIndex, newStatus in updates.items():
+        data.append({"range": f"F{rowIndex}", "values": [[newStatus]]})
+        data.append({"range": f"H{rowIndex}", "values": [[completed_at[rowIndex]]]})
+    return data
+
+
+def store_statuses(updates):
+    """寫入狀態更新 ({列號: 新狀態}) 與完成時間，成功後修補任務快取。"""
+    completed_at = completion_times(updates)
+    if local_store:
+        local_store.update_statuses(updates, completed_at)
+    else:
+        sheet.batch_update(status_cell_updates(updates, completed_at))
+    for rowIndex, newStatus in updates.items():
+        task_cache.update_status(rowIndex, newStatus, completed_at[rowIndex])
+
+
+def resolve_status_updates(parsed, refresh=True):
+    """
+    把 parse_status_update() 的結果換成可以交給 store_statuses() 的 {列號: 新狀態}。
+
+    以受理編號指定的任務由任務快取的索引找到目前的列號，不需要另外讀取整張工作表；
+    還在寫入佇列中的報修直接修改佇列中的資料。
+    回傳 ({列號: 新狀態}, {第幾筆: 錯誤訊息}, {第幾筆: 錯誤訊息})：第二個是找不到的報修，
+    第三個是已受理但還在寫入工作表 (正在寫入的那一批，或其他 worker 的寫入佇列) 的報修，稍後重試即可。
+    """
+    task_ids = {task_id for task_id, _, _ in parsed if task_id}
+    rows = task_cache.rows_for_ids(task_ids, refresh=refresh) if task_ids else {}
+    queued = write_queue.pending_tickets() if local_store is None and task_ids else set()
+    missing = task_ids - rows.keys() - queued
+    if missing and refresh:
+        # 可能是其他行程剛寫入、快取還沒看到的報修
+        rows.update(task_cache.rows_for_ids(missing, force=True))
+
+    updates, errors, writing = {}, {}, {}
+    for i, (task_id, rowIndex, newStatus) in enumerate(parsed):
+        if task_id:
+            rowIndex = rows.get(task_id)
+            if rowIndex is None:
+                if task_id in queued:
+                    if not write_queue.patch_pending(task_id, newStatus):
+                        writing[i] = f"受理編號 {task_id} 的報修正在寫入工作表，請稍後再試"
+                elif local_store is None and submission_dedup is not None and submission_dedup.has_ticket(task_id):
+                    writing[i] = f"受理編號 {task_id} 的報修尚未寫入工作表，請稍後再試"
+                else:
+                    errors[i] = f"找不到受理編號 {task_id} 的報修記錄"
+                continue
+        updates[rowIndex] = newStatus
+    return updates, errors, writing
+
+# ----------------------------------------------------
+# 重複送出的報修
+# 連點送出按鈕，或手機在不穩定的校園 Wi-Fi 上自動重送，會產生內容相同的報修。
+# 每次送出都以冪等鍵 (Idempotency-Key 標頭、JSON 的 idempotencyKey，或由報修人、地點與描述算出的雜湊)
+# 在 IDEMPOTENCY_WINDOW 秒內去重：重複的送出直接回傳第一次的受理編號，不再寫入工作表。
+IDEMPOTENCY_WINDOW = float(os.environ.get('IDEMPOTENCY_WINDOW', 600))    # 0 表示停用
+IDEMPOTENCY_MAX_KEYS = int(os.environ.get('IDEMPOTENCY_MAX_KEYS', 10000))  # 最多記住幾個冪等鍵
+# 多個 worker 時設為同一個 SQLite 檔案，讓所有 worker 共用去重記錄；未設定時，本機資料庫模式直接使用
+# SQLITE_PATH，否則在 WEB_CONCURRENCY 大於 1 時自動使用與本程式同目錄的 idempotency.db
+IDEMPOTENCY_DB = os.environ.get('IDEMPOTENCY_DB') or (
+    SQLITE_PATH if STORAGE_MODE == 'sqlite'
+    else os.path.join(os.path.dirname(os.path.abspath(__file__)), 'idempotency.db')
+    if int(os.environ.get('WEB_CONCURRENCY', 1)) > 1 else '')
+
+SUBMISSION_DEDUP_SCHEMA = """
+CREATE TABLE IF NOT EXISTS submissions (
+    key TEXT PRIMARY KEY,
+    ticket TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS submissions_expires_at ON submissions(expires_at);
+CREATE INDEX IF NOT EXISTS submissions_ticket ON submissions(ticket);
+"""
+
+
+def submission_key(data, explicit_key=None):
+    """
+    回傳這次送出的冪等鍵：前端有提供就直接使用，否則以報修人、地點與描述 (忽略多餘空白) 的雜湊代替。
+    """
+    if explicit_key:
+        return "key:" + str(explicit_key)[:200]
+    fields = [" ".join(str(data.get(name, '')).split())
+              for name in ('reporterName', 'deviceLocation', 'problemDescription')]
+    return "hash:" + hashlib.sha256("\x1f".join(fields).encode('utf-8')).hexdigest()
+
+
+class SubmissionDedup:
+    """
+    記憶體內的冪等鍵記錄 (只在單一行程內有效)。
+
+    每個鍵保留 window 秒；所有鍵的保留時間相同，所以 OrderedDict 的插入順序就是到期順序，
+    過期與超過 max_keys 時都從最舊的一端移除。
+    """
+
+    def __init__(self, window, max_keys):
+        self.window = window
+        self.max_keys = max_keys
+        self._entries = collections.OrderedDict()  # 冪等鍵 -> (受理編號, 到期時間)
+        self._lock = threading.Lock()
+
+    def claim(self, key, ticket):
+        """鍵在保留期間內已出現過時回傳原本的受理編號；否則以 ticket 記下這個鍵並回傳 None。"""
+        now = time.time()
+        with self._lock:
+            while self._entries:
+                oldest = next(iter(self._entries.values()))
+                if oldest[1] > now:
+                    break
+                self._entries.popitem(last=False)
+            entry = self._entries.get(key)
+            if entry is not None:
+                return entry[0]
+            self._entries[key] = (ticket, now + self.window)
+            while len(self._entries) > self.max_keys:
+                self._entries.popitem(last=False)
+            return None
+
+    def release(self, key, ticket):
+        """保存報修失敗時移除剛記下的鍵，讓使用者可以重送。"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == ticket:
+                del self._entries[key]
+
+    def has_ticket(self, ticket):
+        """這個受理編號是否在保留期間內受理過 (只在找不到報修時使用，逐一比對即可)。"""
+        now = time.time()
+        with self._lock:
+            return any(entry == ticket and expires_at > now for entry, expires_at in self._entries.values())
+
+
+class SqliteSubmissionDedup:
+    """
+    以 SQLite 檔案保存的冪等鍵記錄，同一台主機上的多個 worker 共用。
+
+    以 INSERT OR IGNORE 搶先記下鍵，同時送達的重複請求只有一個會寫入。
+    """
+
+    # 每記下多少個鍵清理一次過期與超量的記錄
+    PURGE_EVERY = 100
+
+    def __init__(self, path, window, max_keys):
+        self.path = path
+        self.window = window
+        self.max_keys = max_keys
+        self._local = threading.local()
+        self._claims = 0
+        self._conn().executescript(SUBMISSION_DEDUP_SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def claim(self, key, ticket):
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM submissions WHERE key = ? AND expires_at <= ?", (key, now))
+            conn.execute("INSERT OR IGNORE INTO submissions (key, ticket, expires_at) VALUES (?, ?, ?)",
+                         (key, ticket, now + self.window))
+            original, = conn.execute("SELECT ticket FROM submissions WHERE key = ?", (key,)).fetchone()
+            self._claims += 1
+            if self._claims % self.PURGE_EVERY == 0:
+                conn.execute("DELETE FROM submissions WHERE expires_at <= ?", (now,))
+                conn.execute(
+                    "DELETE FROM submissions WHERE key IN "
+                    "(SELECT key FROM submissions ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_keys,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return original if original != ticket else None
+
+    def release(self, key, ticket):
+        self._conn().execute("DELETE FROM submissions WHERE key = ? AND ticket = ?", (key, ticket))
+
+    def has_ticket(self, ticket):
+        return self._conn().execute("SELECT 1 FROM submissions WHERE ticket = ? AND expires_at > ?",
+                                    (ticket, time.time())).fetchone() is not None
+
+
+if IDEMPOTENCY_WINDOW <= 0:
+    submission_dedup = None
+elif IDEMPOTENCY_DB:
+    submission_dedup = SqliteSubmissionDedup(IDEMPOTENCY_DB, IDEMPOTENCY_WINDOW, IDEMPOTENCY_MAX_KEYS)
+else:
+    submission_dedup = SubmissionDedup(IDEMPOTENCY_WINDOW, IDEMPOTENCY_MAX_KEYS)
+
+
+def store_report_once(row, key):
+    """
+    以冪等鍵去重後保存報修，回傳 (受理編號, 是否為重複送出)。
+    重複送出時回傳第一次的受理編號，不會再寫入工作表或本機資料庫。
+    """
+    return store_reports_once([row], [key])[0]
+
+
+def store_reports_once(rows, keys):
+    """
+    store_report_once() 的多筆版本：新的報修一次保存，回傳 [(受理編號, 是否為重複送出), ...]。
+    key 為 None 的報修不去重，一律保存。
+    """
+    tickets = [new_ticket_id() for _ in rows]
+    if submission_dedup is None:
+        return [(ticket, False) for ticket in store_reports(rows, tickets)]
+
+    results, claimed = [], []
+    for row, key, ticket in zip(rows, keys, tickets):
+        original = submission_dedup.claim(key, ticket) if key is not None else None
+        if original is not None:
+            CACHE_REQUESTS.inc("submit_dedup", "hit")
+            results.append((original, True))
+        else:
+            if key is not None:
+                CACHE_REQUESTS.inc("submit_dedup", "miss")
+            results.append((ticket, False))
+            claimed.append((row, key, ticket))
+    if not claimed:
+        return results
+    try:
+        store_reports([row for row, _, _ in claimed], [ticket for _, _, ticket in claimed])
+    except Exception:
+        for _, key, ticket in claimed:
+            if key is not None:
+                submission_dedup.release(key, ticket)
+        raise
+    return results
+
+
+# ----------------------------------------------------
+# 封存已完成的報修
+# 已完成且超過 ARCHIVE_AFTER_DAYS 天的報修，由背景工作分批搬到依學期命名的封存工作表
+# (或本機的 gzip 壓縮檔)，讓主工作表與任務快取只保留進行中與近期的報修。
+# 封存資料只在呼叫 /archive 時才讀取。
+# 封存會從主工作表刪除資料列，預設不啟用；需要時明確設定天數 (例如 90)
+ARCHIVE_AFTER_DAYS = float(os.environ.get('ARCHIVE_AFTER_DAYS', 0))       # 0 表示不封存
+ARCHIVE_INTERVAL = float(os.environ.get('ARCHIVE_INTERVAL', 3600))        # 每隔幾秒檢查一次
+ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', 200))       # 每一批搬移的筆數
+ARCHIVE_TARGET = os.environ.get('ARCHIVE_TARGET', 'sheet')                # sheet 或 file
+ARCHIVE_SHEET_PREFIX = os.environ.get('ARCHIVE_SHEET_PREFIX', '封存_')
+ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'archive'))
+ARCHIVE_COMPLETED_STATUS = COMPLETED_STATUS
+
+
+class SharedExclusiveLock:
+    """可多人同時共用、或由一人獨占的鎖；有人等待獨占時不再接受新的共用，避免獨占者一直等不到。"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._shared = 0
+        self._exclusive = False
+        self._waiting_exclusive = 0
+        # 每次獨占結束就加一：分段持有共用鎖的一方可以藉此得知兩段之間是否有人獨占過
+        self.generation = 0
+
+    def acquire_shared(self):
+        with self._cond:
+            while self._exclusive or self._waiting_exclusive:
+                self._cond.wait()
+            self._shared += 1
+
+    def release_shared(self):
+        with self._cond:
+            self._shared -= 1
+            if not self._shared:
+                self._cond.notify_all()
+
+    def acquire_exclusive(self):
+        with self._cond:
+            self._waiting_exclusive += 1
+            try:
+                while self._exclusive or self._shared:
+                    self._cond.wait()
+            finally:
+                self._waiting_exclusive -= 1
+            self._exclusive = True
+
+    def release_exclusive(self):
+        with self._cond:
+            self._exclusive = False
+            self.generation += 1
+            self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def shared(self):
+        self.acquire_shared()
+        try:
+            yield
+        finally:
+            self.release_shared()
+
+    @contextlib.contextmanager
+    def exclusive(self):
+        self.acquire_exclusive()
+        try:
+            yield
+        finally:
+            self.release_exclusive()
+
+
+# 以列號寫入狀態時共用持有；封存工作刪除列時獨占持有，確保查到的列號在寫入前不會移動
+sheet_rows_lock = SharedExclusiveLock()
+
+
+def semester_of(timestamp):
+    """
+    依時間戳記回傳學期，例如 "114-1"：8 月到隔年 1 月為上學期，2 月到 7 月為下學期 (民國學年度)。
+    無法解析時回傳 None。
+    """
+    try:
+        year, month = int(timestamp[0:4]), int(timestamp[5:7])
+    except (TypeError, ValueError):
+        return None
+    if not 1 <= month <= 12:
+        return None
+    academic_year = year - 1911 - (1 if month < 8 else 0)
+    return f"{academic_year}-{1 if month >= 8 or month == 1 else 2}"
+
+
+def archive_cutoff():
+    """早於此時間戳記 (字串比較) 的已完成報修會被封存。"""
+    # 工作表的時間戳記是台灣時間
+    cutoff = taiwan_now() - datetime.timedelta(days=ARCHIVE_AFTER_DAYS)
+    return cutoff.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def row_ranges(row_indexes):
+    """把列號合併成連續區間 [(起, 迄), ...]，由大到小排列 (由下往上刪除時列號不會互相影響)。"""
+    ranges = []
+    for row_index in sorted(row_indexes, reverse=True):
+        if ranges and ranges[-1][0] == row_index + 1:
+            ranges[-1] = (row_index, ranges[-1][1])
+        else:
+            ranges.append((row_index, row_index))
+    return ranges
+
+
+class SheetArchiveStore:
+    """每個學期一張封存工作表 (例如「封存_114-1」)，欄位與主工作表相同。"""
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self._worksheets = {}
+
+    def _worksheet(self, semester, create=False):
+        if semester not in self._worksheets:
+            title = f"{self.prefix}{semester}"
+            try:
+                worksheet = spreadsheet.worksheet(title)
+            except gspread.WorksheetNotFound:
+                if not create:
+                    return None
+                worksheet = spreadsheet.add_worksheet(title=title, rows=1, cols=SHEET_COLUMN_COUNT)
+            self._worksheets[semester] = ScheduledWorksheet(worksheet, sheets_scheduler)
+        return self._worksheets[semester]
+
+    def append(self, semester, rows):
+        self._worksheet(semester, create=True).append_rows(rows, value_input_option='RAW')
+
+    def read(self, semester):
+        worksheet = self._worksheet(semester)
+        return worksheet.get_all_values() if worksheet else []
+
+    def semesters(self):
+        return sorted(w.title[len(self.prefix):] for w in spreadsheet.worksheets() if w.title.startswith(self.prefix))
+
+
+class FileArchiveStore:
+    """
+    每個學期一個 gzip 壓縮的 JSON Lines 檔 (例如 archive/114-1.jsonl.gz)；
+    每次封存附加一個新的 gzip 區段，讀取時整個檔案一起解壓縮。
+    部署環境的磁碟不保證持久時請使用 sheet。
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+
+    def _path(self, semester):
+        return os.path.join(self.directory, f"{semester}.jsonl.gz")
+
+    def append(self, semester, rows):
+        os.makedirs(self.directory, exist_ok=True)
+        data = "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows).encode('utf-8')
+        with self._lock, open(self._path(semester), 'ab') as f:
+            f.write(gzip.compress(data))
+
+    def read(self, semester):
+        path = self._path(semester)
+        if not os.path.exists(path):
+            return []
+        with self._lock, gzip.open(path, 'rt', encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def semesters(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name[:-len(".jsonl.gz")] for name in os.listdir(self.directory) if name.endswith(".jsonl.gz"))
+
+
+class ArchiveJob:
+    """
+    背景封存執行緒：定期把舊的已完成報修搬到封存區。
+
+    每一批先寫入封存區、再從主工作表刪除，中途失敗最多造成封存區重複 (讀取時依受理編號去除重複)，
+    不會遺失資料。刪除前會重新讀取這些列，確認受理編號與狀態都沒有改變。
+    """
+
+    def __init__(self, store, interval, batch_size):
+        self.store = store
+        self.interval = interval
+        self.batch_size = max(1, batch_size)
+        self.archived = 0          # 累計封存筆數
+        self.last_run = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._cache = {}           # 學期 -> 已解析的封存任務 (封存新資料時清除)
+        self._cache_lock = threading.Lock()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="archiver", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        mark_background_thread()
+        while not self._stop.wait(self.interval if self.last_run else 60):
+            if sheet is None:
+                continue
+            try:
+                self.archive_once()
+            except Exception as e:
+                logging.error(f"封存已完成報修時發生錯誤: {e}")
+
+    def candidates(self):
+        """從任務快取挑出要封存的報修 (依列號排序)。"""
+        cutoff = archive_cutoff()
+        return [
+            task for task in task_cache.get_tasks()
+            if task["status"] == ARCHIVE_COMPLETED_STATUS and task["timestamp"] < cutoff
+            and semester_of(task["timestamp"])
+        ]
+
+    def archive_once(self):
+        """封存所有符合條件的報修，回傳本次封存的筆數。"""
+        self.last_run = time.time()
+        total = 0
+        # 由下往上分批處理：刪除下方的列不會改變上方各列的列號，整輪只需要讀取一次任務清單
+        pending = self.candidates()
+        while pending and not self._stop.is_set():
+            batch, pending = pending[-self.batch_size:], pending[:-self.batch_size]
+            moved = self._archive_batch(batch)
+            if not moved:
+                break
+            total += moved
+        if total:
+            logging.info(f"已封存 {total} 筆已完成的報修")
+        return total
+
+    def _archive_batch(self, batch):
+        with sheet_rows_lock.exclusive():
+            # 以目前工作表上的內容為準，確認這些列仍是快取中的那幾筆報修
+            current = sheet.batch_get([f"A{t['rowIndex']}:H{t['rowIndex']}" for t in batch])
+            rows = {}
+            for task, values in zip(batch, current):
+                row = (list(values[0]) + [""] * SHEET_COLUMN_COUNT)[:SHEET_COLUMN_COUNT] if values else None
+                if (row and row[0] == task["timestamp"] and row[5] == ARCHIVE_COMPLETED_STATUS
+                        and row[6] == task["id"]):
+                    rows[task["rowIndex"]] = row
+            if not rows:
+                # 工作表已被修改，快取過期；重新同步後下一次再封存
+                task_cache.invalidate()
+                return 0
+
+            by_semester = collections.defaultdict(list)
+            for row_index in sorted(rows):
+                by_semester[semester_of(rows[row_index][0])].append(rows[row_index])
+            for semester, semester_rows in by_semester.items():
+                self.store.append(semester, semester_rows)
+
+            # 刪除是依列號進行的：刪除前再讀一次受理編號，只刪除確定仍是這幾筆報修的列
+            ranges = row_ranges(rows)
+            current = sheet.batch_get([f"G{first}:G{last}" for first, last in ranges])
+            confirmed = {
+                row_index for (first, _), values in zip(ranges, current)
+                for row_index, cell in enumerate(values, start=first)
+                if row_index in rows and cell and cell[0] == rows[row_index][6]
+            }
+            if confirmed != rows.keys():
+                logging.warning(f"封存期間有 {len(rows) - len(confirmed)} 列被移動，這些列留到下次封存")
+                # 快取中的列號已經過期；沒有任何一列可以刪除時也要重新同步，下一輪才找得到這些列
+                task_cache.invalidate()
+            if confirmed:
+                try:
+                    # 刪除列不會自動重試 (見 SHEETS_IDEMPOTENT_WRITE_METHODS)：回應遺失時重送會刪掉下面的其他列；
+                    # 失敗時交給下一輪重新讀取、確認後再刪除
+                    if isinstance(sheet, ShardedWorksheet):
+                        sheet.delete_rows(row_ranges(confirmed))
+                    else:
+                        spreadsheet.batch_update({"requests": [
+                            {"deleteDimension": {"range": {
+                                "sheetId": sheet.id, "dimension": "ROWS", "startIndex": first - 1, "endIndex": last,
+                            }}}
+                            for first, last in row_ranges(confirmed)
+                        ]})
+                finally:
+                    # 刪除後 (或結果不明時) 其下方各列的列號都可能改變了，重新完整同步
+                    task_cache.invalidate()
+
+        with self._cache_lock:
+            for semester in by_semester:
+                self._cache.pop(semester, None)
+        self.archived += len(confirmed)
+        return len(confirmed)
+
+    def semesters(self):
+        return self.store.semesters()
+
+    def tasks(self, semester):
+        """讀取某一學期的封存報修 (依受理編號去除重複，依時間排序)。"""
+        with self._cache_lock:
+            cached = self._cache.get(semester)
+        if cached is not None:
+            return cached
+        seen = set()
+        tasks = []
+        for row in self.store.read(semester):
+            task = parse_task_row(None, (list(row) + [""] * SHEET_COLUMN_COUNT)[:SHEET_COLUMN_COUNT])
+            if task and not (task["id"] and task["id"] in seen):
+                seen.add(task["id"])
+                tasks.append(task)
+        tasks.sort(key=lambda task: task["timestamp"])
+        with self._cache_lock:
+            self._cache[semester] = tasks
+        return tasks
+
+
+archiver = ArchiveJob(
+    FileArchiveStore(ARCHIVE_DIR) if ARCHIVE_TARGET == 'file' else SheetArchiveStore(ARCHIVE_SHEET_PREFIX),
+    ARCHIVE_INTERVAL, ARCHIVE_BATCH_SIZE)
+
+# ----------------------------------------------------
+# 匯出報修資料
+# 學期末的報表需要完整的歷史資料；/export 以產生器分批讀取工作表 (每次 EXPORT_CHUNK_ROWS 列)，
+# 邊讀邊以 CSV 或 NDJSON 串流回應，不建立整份任務清單，記憶體用量與工作表大小無關。
+EXPORT_CHUNK_ROWS = int(os.environ.get('EXPORT_CHUNK_ROWS', 1000))
+
+# CSV 的欄位順序與標題
+EXPORT_FIELDS = [
+    ("id", "受理編號"),
+    ("timestamp", "時間戳記"),
+    ("reporterName", "報修人姓名"),
+    ("deviceLocation", "設備位置"),
+    ("problemDescription", "問題描述"),
+    ("helperTeacher", "協辦老師"),
+    ("status", "處理狀態"),
+    ("completedAt", "完成時間"),
+]
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson; charset=utf-8",
+}
+
+
+def parse_export_query(args):
+    """解析 /export 的查詢參數，回傳 (格式, 篩選條件)；參數無效時丟出 ValueError。"""
+    fmt = args.get('format') or 'csv'
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"不支援的匯出格式：{fmt}")
+    filters = {}
+    for field in INDEXED_TASK_FIELDS:
+        if args.get(field):
+            filters[field] = {v for v in args.get(field).split(',') if v}
+    since = args.get('since') or None
+    until = args.get('until') or None
+    for bound in (since, until):
+        try:
+            if bound:
+                datetime.date.fromisoformat(bound[:10])
+        except ValueError:
+            raise ValueError(f"日期格式應為 YYYY-MM-DD：{bound}")
+    # 只給日期時，包含當天整天
+    if until and len(until) == 10:
+        until += " 23:59:59"
+    return fmt, {"filters": filters, "since": since, "until": until}
+
+
+def iter_sheet_rows(chunk_rows=EXPORT_CHUNK_ROWS):
+    """
+    依列號分批產生 [(列號, row), ...]。
+    工作表模式下以 A{n}:H{n+chunk_rows-1} 範圍分批讀取 (排在背景優先順序)，讀到空的範圍就結束。
+
+    只在讀取每一批時共用持有 sheet_rows_lock，串流回應期間不會擋住封存工作；
+    兩批之間若有封存刪除列，先以 _realign_export() 找回下一批的起始列，不會漏列或重複。
+    """
+    if local_store:
+        yield from local_store.iter_rows(chunk_rows)
+        return
+    start = 2
+    exported = collections.Counter()   # 已匯出各列的 (時間戳記, 受理編號)
+    generation = None
+    while True:
+        with sheet_rows_lock.shared(), background_lane():
+            if generation is not None and sheet_rows_lock.generation != generation:
+                start = _realign_export(start, exported)
+            generation = sheet_rows_lock.generation
+            values = sheet.get(f"A{start}:H{start + chunk_rows - 1}")
+        if not values:
+            return
+        exported.update((row[0] if row else "", row[6] if len(row) > 6 else "") for row in values)
+        yield list(enumerate(values, start=start))
+        start += chunk_rows
+
+
+def _realign_export(start, exported):
+    """
+    有列被刪除後，回傳下一批匯出的起始列號 (需共用持有 sheet_rows_lock)。
+    刪除不會改變其餘各列的先後順序，仍在工作表上的已匯出列一定排在最前面，跳過它們即可。
+    """
+    if start <= 2:
+        return start
+    timestamps, tickets = ([cells[0] if cells else "" for cells in values] + [""] * (start - 2 - len(values))
+                           for values in sheet.batch_get([f"A2:A{start - 1}", f"G2:G{start - 1}"]))
+    remaining = collections.Counter(exported)
+    row_index = 2
+    for key in zip(timestamps, tickets):
+        if not remaining[key]:
+            break
+        remaining[key] -= 1
+        row_index += 1
+    return row_index
+
+
+def export_matches(task, filters, since, until):
+    if since and task["timestamp"] < since:
+        return False
+    if until and task["timestamp"] > until:
+        return False
+    return all(task[field] in values for field, values in filters.items())
+
+
+def export_tasks(fmt, filters, since=None, until=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    """產生匯出內容；每讀取一批資料列輸出一段字串。"""
+    if fmt == "csv":
+        # 加上 BOM，Excel 開啟時才會以 UTF-8 顯示中文
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow([title for _, title in EXPORT_FIELDS])
+        yield "\ufeff" + buffer.getvalue()
+
+    for chunk in iter_sheet_rows(chunk_rows):
+        tasks = [task for task in (parse_task_row(i, row) for i, row in chunk)
+                 if task and export_matches(task, filters, since, until)]
+        if not tasks:
+            continue
+        if fmt == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerows([task[field] for field, _ in EXPORT_FIELDS] for task in tasks)
+            yield buffer.getvalue()
+        else:
+            yield "".join(
+                json.dumps({field: task[field] for field, _ in EXPORT_FIELDS}, ensure_ascii=False) + "\n"
+                for task in tasks)
+
+
+# ----------------------------------------------------
+# 靜態 HTML 頁面
+# 頁面內容不會隨請求改變，因此在啟動時一次讀入並預先壓縮，
+# 之後每次請求只需挑選對應的位元組回傳，不再花 CPU 產生或壓縮 HTML。
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PAGE_CACHE_MAX_AGE = int(os.environ.get('PAGE_CACHE_MAX_AGE', 300))  # 瀏覽器可直接使用快取的秒數
+
+
+class StaticPage:
+    """預先壓縮好的靜態頁面，每種編碼各有一個強 ETag。"""
+
+    def __init__(self, filename, mimetype='text/html'):
+        with open(os.path.join(BASE_DIR, filename), 'rb') as f:
+            body = f.read()
+        self.mimetype = mimetype
+        self.cache_control = f"public, max-age={PAGE_CACHE_MAX_AGE}"
+        digest = hashlib.sha256(body).hexdigest()[:16]
+        # 編碼 -> (內容, ETag)；None 代表不壓縮
+        self.variants = {
+            None: (body, digest),
+            'gzip': (gzip.compress(body, compresslevel=9), f"{digest}-gzip"),
+        }
+        if brotli:
+            self.variants['br'] = (brotli.compress(body), f"{digest}-br")
+
+    def render(self, accept_encoding, if_none_match):
+        """
+        依 Accept-Encoding 與 If-None-Match 標頭挑選要回傳的內容，
+        回傳 (狀態碼, 內容, 標頭)，供 Flask 與 ASGI 兩種服務模式共用。
+        """
+        encoding = parse_accept_header(accept_encoding).best_match([e for e in self.variants if e])
+        body, etag = self.variants[encoding]
+        headers = {
+            'ETag': quote_etag(etag),
+            'Vary': 'Accept-Encoding',
+            'Cache-Control': self.cache_control,
+        }
+        if parse_etags(if_none_match).contains(etag):
+            return 304, b'', headers
+        if encoding:
+            headers['Content-Encoding'] = encoding
+        return 200, body, headers
+
+    def response(self):
+        """回傳 Flask 的 Response。"""
+        status, body, headers = self.render(
+            request.headers.get('Accept-Encoding'), request.headers.get('If-None-Match'))
+        return Response(body, status=status, headers=headers, mimetype=self.mimetype)
+
+
+HOME_PAGE = StaticPage('index.html')
+TASKS_PAGE = StaticPage('tasks.html')
+
 # ----------------------------------------------------
 # Flask 應用程式設定
 app = Flask(__name__)
 # 啟用 CORS，允許所有來源的網頁呼叫您的 API
 CORS(app) 
 
-# 在應用程式第一次請求前先初始化 gspread
-with app.app_context():
-    initialize_gspread()
+if STORAGE_MODE == 'sqlite':
+    initialize_local_store()
+    # 只有選為 leader 的 worker 會在背景連線 Google Sheets
+    coordinator.start(become_leader)
+    atexit.register(coordinator.stop)
+else:
+    # 啟動背景寫入執行緒；程式結束前盡量把佇列中的資料寫完
+    write_queue.start()
+    atexit.register(write_queue.stop)
+    # 在背景連線 Google Sheets，不延遲服務啟動
+    sheets_connector.start()
+    atexit.register(sheets_connector.stop)
+
+# 本機資料庫模式下列號由資料庫管理，不搬移工作表上的資料
+if ARCHIVE_AFTER_DAYS > 0 and STORAGE_MODE != 'sqlite':
+    archiver.start()
+    atexit.register(archiver.stop)
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, route, request.method, response.status_code)
+    return response
 
 # ----------------------------------------------------
 # 路由定義
 
-# 1. 根路由：用於顯示 HTML 報修表單 (您的 index.html 內容)
+NOT_READY_RETRY_AFTER = 5
+
+
+def not_ready_response():
+    """Sheets 尚未連線 (例如剛啟動) 時回傳 503，前端稍後重試即可，不需要重新啟動服務。"""
+    response = jsonify({"status": "error", "message": "伺服器正在連線至 Google Sheets，請稍後再試。"})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(NOT_READY_RETRY_AFTER)
+    return response
+
+
+# 報修還在寫入工作表時，建議前端幾秒後再更新狀態
+WRITE_PENDING_RETRY_AFTER = max(1, math.ceil(WRITE_FLUSH_INTERVAL))
+
+
+def write_pending_response(message, **extra):
+    """報修已受理、但還沒寫入工作表而無法更新狀態時，回傳 409 與 Retry-After，讓前端稍後再試。"""
+    response = jsonify({"status": "error", "message": message, **extra})
+    response.status_code = 409
+    response.headers['Retry-After'] = str(WRITE_PENDING_RETRY_AFTER)
+    return response
+
+
+def sheets_busy_response():
+    """Sheets 配額用盡且重試後仍失敗時，回傳 503 與 Retry-After，讓前端稍後再試。"""
+    response = jsonify({"status": "error", "message": "Google Sheets 目前忙碌中，請稍後再試。"})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(sheets_scheduler.retry_after())
+    return response
+
+
+# 1. 根路由：用於顯示 HTML 報修表單 (index.html)
 @app.route('/')
 def home():
     """
     回傳報修表單的 HTML 內容。
     """
-    # HTML 內容開始 (這部分是您的報修表單)
-    html_content = """
-<!DOCTYPE html>
-<html lang="zh-TW">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>設備報修系統</title>
-    <script src="https://cdn.tailwindcss.com"></script>
-    <style>
-        body {
-            font-family: 'Inter', sans-serif;
-            background-color: #f4f7f9;
-        }
-    </style>
-</head>
-<body class="min-h-screen flex items-center justify-center p-4">
-
-    <div class="w-full max-w-lg bg-white p-8 md:p-10 rounded-xl shadow-2xl">
-        
-        <div class="text-center mb-8">
-            <svg xmlns="http://www.w3.org/2000/svg" class="h-10 w-10 text-indigo-600 mx-auto mb-3" fill="none" viewBox="0 0 24 24" stroke="currentColor" stroke-width="2">
-                <path stroke-linecap="round" stroke-linejoin="round" d="M10.325 4.317c.426-1.756 2.924-1.756 3.35 0a1.724 1.724 0 002.573 1.066c1.543-.94 3.31.826 2.37 2.37a1.724 1.724 0 001.065 2.572c1.756.426 1.756 2.924 0 3.35a1.724 1.724 0 00-1.066 2.573c.94 1.543-.826 3.31-2.37 2.37a1.724 1.724 0 00-2.572 1.065c-.426 1.756-2.924 1.756-3.35 0a1.724 1.724 0 00-2.573-1.066c-1.543.94-3.31-.826-2.37-2.37a1.724 1.724 0 00-1.065-2.572c-1.756-.426-1.756-2.924 0-3.35a1.724 1.724 0 001.066-2.573c-.94-1.543.826-3.31 2.37-2.37a1.724 1.724 0 002.572-1.065z" />
-                <path stroke-linecap="round" stroke-linejoin="round" d="M15 12a3 3 0 11-6 0 3 3 0 016 0z" />
-            </svg>
-            <h1 class="text-3xl font-bold text-gray-900">設備報修單</h1>
-            <p class="text-gray-500 mt-1">請填寫詳細資訊，以便我們快速處理。</p>
-        </div>
-
-        <div id="message-box" class="hidden mb-6 p-3 text-center rounded-lg font-medium transition-all duration-300"></div>
-
-        <form id="repairForm" class="space-y-6">
-            
-            <div>
-                <label for="reporter_name_input" class="block text-sm font-medium text-gray-700 mb-1">報修人姓名 (必填)</label>
-                <input type="text" id="reporter_name_input" required class="w-full px-4 py-2 border border-gray-300 rounded-lg shadow-sm focus:ring-indigo-500 focus:border-indigo-500">
-            </div>
-
-            <div>
-                <label for="location_input" class="block text-sm font-medium text-gray-700 mb-1">設備位置 / 教室名稱 (必填)</label>
-                <input type="text" id="location_input" required class="w-full px-4 py-2 border border-gray-300 rounded-lg shadow-sm focus:ring-indigo-500 focus:border-indigo-500">
-            </div>
-
-            <div>
-                <label for="problem_input" class="block text-sm font-medium text-gray-700 mb-1">問題詳細描述 (必填)</label>
-                <textarea id="problem_input" rows="4" required class="w-full px-4 py-2 border border-gray-300 rounded-lg shadow-sm focus:ring-indigo-500 focus:border-indigo-500 resize-none"></textarea>
-            </div>
-            
-            <div>
-                <label for="teacher_select" class="block text-sm font-medium text-gray-700 mb-1">協辦老師 (選填)</label>
-                <select id="teacher_select" class="w-full px-4 py-2 border border-gray-300 rounded-lg shadow-sm focus:ring-indigo-500 focus:border-indigo-500 bg-white">
-                    <option value="無指定">-- 選擇協辦老師 (無指定) --</option>
-                    <option value="詹老師">詹老師</option>
-                    <option value="佘老師">佘老師</option>
-                    <option value="陳老師">陳老師</option>
-                </select>
-            </div>
-
-            <div>
-                <button type="submit" id="submit-button" class="w-full flex justify-center py-2 px-4 border border-transparent rounded-lg shadow-md text-sm font-medium text-white bg-indigo-600 hover:bg-indigo-700 focus:outline-none focus:ring-2 focus:ring-offset-2 focus:ring-indigo-500 transition duration-150 ease-in-out">
-                    送出報修單
-                </button>
-            </div>
-            
-            <div class="text-center pt-4 border-t border-gray-100 mt-6">
-                <a href="/tasks" class="text-sm font-medium text-indigo-600 hover:text-indigo-500">
-                    前往學生報修任務清單 →
-                </a>
-            </div>
-        </form>
-        </div>
-
-    <script>
-        // 設定您的 API 網址，這在 Render 部署時會自動指向正確的主機
-        const API_URL_BASE = window.location.origin; 
-        const API_URL = API_URL_BASE + "/submit_report";
-
-        const form = document.getElementById('repairForm');
-        const submitButton = document.getElementById('submit-button');
-        const messageBox = document.getElementById('message-box');
-
-        // 顯示訊息函式（取代 alert）
-        function showMessage(message, isSuccess) {
-            messageBox.textContent = message;
-            messageBox.classList.remove('hidden', 'bg-red-100', 'text-red-800', 'bg-green-100', 'text-green-800');
-            
-            if (isSuccess) {
-                messageBox.classList.add('bg-green-100', 'text-green-800');
-            } else {
-                messageBox.classList.add('bg-red-100', 'text-red-800');
-            }
-            // 5 秒後隱藏訊息
-            setTimeout(() => {
-                messageBox.classList.add('hidden');
-            }, 5000);
-        }
+    return HOME_PAGE.response()
 
-        form.addEventListener('submit', async function(event) {
-            // 阻止表單的預設提交行為
-            event.preventDefault();
-
-            // 鎖定按鈕並顯示載入狀態
-            submitButton.disabled = true;
-            submitButton.textContent = '正在送出...';
-            submitButton.classList.add('opacity-50', 'cursor-not-allowed');
-
-            try {
-                // 1. 從表單中收集資料
-                const reportData = {
-                    "reporterName": document.getElementById('reporter_name_input').value,
-                    "deviceLocation": document.getElementById('location_input').value,
-                    "problemDescription": document.getElementById('problem_input').value,
-                    "helperTeacher": document.getElementById('teacher_select').value
-                };
-
-                // 2. 發送 POST 請求
-                const response = await fetch(API_URL, {
-                    method: 'POST',
-                    // 告知伺服器我們正在傳送 JSON 格式的資料
-                    headers: {
-                        'Content-Type': 'application/json' 
-                    },
-                    body: JSON.stringify(reportData) // 將 JavaScript 物件轉換為 JSON 字串
-                });
-
-                const result = await response.json();
-
-                if (response.ok) {
-                    // HTTP 狀態碼為 200-299，表示成功
-                    showMessage(result.message, true);
-                    // 清空表單
-                    form.reset(); 
-                } else {
-                    // HTTP 狀態碼為 4xx 或 5xx，表示 API 發生錯誤
-                    throw new Error(result.message || `API 錯誤：HTTP 狀態碼 ${response.status}`);
-                }
 
-            } catch (error) {
-                // 處理網路錯誤或 API 返回的錯誤訊息
-                console.error("提交失敗:", error);
-                // 顯示錯誤訊息
-                showMessage(`提交失敗: ${error.message}`, false);
-            } finally {
-                // 無論成功或失敗，都恢復按鈕狀態
-                submitButton.disabled = false;
-                submitButton.textContent = '送出報修單';
-                submitButton.classList.remove('opacity-50', 'cursor-not-allowed');
-            }
-        });
-    </script>
-</body>
-</html>
-    """
-    # HTML 內容結束
-    return Response(html_content, mimetype='text/html')
+# 每個欄位最多幾個字；Google Sheets 單一儲存格的上限是 50000 字，超過時整批寫入都會被拒絕
+MAX_REPORT_FIELD_CHARS = min(int(os.environ.get('MAX_REPORT_FIELD_CHARS', 5000)), 50000)
 
 
-# 2. API 路由：用於接收表單提交的資料 (寫入 A-F 列)
+def build_report_row(data):
+    """
+    把前端送來的報修資料轉成要寫入工作表的一列；缺少必要欄位或欄位過長時丟出 ValueError。
+    """
+    # 從 JSON 資料中提取欄位
+    reporterName = data.get('reporterName', 'N/A')
+    deviceLocation = data.get('deviceLocation', 'N/A')
+    problemDescription = data.get('problemDescription', 'N/A')
+    helperTeacher = data.get('helperTeacher', '無指定') # E 列欄位
+
+    if not all([reporterName != 'N/A', deviceLocation != 'N/A', problemDescription != 'N/A']):
+        raise ValueError("缺少必要的報修資料（如報修人、地點或描述）。")
+
+    for value in (reporterName, deviceLocation, problemDescription, helperTeacher):
+        if len(str(value)) > MAX_REPORT_FIELD_CHARS:
+            raise ValueError(f"報修資料的每個欄位最多 {MAX_REPORT_FIELD_CHARS} 個字。")
+
+    # 獲取台灣時間
+    timestamp = taiwan_timestamp()
+
+    # row 陣列中包含 6 個元素：時間戳記、姓名、位置、描述、協辦老師、狀態
+    return [
+        timestamp, 
+        str(reporterName),
+        str(deviceLocation),
+        str(problemDescription),
+        str(helperTeacher), # 協辦老師 (E 列)
+        "待處理" # 狀態 (F 列)
+    ]
+
+
+# 2. API 路由：用於接收表單提交的資料 (寫入 A-G 列，G 列為受理編號)
 @app.route('/submit_report', methods=['POST'])
 def submit_data_api():
     """
-    接收來自網頁的 POST 請求，將 JSON 資料寫入 Google Sheets。
+    接收來自網頁的 POST 請求，將 JSON 資料排入寫入佇列，稍後批次寫入 Google Sheets。
     """
-    if not sheet:
-        return jsonify({"status": "error", "message": "伺服器初始化失敗，無法連線至 Google Sheets。請檢查 log 訊息。"}), 500
+    if not accepting_reports():
+        return not_ready_response()
 
     try:
         data = request.get_json()
@@ -247,342 +3479,493 @@ def submit_data_api():
         return jsonify({"status": "error", "message": "請求必須是 JSON 格式。請檢查網頁前端的 Content-Type。"}), 400
     
     try:
-        # 從 JSON 資料中提取欄位
-        reporterName = data.get('reporterName', 'N/A')
-        deviceLocation = data.get('deviceLocation', 'N/A')
-        problemDescription = data.get('problemDescription', 'N/A')
-        helperTeacher = data.get('helperTeacher', '無指定') # E 列欄位
-
-        if not all([reporterName != 'N/A', deviceLocation != 'N/A', problemDescription != 'N/A']):
-            logging.error(f"缺少必要資料: {data}")
-            return jsonify({"status": "error", "message": "缺少必要的報修資料（如報修人、地點或描述）。"}), 400
-
-        # 獲取台灣時間
-        utc_now = datetime.datetime.utcnow()
-        taiwan_time = utc_now + datetime.timedelta(hours=8)
-        timestamp = taiwan_time.strftime("%Y-%m-%d %H:%M:%S")
-
-        # row 陣列中包含 6 個元素：時間戳記、姓名、位置、描述、協辦老師、狀態
-        row = [
-            timestamp, 
-            str(reporterName),
-            str(deviceLocation),
-            str(problemDescription),
-            str(helperTeacher), # 協辦老師 (E 列)
-            "待處理" # 狀態 (F 列)
-        ]
-        
-        # 將資料附加到工作表的最後一行
-        sheet.append_row(row)
+        try:
+            row = build_report_row(data)
+        except ValueError as e:
+            logging.error(f"報修資料不正確: {e}")
+            return jsonify({"status": "error", "message": str(e)}), 400
         
-        logging.info(f"資料成功寫入：{row}")
-        return jsonify({"status": "success", "message": "設備報修資料已成功送出！"}), 200
+        key = submission_key(data, request.headers.get('Idempotency-Key') or data.get('idempotencyKey'))
+        ticket, duplicate = store_report_once(row, key)
+        if duplicate:
+            logging.info(f"重複送出的報修，回傳原受理編號 ({ticket})：{row}")
+            return jsonify({"status": "success", "message": "設備報修資料已成功送出！", "ticket": ticket,
+                            "duplicate": True}), 202
+
+        logging.info(f"已受理報修資料 ({ticket})：{row}")
+        return jsonify({"status": "success", "message": "設備報修資料已成功送出！", "ticket": ticket}), 202
         
     except Exception as e:
         logging.error(f"寫入 Google Sheets 時發生錯誤: {e}")
         return jsonify({"status": "error", "message": f"提交失敗：{str(e)}，可能是 Sheets API 限制或連線問題。"}), 500
 
 
-# 3. 學生任務頁面路由：回傳 HTML
+# 3. 學生任務頁面路由：回傳 HTML (tasks.html)
 @app.route('/tasks')
 def student_tasks_page():
     """
     回傳學生任務清單的 HTML 頁面。
     """
-    # HTML 內容開始 (這部分是學生任務清單)
-    html_content = f"""
-<!DOCTYPE html>
-<html lang="zh-TW">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>學生報修任務清單</title>
-    <script src="https://cdn.tailwindcss.com"></script>
-    <style>
-        body {{
-            font-family: 'Inter', sans-serif;
-            background-color: #f4f7f9;
-        }}
-        .task-card {{
-            transition: transform 0.2s, box-shadow 0.2s;
-        }}
-        .task-card:hover {{
-            transform: translateY(-2px);
-            box-shadow: 0 10px 15px -3px rgba(0, 0, 0, 0.1), 0 4px 6px -2px rgba(0, 0, 0, 0.05);
-        }}
-    </style>
-</head>
-<body class="p-4">
-    <div class="max-w-4xl mx-auto">
-        
-        <div class="text-center mb-8">
-            <h1 class="text-4xl font-extrabold text-gray-900">學長姐任務清單</h1>
-            <p class="text-gray-500 mt-2">點擊「回報已完成」按鈕回報進度，請勿擅自更改他人任務！</p>
-            <div class="mt-4">
-                 <a href="/" class="text-sm font-medium text-indigo-600 hover:text-indigo-500">
-                    ← 回到報修表單
-                </a>
-            </div>
-        </div>
-        
-        <div id="message-box" class="hidden mb-6 p-3 text-center rounded-lg font-medium transition-all duration-300"></div>
-
-        <div id="tasks-container" class="space-y-4">
-            <div class="text-center text-gray-500 p-8" id="loading-message">
-                <svg class="animate-spin h-5 w-5 mr-3 inline-block text-indigo-500" viewBox="0 0 24 24">
-                  <circle class="opacity-25" cx="12" cy="12" r="10" stroke="currentColor" stroke-width="4"></circle>
-                  <path class="opacity-75" fill="currentColor" d="M4 12a8 8 0 018-8V0C5.373 0 0 5.373 0 12h4zm2 5.291A7.962 7.962 0 014 12H0c0 3.042 1.135 5.824 3 7.938l3-2.647z"></path>
-                </svg>
-                正在載入任務...
-            </div>
-        </div>
-    </div>
-
-    <script>
-        // 設定 API 基礎 URL
-        const API_URL_BASE = window.location.origin; 
-        const GET_TASKS_URL = API_URL_BASE + "/get_tasks";
-        const UPDATE_STATUS_URL = API_URL_BASE + "/update_status";
-        const tasksContainer = document.getElementById('tasks-container');
-        const loadingMessage = document.getElementById('loading-message');
-        const messageBox = document.getElementById('message-box');
-
-        // 輔助函式：將字串中的 HTML 特殊字元轉義，防止 XSS 攻擊
-        function escape(html) {{
-            return html.replace(/&/g, "&amp;").replace(/</g, "&lt;").replace(/>/g, "&gt;").replace(/"/g, "&quot;").replace(/'/g, "&#039;");
-        }}
-
-        // 顯示訊息函式
-        function showMessage(message, isSuccess) {{
-            messageBox.textContent = message;
-            messageBox.classList.remove('hidden', 'bg-red-100', 'text-red-800', 'bg-green-100', 'text-green-800');
-            
-            if (isSuccess) {{
-                messageBox.classList.add('bg-green-100', 'text-green-800');
-            }} else {{
-                messageBox.classList.add('bg-red-100', 'text-red-800');
-            }}
-            // 5 秒後隱藏訊息
-            setTimeout(() => {{
-                messageBox.classList.add('hidden');
-            }}, 5000);
-        }}
-
-        // 任務卡片生成函式
-        function createTaskCard(task) {{
-            // 狀態顏色
-            let statusClass = '';
-            let buttonText = '回報已完成';
-            let isCompleted = false;
-
-            if (task.status === '待處理' || task.status === '處理中') {{
-                statusClass = 'bg-yellow-100 text-yellow-800';
-            }} else if (task.status === '已完成') {{
-                statusClass = 'bg-green-100 text-green-800';
-                buttonText = '已結案 (已完成)';
-                isCompleted = true;
-            }} else {{
-                statusClass = 'bg-gray-100 text-gray-800';
-            }}
-
-            const card = document.createElement('div');
-            // *** 修正後的代碼 ***
-            card.className = `task-card bg-white p-6 rounded-xl shadow-lg border-l-4 border-indigo-500 ${{isCompleted ? 'opacity-70' : ''}}`;
-            
-            card.innerHTML = `
-                <div class="flex justify-between items-start mb-4">
-                    <div>
-                        <span class="px-3 py-1 text-sm font-semibold rounded-full $ {{statusClass}}">${escape(task.status)}</span>
-                    </div>
-                    <span class="text-sm text-gray-500">${escape(task.timestamp)}</span>
-                </div>
-                
-                <h3 class="text-xl font-bold text-gray-900 mb-2">${escape(task.deviceLocation)} - ${escape(task.reporterName)} 報修</h3>
-                
-                <div class="space-y-2 text-gray-600 text-sm mb-4">
-                    <p><strong>協辦老師:</strong> ${escape(task.helperTeacher)}</p>
-                    <p class="text-gray-700"><strong>問題描述:</strong> ${escape(task.problemDescription)}</p>
-                </div>
-                
-                <div class="pt-4 border-t border-gray-100">
-                    <button 
-                        data-row-index="${task.rowIndex}" 
-                        data-current-status="${task.status}"
-                        class="status-button w-full py-2 px-4 rounded-lg text-white font-medium shadow-md transition duration-150 ease-in-out $ {{isCompleted ? 'bg-gray-400 cursor-not-allowed' : 'bg-indigo-600 hover:bg-indigo-700 focus:outline-none focus:ring-2 focus:ring-offset-2 focus:ring-indigo-500'}}"
-                        $ {{isCompleted ? 'disabled' : ''}}
-                    >
-                        ${buttonText}
-                    </button>
-                </div>
-            `;
-            
-            // 綁定按鈕事件
-            if (!isCompleted) {{
-                const button = card.querySelector('.status-button');
-                button.addEventListener('click', handleStatusUpdate);
-            }}
-
-            return card;
-        }
+    return TASKS_PAGE.response()
 
-        // 處理狀態更新
-        async function handleStatusUpdate(event) {{
-            const button = event.currentTarget;
-            const rowIndex = button.dataset.rowIndex;
-            const newStatus = '已完成'; // 點擊按鈕一律更新為「已完成」
-            
-            button.disabled = true;
-            button.textContent = '正在更新...';
-            button.classList.add('opacity-50', 'cursor-not-allowed');
-
-            try {{
-                const response = await fetch(UPDATE_STATUS_URL, {{
-                    method: 'POST',
-                    headers: {{ 'Content-Type': 'application/json' }},
-                    body: JSON.stringify({{ 
-                        rowIndex: rowIndex, 
-                        newStatus: newStatus 
-                    }})
-                }});
-
-                const result = await response.json();
-
-                if (response.ok) {{
-                    showMessage(result.message, true);
-                    // 成功後重新載入任務列表
-                    await loadTasks(); 
-                }} else {{
-                    throw new Error(result.message || '更新失敗');
-                }}
-
-            }} catch (error) {{
-                console.error("更新失敗:", error);
-                showMessage(`更新失敗: ${error.message}`, false);
-            }} 
-        }
-
-
-        // 載入任務清單
-        async function loadTasks() {{
-            tasksContainer.innerHTML = ''; // 清空舊列表
-            loadingMessage.classList.remove('hidden');
-
-            try {{
-                const response = await fetch(GET_TASKS_URL);
-                const result = await response.json();
-
-                loadingMessage.classList.add('hidden');
-
-                if (response.ok) {{
-                    if (result.tasks.length === 0) {{
-                        tasksContainer.innerHTML = '<p class="text-center text-gray-500 p-8">目前沒有任何報修任務。</p>';
-                        return;
-                    }}
-                    
-                    // 排序：未完成的排前面
-                    const sortedTasks = result.tasks.sort((a, b) => {{
-                        if (a.status === '已完成' && b.status !== '已完成') return 1;
-                        if (a.status !== '已完成' && b.status === '已完成') return -1;
-                        return 0; 
-                    }});
-
-                    sortedTasks.forEach(task => {{
-                        tasksContainer.appendChild(createTaskCard(task));
-                    }});
-
-                }} else {{
-                    throw new Error(result.message || '無法取得任務清單');
-                }}
-
-            }} catch (error) {{
-                loadingMessage.classList.add('hidden');
-                console.error("載入任務失敗:", error);
-                tasksContainer.innerHTML = `<p class="text-center text-red-600 p-8">載入任務失敗：${error.message}</p>`;
-            }}
-        }}
-
-        // 頁面載入時執行
-        window.onload = loadTasks;
-    </script>
-</body>
-</html>
-    """
-    # HTML 內容結束
-    return Response(html_content, mimetype='text/html')
-
-# 4. API 路由：用於讀取 Google Sheets 所有報修資料
+# 4. API 路由：用於讀取 Google Sheets 報修資料 (可篩選、排序、分頁)
 @app.route('/get_tasks', methods=['GET'])
 def get_tasks_api():
     """
-    從 Google Sheets 讀取所有報修資料，並回傳 JSON 列表。
+    從 Google Sheets 讀取報修資料 (經由快取)，並回傳 JSON 列表。
+
+    可用的查詢參數：
+      status / deviceLocation / helperTeacher：篩選條件，多個值以逗號分隔
+      since / until：時間區間 (YYYY-MM-DD 或完整時間戳記，含兩端)
+      sort：row (預設)、open_first、oldest、newest
+      limit / cursor：分頁；回應中的 nextCursor 用於取得下一頁
+
+    回應帶有以版本號產生的 ETag；If-None-Match 相符時回傳 304。
     """
-    if not sheet:
-        return jsonify({"status": "error", "message": "伺服器初始化失敗，無法連線至 Google Sheets。"}), 500
+    if not storage_ready():
+        return not_ready_response()
 
     try:
-        # 讀取工作表中的所有資料
-        all_data = sheet.get_all_values()
-        
-        # 假設第一行為標題，跳過
-        if len(all_data) <= 1:
-            return jsonify({"status": "success", "tasks": []})
-
-        records = all_data[1:]
-        
-        tasks_list = []
-        # 從第 2 列開始，所以 row_index 從 2 開始
-        for i, row in enumerate(records, start=2): 
-            # 確保 row 至少有 6 個元素 (時間, 姓名, 位置, 描述, 協辦老師, 狀態)
-            if len(row) < 6:
-                # 忽略不完整的報修記錄
-                continue
+        params = parse_task_query(request.args)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": f"無效的查詢參數：{str(e)}"}), 400
 
-            task = {
-                "rowIndex": i, # 在 Sheets 中的實際列號，用於後續更新
-                "timestamp": row[0],
-                "reporterName": row[1],
-                "deviceLocation": row[2],
-                "problemDescription": row[3],
-                "helperTeacher": row[4], # 協辦老師 (E 列, 索引 4)
-                "status": row[5] # 狀態 (F 列, 索引 5)
-            }
-            tasks_list.append(task)
-            
-        return jsonify({"status": "success", "tasks": tasks_list}), 200
+    try:
+        # 優先使用快取，過期時才同步工作表
+        status, body, headers = render_tasks(
+            request.query_string, params,
+            request.headers.get('Accept-Encoding'), request.headers.get('If-None-Match'))
+        return Response(body, status=status, headers=headers, mimetype='application/json')
         
     except Exception as e:
         logging.error(f"讀取 Google Sheets 時發生錯誤: {e}")
+        if is_rate_limited(e):
+            return sheets_busy_response()
         return jsonify({"status": "error", "message": f"讀取任務失敗：{str(e)}，請檢查 Sheets 權限。"}), 500
 
 # 5. API 路由：用於更新報修記錄的狀態
 @app.route('/update_status', methods=['POST'])
 def update_status_api():
     """
-    接收 POST 請求，根據列號 (rowIndex) 更新報修記錄的狀態 (F 列)。
+    接收 POST 請求，根據受理編號 (id) 更新報修記錄的狀態 (F 列)。
+    沒有受理編號的舊資料仍可用列號 (rowIndex) 指定。
     """
-    if not sheet:
-        return jsonify({"status": "error", "message": "伺服器初始化失敗，無法連線至 Google Sheets。"}), 500
+    if not storage_ready():
+        return not_ready_response()
     
     try:
-        data = request.get_json()
-        rowIndex = int(data.get('rowIndex'))
-        newStatus = data.get('newStatus')
+        try:
+            parsed = parse_status_update(request.get_json(silent=True))
+        except ValueError as e:
+            return jsonify({"status": "error", "message": f"無效的請求資料：{str(e)}。"}), 400
+        task_id, _, newStatus = parsed
+
+        # 查列號到寫入完成之間，封存工作不會移動工作表的列
+        with sheet_rows_lock.shared():
+            updates, errors, writing = resolve_status_updates([parsed])
+            if writing:
+                return write_pending_response(f"更新狀態失敗：{writing[0]}。")
+            if errors:
+                return jsonify({"status": "error", "message": f"更新狀態失敗：{errors[0]}。"}), 404
+            if updates:
+                store_statuses(updates)
         
-        if not rowIndex or not newStatus or rowIndex < 2:
-            return jsonify({"status": "error", "message": "無效的請求資料：缺少列號或新狀態。"}), 400
-
-        # 「狀態」欄位對應 Sheets 的 F 列，在 gspread 中列號 (col) 從 1 開始數，所以 F 列是 6
-        STATUS_COLUMN_INDEX = 6 
-
-        sheet.update_cell(rowIndex, STATUS_COLUMN_INDEX, newStatus)
-        
-        logging.info(f"成功更新第 {rowIndex} 列的狀態為: {newStatus}")
+        target = task_id or f"第 {parsed[1]} 列"
+        logging.info(f"成功更新 {target} 的狀態為: {newStatus}")
         return jsonify({"status": "success", "message": f"任務狀態已成功更新為「{newStatus}」！"}), 200
         
     except Exception as e:
         logging.error(f"更新 Google Sheets 時發生錯誤: {e}")
+        if is_rate_limited(e):
+            return sheets_busy_response()
         return jsonify({"status": "error", "message": f"更新狀態失敗：{str(e)}。"}), 500
 
+# 6. API 路由：一次更新多筆報修記錄的狀態
+MAX_BATCH_STATUS_UPDATES = int(os.environ.get('MAX_BATCH_STATUS_UPDATES', 200))
+
+
+def parse_status_update(item):
+    """
+    驗證單筆狀態更新，回傳 (受理編號, 列號, newStatus)；有受理編號時列號為 None。
+    資料無效時丟出 ValueError。
+    """
+    if not isinstance(item, dict):
+        raise ValueError("每一筆更新都必須是物件")
+    newStatus = item.get('newStatus')
+    if not newStatus or not isinstance(newStatus, str):
+        raise ValueError("缺少新狀態")
+    task_id = item.get('id')
+    if task_id:
+        if not isinstance(task_id, str):
+            raise ValueError("無效的受理編號")
+        return task_id, None, newStatus
+    try:
+        rowIndex = int(item.get('rowIndex'))
+    except (TypeError, ValueError):
+        raise ValueError("缺少受理編號或列號")
+    if rowIndex < 2:
+        raise ValueError("無效的列號")
+    return None, rowIndex, newStatus
+
+
+@app.route('/update_status_batch', methods=['POST'])
+def update_status_batch_api():
+    """
+    接收 POST 請求 {"updates": [{"id": ..., "newStatus": ...}, ...]} (舊資料可用 rowIndex 代替 id)，
+    先驗證全部資料，再以一次 batch_update 寫入所有有效的狀態，並回傳每一筆的結果。
+    """
+    if not storage_ready():
+        return not_ready_response()
+
+    data = request.get_json(silent=True)
+    updates = data.get('updates') if isinstance(data, dict) else None
+    if not isinstance(updates, list) or not updates:
+        return jsonify({"status": "error", "message": "無效的請求資料：updates 必須是非空的陣列。"}), 400
+    if len(updates) > MAX_BATCH_STATUS_UPDATES:
+        return jsonify({"status": "error", "message": f"一次最多只能更新 {MAX_BATCH_STATUS_UPDATES} 筆。"}), 400
+
+    results = []
+    parsed = []  # 與 results 中成功的項目依序對應
+    for i, item in enumerate(updates):
+        try:
+            task_id, rowIndex, newStatus = parse_status_update(item)
+            parsed.append((task_id, rowIndex, newStatus))
+            results.append({"index": i, "id": task_id, "rowIndex": rowIndex, "status": "success"})
+        except ValueError as e:
+            results.append({"index": i, "status": "error", "message": f"無效的請求資料：{str(e)}。"})
+
+    if not parsed:
+        return jsonify({"status": "error", "message": "沒有任何有效的更新。", "results": results}), 400
+
+    try:
+        with sheet_rows_lock.shared():
+            # 列號 -> 新狀態；同一列出現多次時以最後一筆為準
+            valid, errors, writing = resolve_status_updates(parsed)
+            pending = [result for result in results if result["status"] == "success"]
+            for n, message in errors.items():
+                pending[n].update(status="error", message=f"更新狀態失敗：{message}。")
+            for n, message in writing.items():
+                pending[n].update(status="error", message=f"更新狀態失敗：{message}。",
+                                  retryAfter=WRITE_PENDING_RETRY_AFTER)
+            if valid:
+                store_statuses(valid)
+    except Exception as e:
+        logging.error(f"批次更新 Google Sheets 時發生錯誤: {e}")
+        if is_rate_limited(e):
+            return sheets_busy_response()
+        for result in results:
+            if result["status"] == "success":
+                result.update(status="error", message=f"更新狀態失敗：{str(e)}。")
+        return jsonify({"status": "error", "message": f"批次更新狀態失敗：{str(e)}。", "results": results}), 500
+
+    failed = sum(1 for result in results if result["status"] == "error")
+    if failed == len(results):
+        if writing:
+            return write_pending_response("部分報修還在寫入工作表，請稍後再試。", results=results)
+        return jsonify({"status": "error", "message": "沒有任何有效的更新。", "results": results}), 400
+    logging.info(f"批次更新 {len(valid)} 列的狀態：{valid}")
+    return jsonify({
+        "status": "success" if not failed else "partial",
+        "message": f"已更新 {len(results) - failed} 筆任務狀態" + (f"，{failed} 筆資料無效。" if failed else "！"),
+        "results": results,
+    }), 200
+
+# 7. SSE 路由：推送任務變動事件給 /tasks 頁面
+@app.route('/task_events', methods=['GET'])
+def task_events_api():
+    """
+    以 Server-Sent Events 推送 task_added、status_changed 與 resync 事件。
+    事件 id 即任務清單的版本號，瀏覽器重連時會以 Last-Event-ID 帶回。
+    """
+    try:
+        last_event_id = int(request.headers.get('Last-Event-ID') or request.args.get('lastEventId'))
+    except (TypeError, ValueError):
+        last_event_id = None
+    subscriber = task_events.subscribe(EventSubscriber(SSE_QUEUE_SIZE), last_event_id)
+
+    def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                event = subscriber.get(SSE_HEARTBEAT_INTERVAL)
+                yield format_sse(event) if event else ": keepalive\n\n"
+        finally:
+            task_events.unsubscribe(subscriber)
+
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
+# 8. 監控路由：Sheets API 排程器的佇列長度、等待時間與重試次數
+@app.route('/sheets_stats', methods=['GET'])
+def sheets_stats_api():
+    return jsonify({"status": "success", "scheduler": sheets_scheduler.stats()}), 200
+
+# 9. 監控路由：Prometheus 格式的效能指標
+metrics.gauge("write_queue_pending", "寫入佇列中尚未寫入 Sheets 的報修筆數", lambda: write_queue.pending_count())
+metrics.gauge("write_queue_dead_letters_total", "被 Sheets 拒絕、移到 dead letter 檔案的報修筆數",
+              lambda: write_queue.dead_lettered, metric_type="counter")
+metrics.gauge("sse_subscribers", "目前連線中的 SSE 訂閱者數", lambda: task_events.subscriber_count())
+metrics.gauge("task_cache_version", "任務清單的版本號", lambda: task_cache.version)
+metrics.gauge("sheets_quota_queue_depth", "等待 Sheets 配額的請求數",
+              lambda: {(kind,): stats["queueDepth"] for kind, stats in sheets_scheduler.stats().items()}, ("kind",))
+metrics.gauge("sheets_retries_total", "Sheets API 呼叫的累計重試次數",
+              lambda: {(kind,): stats["retries"] for kind, stats in sheets_scheduler.stats().items()}, ("kind",),
+              metric_type="counter")
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_api():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+# 10. 健康檢查：/healthz 只確認行程仍在運作；/readyz 在可以讀寫任務資料時才回傳 200
+@app.route('/healthz', methods=['GET'])
+def healthz_api():
+    return jsonify({"status": "ok"}), 200
+
+
+@app.route('/readyz', methods=['GET'])
+def readyz_api():
+    ready = storage_ready()
+    body = {
+        "status": "ready" if ready else "starting",
+        "storageMode": STORAGE_MODE,
+        "workerRole": coordinator.role() if STORAGE_MODE == 'sqlite' else None,
+        "acceptingReports": accepting_reports(),
+        "sheets": sheets_connector.status(),
+    }
+    response = jsonify(body)
+    if not ready:
+        response.status_code = 503
+        response.headers['Retry-After'] = str(NOT_READY_RETRY_AFTER)
+    return response
+
+# 11. 封存查詢：只有在這裡才讀取封存資料
+ARCHIVE_SEMESTER_PATTERN = re.compile(r"^\d{2,3}-[12]$")
+
+
+@app.route('/archive', methods=['GET'])
+def archive_api():
+    """
+    查詢已封存的報修。
+    不帶參數時回傳有封存資料的學期清單；semester=114-1 回傳該學期的報修，
+    可再以 id、deviceLocation、helperTeacher 篩選 (多個值以逗號分隔)。
+    """
+    if not storage_ready():
+        return not_ready_response()
+
+    semester = request.args.get('semester')
+    try:
+        if not semester:
+            return jsonify({"status": "success", "semesters": archiver.semesters()}), 200
+        if not ARCHIVE_SEMESTER_PATTERN.match(semester):
+            return jsonify({"status": "error", "message": "無效的查詢參數：學期格式應為 114-1。"}), 400
+
+        tasks = archiver.tasks(semester)
+        for field in ("id", "deviceLocation", "helperTeacher"):
+            if request.args.get(field):
+                values = set(request.args.get(field).split(','))
+                tasks = [task for task in tasks if task[field] in values]
+        return jsonify({"status": "success", "semester": semester, "tasks": tasks, "total": len(tasks)}), 200
+
+    except Exception as e:
+        logging.error(f"讀取封存資料時發生錯誤: {e}")
+        if is_rate_limited(e):
+            return sheets_busy_response()
+        return jsonify({"status": "error", "message": f"讀取封存資料失敗：{str(e)}。"}), 500
+
+# 12. 匯出報修資料：以 CSV 或 NDJSON 串流回傳
+@app.route('/export', methods=['GET'])
+def export_api():
+    """
+    串流匯出工作表中的報修 (不含已封存的資料)。
+
+    可用的查詢參數：
+      format：csv (預設) 或 ndjson
+      status / deviceLocation / helperTeacher：篩選條件，多個值以逗號分隔
+      since / until：時間區間 (YYYY-MM-DD 或完整時間戳記，含兩端)
+    """
+    if not storage_ready():
+        return not_ready_response()
+
+    try:
+        fmt, params = parse_export_query(request.args)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": f"無效的查詢參數：{str(e)}"}), 400
+
+    chunks = export_tasks(fmt, **params)
+    try:
+        # 先讀取第一批，讓 Sheets 的錯誤仍能以一般的錯誤回應回傳；之後的錯誤只能中斷串流
+        first = next(chunks, "")
+    except Exception as e:
+        logging.error(f"匯出報修資料時發生錯誤: {e}")
+        if is_rate_limited(e):
+            return sheets_busy_response()
+        return jsonify({"status": "error", "message": f"匯出失敗：{str(e)}。"}), 500
+
+    def generate():
+        yield first
+        try:
+            yield from chunks
+        except Exception as e:
+            logging.error(f"匯出報修資料時發生錯誤，串流已中斷: {e}")
+            raise
+
+    filename = f"reports-{datetime.date.today().isoformat()}.{fmt}"
+    return Response(generate(), content_type=EXPORT_FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"',
+                             'Cache-Control': 'no-store'})
+
+# 13. API 路由：批次匯入報修 (JSON 陣列或 NDJSON)
+MAX_IMPORT_REPORTS = int(os.environ.get('MAX_IMPORT_REPORTS', 1000))
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
+
+
+def parse_import_body(req):
+    """
+    取出匯入的報修清單：JSON 陣列、{"reports": [...]}，或每行一筆的 NDJSON。
+    回傳 [(第幾筆, 資料或 None, 解析錯誤或 None), ...]；整份內容無效時丟出 ValueError。
+    """
+    if req.mimetype in NDJSON_MIMETYPES:
+        records = []
+        lines = [line for line in req.get_data(as_text=True).splitlines() if line.strip()]
+        for i, line in enumerate(lines):
+            try:
+                records.append((i, json.loads(line), None))
+            except ValueError:
+                records.append((i, None, "不是有效的 JSON"))
+        return records
+    data = req.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get('reports')
+    if not isinstance(data, list):
+        raise ValueError("請求內容必須是 JSON 陣列、{\"reports\": [...]} 或 NDJSON")
+    return [(i, item, None) for i, item in enumerate(data)]
+
+
+@app.route('/import_reports', methods=['POST'])
+def import_reports_api():
+    """
+    一次匯入多筆報修 (例如學期初的設備盤點)。
+    每一筆以與 /submit_report 相同的規則驗證並蓋上台灣時間，有效的報修一起排入寫入佇列，
+    由 append_rows 分批寫入 (每批最多 WRITE_MAX_BATCH_ROWS 筆)，並回傳每一筆的結果。
+
+    盤點時同一批中本來就可能有內容相同的報修 (例如兩張桌子同一個損壞)，所以不以內容雜湊去重，
+    只依每一筆的 idempotencyKey，或請求的 Idempotency-Key 標頭加上該筆的位置 (重送整批時不會重複匯入)。
+    """
+    if not accepting_reports():
+        return not_ready_response()
+
+    try:
+        records = parse_import_body(request)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": f"無效的請求資料：{str(e)}。"}), 400
+    if not records:
+        return jsonify({"status": "error", "message": "沒有任何要匯入的報修。"}), 400
+    if len(records) > MAX_IMPORT_REPORTS:
+        return jsonify({"status": "error", "message": f"一次最多只能匯入 {MAX_IMPORT_REPORTS} 筆。"}), 400
+
+    batch_key = request.headers.get('Idempotency-Key')
+    results = []
+    rows, keys = [], []  # 與 results 中成功的項目依序對應
+    for i, item, error in records:
+        try:
+            if error:
+                raise ValueError(error)
+            if not isinstance(item, dict):
+                raise ValueError("每一筆報修都必須是物件")
+            rows.append(build_report_row(item))
+            explicit_key = item.get('idempotencyKey') or (f"{batch_key}#{i}" if batch_key else None)
+            keys.append(submission_key(item, explicit_key) if explicit_key else None)
+            results.append({"index": i, "status": "success"})
+        except ValueError as e:
+            results.append({"index": i, "status": "error", "message": f"無效的報修資料：{str(e)}"})
+
+    if not rows:
+        return jsonify({"status": "error", "message": "沒有任何有效的報修。", "results": results}), 400
+
+    try:
+        stored = store_reports_once(rows, keys)
+    except Exception as e:
+        logging.error(f"批次匯入報修時發生錯誤: {e}")
+        return jsonify({"status": "error", "message": f"匯入失敗：{str(e)}，可能是 Sheets API 限制或連線問題。"}), 500
+
+    accepted = [result for result in results if result["status"] == "success"]
+    for result, (ticket, duplicate) in zip(accepted, stored):
+        result["ticket"] = ticket
+        if duplicate:
+            result["duplicate"] = True
+
+    failed = len(results) - len(accepted)
+    logging.info(f"批次匯入 {len(accepted)} 筆報修資料 ({failed} 筆無效)")
+    return jsonify({
+        "status": "success" if not failed else "partial",
+        "message": f"已受理 {len(accepted)} 筆報修" + (f"，{failed} 筆資料無效。" if failed else "！"),
+        "results": results,
+    }), 202
+
+# 14. 統計資料：各教室未完成的報修、各協辦老師的負擔，以及修復所需時間
+@app.route('/stats', methods=['GET'])
+def stats_api():
+    """
+    回傳任務快取隨新增與狀態更新維護的彙總統計 (不含已封存的報修)；
+    查詢時間只與地點、老師等分組的數量有關，與報修筆數無關。
+    """
+    if not storage_ready():
+        return not_ready_response()
+
+    try:
+        stats, version = task_cache.stats_snapshot()
+        return jsonify({"status": "success", "version": version, **stats}), 200
+    except Exception as e:
+        logging.error(f"計算統計資料時發生錯誤: {e}")
+        if is_rate_limited(e):
+            return sheets_busy_response()
+        return jsonify({"status": "error", "message": f"讀取統計資料失敗：{str(e)}。"}), 500
+
+# 15. 全文搜尋：以設備位置與問題描述搜尋報修，依相關程度排序
+SEARCH_PAGE_SIZE = int(os.environ.get('SEARCH_PAGE_SIZE', 20))  # 未指定 limit 時每頁幾筆
+
+
+@app.route('/search', methods=['GET'])
+def search_api():
+    """
+    搜尋設備位置與問題描述 (例如 ?q=3F 投影機)，只使用記憶體內的索引，不另外讀取工作表。
+
+    可用的查詢參數：
+      q：搜尋文字；以空白分隔的多個詞都必須符合
+      status / deviceLocation / helperTeacher：篩選條件，多個值以逗號分隔
+      since / until：時間區間 (YYYY-MM-DD 或完整時間戳記，含兩端)
+      limit / cursor：分頁；回應中的 nextCursor 用於取得下一頁
+    結果一律依相關程度排序，不接受 sort 參數。
+    """
+    if not storage_ready():
+        return not_ready_response()
+
+    text = request.args.get('q', '').strip()
+    if not text:
+        return jsonify({"status": "error", "message": "無效的查詢參數：缺少搜尋文字 q。"}), 400
+    if 'sort' in request.args:
+        return jsonify({"status": "error", "message": "無效的查詢參數：搜尋結果依相關程度排序，不支援 sort。"}), 400
+    try:
+        params = parse_task_query(request.args, cursor_sort="search")
+        limit = params["limit"] or SEARCH_PAGE_SIZE
+    except ValueError as e:
+        return jsonify({"status": "error", "message": f"無效的查詢參數：{str(e)}"}), 400
+
+    try:
+        tasks, next_cursor, total, version = task_cache.search(
+            text, filters=params["filters"], since=params["since"], until=params["until"],
+            cursor=params["cursor"], limit=limit)
+        return jsonify({"status": "success", "version": version, "tasks": tasks,
+                        "total": total, "nextCursor": next_cursor}), 200
+    except Exception as e:
+        logging.error(f"搜尋報修時發生錯誤: {e}")
+        if is_rate_limited(e):
+            return sheets_busy_response()
+        return jsonify({"status": "error", "message": f"搜尋失敗：{str(e)}。"}), 500
+
 # ----------------------------------------------------
 # 本地測試運行
 if __name__ == '__main__':
@@ -0,0 +1,64 @@
+import os
+import sys
+import time
+import importlib
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture
+def load_main(tmp_path, monkeypatch):
+    """
+    以指定的環境變數重新載入 main.py，使用記憶體內的假工作表 (SHEETS_BACKEND=fake)。
+    main.py 在載入時讀取設定並啟動背景執行緒，所以每個測試各自載入一次，結束時停止背景執行緒。
+    """
+    loaded = []
+
+    def load(**env):
+        defaults = {
+            "SHEETS_BACKEND": "fake",
+            "FAKE_SHEETS_ROWS": "0",
+            "WRITE_FLUSH_INTERVAL": "0.05",
+            "WRITE_DEAD_LETTER_PATH": str(tmp_path / "write_dead_letter.jsonl"),
+            "IDEMPOTENCY_DB": "",
+            "ARCHIVE_AFTER_DAYS": "0",
+        }
+        for key, value in {**defaults, **env}.items():
+            monkeypatch.setenv(key, str(value))
+        sys.modules.pop("main", None)
+        main = importlib.import_module("main")
+        main.SHEETS_BACKOFF_BASE = 0.01
+        assert main.sheets_connector.warmed_up.wait(10)
+        loaded.append(main)
+        return main
+
+    yield load
+
+    for main in loaded:
+        main.write_queue.stop(timeout=2)
+        if main.replicator is not None:
+            main.replicator.stop(timeout=2)
+        for job in (main.archiver, main.coordinator, main.sheets_connector):
+            job.stop()
+    sys.modules.pop("main", None)
+
+
+def fake_worksheet(main):
+    """取出 ScheduledWorksheet 包裝的假工作表，測試中可直接修改或替換它的方法。"""
+    return main.sheet._worksheet
+
+
+def wait_for(predicate, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("等待逾時")
+        time.sleep(0.02)
+
+
+def submit(client, description, **extra):
+    data = {"reporterName": "測試", "deviceLocation": "101 教室", "problemDescription": description, **extra}
+    return client.post('/submit_report', json=data)
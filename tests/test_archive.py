@@ -0,0 +1,87 @@
+import pytest
+import requests
+
+
+@pytest.fixture
+def main(load_main, tmp_path):
+    """範例資料在 2025 年初，全部早於 90 天前；其中已完成的報修都是封存對象。"""
+    return load_main(FAKE_SHEETS_ROWS=300, ARCHIVE_AFTER_DAYS=90, ARCHIVE_INTERVAL=100000, ARCHIVE_BATCH_SIZE=40,
+                     ARCHIVE_TARGET="file", ARCHIVE_DIR=tmp_path / "archive")
+
+
+def sheet_tickets(main):
+    return [row[6] for row in main.sheet.get_all_values()[1:]]
+
+
+def archived_tickets(main):
+    return {task["id"] for semester in main.archiver.semesters() for task in main.archiver.tasks(semester)}
+
+
+def test_archive_moves_completed_reports_off_the_sheet(main):
+    before = main.sheet.get_all_values()[1:]
+    candidates = {task["id"] for task in main.archiver.candidates()}
+    assert candidates
+
+    moved = main.archiver.archive_once()
+
+    assert moved == len(candidates)
+    assert archived_tickets(main) == candidates
+    assert sheet_tickets(main) == [row[6] for row in before if row[6] not in candidates]
+    # 任務快取重新同步後，剩下的任務列號與工作表一致
+    tasks = main.task_cache.get_tasks()
+    assert [task["id"] for task in tasks] == sheet_tickets(main)
+    assert [task["rowIndex"] for task in tasks] == list(range(2, len(tasks) + 2))
+
+
+def test_rows_that_moved_before_the_delete_are_left_alone(main):
+    fake = main.sheet._worksheet
+    before = sheet_tickets(main)
+    store_append = main.archiver.store.append
+    removed = []
+
+    def append_then_someone_deletes_a_row(semester, rows):
+        store_append(semester, rows)
+        if not removed:
+            # 寫入封存區之後、刪除之前，有人在工作表最上方刪除了一列，下面所有的列都往上移
+            removed.append(fake.get_all_values()[1][6])
+            fake._delete_rows(1, 2)
+
+    main.archiver.store.append = append_then_someone_deletes_a_row
+    candidates = {task["id"] for task in main.archiver.candidates()}
+
+    main.archiver.archive_once()
+
+    after = sheet_tickets(main)
+    deleted = set(before) - set(after) - set(removed)
+    # 只刪除確認過的封存對象，不會刪到往上移的其他報修
+    assert deleted <= candidates
+    assert deleted <= archived_tickets(main)
+    # 沒刪除的封存對象留在工作表上，下一輪再封存
+    main.archiver.archive_once()
+    assert not candidates & set(sheet_tickets(main))
+
+
+def test_lost_delete_response_does_not_delete_twice(main):
+    spreadsheet = main.spreadsheet._worksheet
+    batch_update = spreadsheet.batch_update
+    calls = []
+
+    def lost_response(body):
+        result = batch_update(body)
+        calls.append(body)
+        if len(calls) == 1:
+            raise requests.Timeout("回應遺失")
+        return result
+
+    spreadsheet.batch_update = lost_response
+    before = main.sheet.get_all_values()[1:]
+
+    with pytest.raises(requests.Timeout):
+        main.archiver.archive_once()
+    while main.archiver.archive_once():
+        pass
+
+    remaining = set(sheet_tickets(main))
+    archived = archived_tickets(main)
+    assert not remaining & archived
+    assert all(row[6] in remaining or row[6] in archived for row in before)
@@ -0,0 +1,102 @@
+import sys
+import time
+import asyncio
+import importlib
+
+import httpx
+import pytest
+
+from conftest import wait_for
+from fake_sheets import sample_ticket
+
+
+@pytest.fixture
+def asgi(load_main):
+    main = load_main(FAKE_SHEETS_ROWS=20)
+    sys.modules.pop("asgi_app", None)
+    yield main, importlib.import_module("asgi_app")
+    sys.modules.pop("asgi_app", None)
+
+
+def run_with_client(asgi_app, scenario):
+    async def run():
+        transport = httpx.ASGITransport(app=asgi_app.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await scenario(client)
+    return asyncio.run(run())
+
+
+def test_get_tasks_and_etag(asgi):
+    main, asgi_app = asgi
+
+    async def scenario(client):
+        first = await client.get('/get_tasks?limit=5')
+        again = await client.get('/get_tasks?limit=5', headers={"If-None-Match": first.headers["etag"]})
+        return first, again
+
+    first, again = run_with_client(asgi_app, scenario)
+
+    assert first.status_code == 200
+    assert len(first.json()["tasks"]) == 5 and first.json()["total"] == 20
+    assert again.status_code == 304
+
+
+def test_submit_and_update_status(asgi):
+    main, asgi_app = asgi
+
+    async def scenario(client):
+        submitted = await client.post('/submit_report', json={
+            "reporterName": "測試", "deviceLocation": "101 教室", "problemDescription": "非同步送出"})
+        updated = await client.post('/update_status', json={"id": sample_ticket(0), "newStatus": "已完成"})
+        missing = await client.post('/update_status', json={"id": "ffffffffffff", "newStatus": "已完成"})
+        tasks = (await client.get('/get_tasks')).json()["tasks"]
+        return submitted, updated, missing, tasks
+
+    submitted, updated, missing, tasks = run_with_client(asgi_app, scenario)
+
+    assert submitted.status_code == 202
+    assert updated.status_code == 200
+    assert missing.status_code == 404
+    assert next(task for task in tasks if task["id"] == sample_ticket(0))["status"] == "已完成"
+    wait_for(lambda: main.write_queue.pending_count() == 0)
+    assert "非同步送出" in [row[3] for row in main.sheet.get_all_values()]
+
+
+def test_other_routes_fall_back_to_flask(asgi):
+    main, asgi_app = asgi
+
+    async def scenario(client):
+        return await client.get('/stats')
+
+    response = run_with_client(asgi_app, scenario)
+
+    assert response.status_code == 200
+    assert response.json()["total"] == 20
+
+
+def test_waiting_for_quota_does_not_hold_executor_threads(load_main):
+    main = load_main()
+    scheduler = main.SheetsScheduler(reads_per_minute=1, writes_per_minute=1, burst=1)
+    scheduler.acquire('read')
+
+    async def read():
+        return "ok"
+
+    async def run():
+        # 比預設執行緒池的執行緒數還多的請求在等待配額
+        waiters = [asyncio.create_task(scheduler.call_async(read, 'read')) for _ in range(64)]
+        await asyncio.sleep(0.1)
+        started = time.monotonic()
+        result = await asyncio.wait_for(asyncio.to_thread(lambda: "thread"), timeout=2)
+        elapsed = time.monotonic() - started
+        depth = scheduler.stats()['read']['queueDepth']
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        return result, elapsed, depth
+
+    result, elapsed, depth = asyncio.run(run())
+
+    assert result == "thread" and elapsed < 1
+    assert depth == 64
+    assert scheduler.stats()['read']['queueDepth'] == 0
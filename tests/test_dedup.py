@@ -0,0 +1,70 @@
+from conftest import fake_worksheet, submit, wait_for
+
+
+def written(main, description):
+    wait_for(lambda: main.write_queue.pending_count() == 0)
+    return [row for row in fake_worksheet(main).get_all_values() if row[3] == description]
+
+
+def test_resubmitted_report_returns_the_first_ticket(load_main):
+    main = load_main()
+    client = main.app.test_client()
+
+    first = submit(client, "投影機沒有畫面").get_json()
+    # 多餘的空白不影響比對
+    second = submit(client, " 投影機沒有畫面 ").get_json()
+
+    assert second["ticket"] == first["ticket"]
+    assert second["duplicate"] is True
+    assert len(written(main, "投影機沒有畫面")) == 1
+
+
+def test_idempotency_key_header_deduplicates(load_main):
+    main = load_main()
+    client = main.app.test_client()
+    data = {"reporterName": "測試", "deviceLocation": "101 教室", "problemDescription": "冷氣漏水"}
+
+    first = client.post('/submit_report', json=data, headers={"Idempotency-Key": "abc"}).get_json()
+    second = client.post('/submit_report', json=data, headers={"Idempotency-Key": "abc"}).get_json()
+    other = client.post('/submit_report', json=data, headers={"Idempotency-Key": "def"}).get_json()
+
+    assert second["ticket"] == first["ticket"]
+    assert other["ticket"] != first["ticket"]
+    assert len(written(main, "冷氣漏水")) == 2
+
+
+def test_disabled_window_keeps_every_submission(load_main):
+    main = load_main(IDEMPOTENCY_WINDOW=0)
+    client = main.app.test_client()
+
+    tickets = {submit(client, "門鎖故障").get_json()["ticket"] for _ in range(2)}
+
+    assert len(tickets) == 2
+    assert len(written(main, "門鎖故障")) == 2
+
+
+def test_import_keeps_identical_rows(load_main):
+    main = load_main()
+    client = main.app.test_client()
+    report = {"reporterName": "總務處", "deviceLocation": "電腦教室", "problemDescription": "桌腳斷裂"}
+
+    body = client.post('/import_reports', json=[report, report, report]).get_json()
+
+    assert len({result["ticket"] for result in body["results"]}) == 3
+    assert len(written(main, "桌腳斷裂")) == 3
+    # 匯入不記下內容雜湊，之後一般送出同樣的內容仍會受理
+    assert "duplicate" not in submit(client, "桌腳斷裂", reporterName="總務處",
+                                     deviceLocation="電腦教室").get_json()
+
+
+def test_resending_an_import_with_the_same_key_does_not_duplicate(load_main):
+    main = load_main()
+    client = main.app.test_client()
+    reports = [{"reporterName": "總務處", "deviceLocation": "圖書館", "problemDescription": "燈管閃爍"}] * 2
+
+    first = client.post('/import_reports', json=reports, headers={"Idempotency-Key": "inventory-1"}).get_json()
+    second = client.post('/import_reports', json=reports, headers={"Idempotency-Key": "inventory-1"}).get_json()
+
+    assert [r["ticket"] for r in second["results"]] == [r["ticket"] for r in first["results"]]
+    assert all(result["duplicate"] for result in second["results"])
+    assert len(written(main, "燈管閃爍")) == 2
@@ -0,0 +1,52 @@
+from fake_sheets import sample_ticket
+
+
+def get_tasks(client, etag=None):
+    return client.get('/get_tasks?limit=5', headers={"If-None-Match": etag} if etag else {})
+
+
+def test_unchanged_tasks_return_304(load_main):
+    main = load_main(FAKE_SHEETS_ROWS=20)
+    client = main.app.test_client()
+
+    first = get_tasks(client)
+    etag = first.headers["ETag"]
+    assert first.status_code == 200
+    assert main.TASKS_ETAG_EPOCH in etag
+
+    again = get_tasks(client, etag)
+    assert again.status_code == 304
+    assert again.data == b''
+    assert again.headers["ETag"] == etag
+    # 查詢參數不同就是不同的 ETag
+    assert client.get('/get_tasks?limit=6', headers={"If-None-Match": etag}).status_code == 200
+
+    assert client.post('/update_status', json={"id": sample_ticket(0), "newStatus": "已完成"}).status_code == 200
+    changed = get_tasks(client, etag)
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+
+
+def test_etag_from_before_a_restart_is_not_reused(load_main):
+    etag = get_tasks(load_main(FAKE_SHEETS_ROWS=20).app.test_client()).headers["ETag"]
+
+    # 重新啟動後版本號從頭計算，相同的版本號不代表相同的內容
+    main = load_main(FAKE_SHEETS_ROWS=20)
+    response = get_tasks(main.app.test_client(), etag)
+
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_local_store_etag_is_shared_across_workers(load_main, tmp_path):
+    main = load_main(FAKE_SHEETS_ROWS=20, STORAGE_MODE="sqlite", SQLITE_PATH=tmp_path / "reports.db",
+                     REPLICATION_INTERVAL=1000)
+    client = main.app.test_client()
+    etag = get_tasks(client).headers["ETag"]
+
+    # epoch 存在資料庫中，同一個資料庫重新開啟 (另一個 worker 或重新啟動) 時不變
+    assert main.local_store.epoch in etag
+    assert main.LocalStore(tmp_path / "reports.db").epoch == main.local_store.epoch
+    # 每個行程各自的 epoch 不影響 ETag
+    main.TASKS_ETAG_EPOCH = "another-worker"
+    assert get_tasks(client, etag).status_code == 304
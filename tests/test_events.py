@@ -0,0 +1,70 @@
+from fake_sheets import sample_ticket
+
+
+def drain(subscriber):
+    events = []
+    while (event := subscriber.get(timeout=0)) is not None:
+        events.append(event)
+    return events
+
+
+def change(main, *indexes):
+    """修改第 i 筆範例資料的狀態；範例資料有些已經完成，改成與目前不同的狀態才會產生事件。"""
+    client = main.app.test_client()
+    for i in indexes:
+        status = next(task["status"] for task in main.task_cache.get_tasks() if task["id"] == sample_ticket(i))
+        new_status = "處理中" if status != "處理中" else "已完成"
+        assert client.post('/update_status', json={"id": sample_ticket(i), "newStatus": new_status}).status_code == 200
+
+
+def reconnect(main, last_event_id):
+    return drain(main.task_events.subscribe(main.EventSubscriber(main.SSE_QUEUE_SIZE), last_event_id))
+
+
+def test_reconnect_replays_missed_events(load_main):
+    main = load_main(FAKE_SHEETS_ROWS=10)
+    change(main, 0)
+    last_seen = main.task_cache.version
+
+    change(main, 1, 2)
+
+    events = reconnect(main, last_seen)
+    assert [event_type for _, event_type, _ in events] == ["status_changed", "status_changed"]
+    assert [data["id"] for _, _, data in events] == [sample_ticket(1), sample_ticket(2)]
+    assert [event_id for event_id, _, _ in events] == [last_seen + 1, last_seen + 2]
+    # 已經是最新版本就沒有需要補送的事件
+    assert reconnect(main, main.task_cache.version) == []
+
+
+def test_reconnect_after_history_was_dropped_resyncs(load_main):
+    main = load_main(FAKE_SHEETS_ROWS=10, SSE_HISTORY_SIZE=2)
+    change(main, 0)
+    last_seen = main.task_cache.version
+
+    # 錯過的事件比保留的歷史還多，無法完整補送
+    change(main, 1, 2, 3)
+
+    assert reconnect(main, last_seen) == [(main.task_cache.version, "resync", {"version": main.task_cache.version})]
+
+
+def test_reconnect_with_an_id_from_before_a_restart_resyncs(load_main):
+    main = load_main(FAKE_SHEETS_ROWS=10)
+    change(main, 0)
+
+    # 伺服器重新啟動後版本號從頭計算，前端帶回的 id 比目前最新的事件還新
+    events = reconnect(main, main.task_cache.version + 100)
+
+    assert [event_type for _, event_type, _ in events] == ["resync"]
+    assert events[0][0] == main.task_cache.version
+
+
+def test_stream_sends_resync_first(load_main):
+    main = load_main(FAKE_SHEETS_ROWS=10)
+    response = main.app.test_client().get('/task_events', headers={"Last-Event-ID": "999"}, buffered=False)
+    chunks = iter(response.response)
+    try:
+        assert next(chunks) == b"retry: 3000\n\n"
+        assert next(chunks).decode().startswith(f"id: {main.task_cache.version}\nevent: resync\n")
+    finally:
+        response.close()
+    assert main.task_events.subscriber_count() == 0
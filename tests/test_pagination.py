@@ -0,0 +1,87 @@
+import json
+import base64
+
+import pytest
+
+
+def pages(client, path):
+    """依 nextCursor 讀完所有分頁，回傳 (所有任務, 最後一頁的回應)。"""
+    tasks, cursor = [], None
+    while True:
+        separator = '&' if '?' in path else '?'
+        body = client.get(path + (f"{separator}cursor={cursor}" if cursor else "")).get_json()
+        tasks += body["tasks"]
+        cursor = body["nextCursor"]
+        if not cursor:
+            return tasks, body
+
+
+@pytest.mark.parametrize("sort", ["row", "open_first", "oldest", "newest"])
+def test_cursor_pages_cover_every_task_once(load_main, sort):
+    main = load_main(FAKE_SHEETS_ROWS=53)
+    client = main.app.test_client()
+
+    tasks, last = pages(client, f"/get_tasks?sort={sort}&limit=10")
+
+    rows = [task["rowIndex"] for task in tasks]
+    assert len(rows) == len(set(rows)) == last["total"] == 53
+    everything = client.get(f"/get_tasks?sort={sort}").get_json()["tasks"]
+    assert rows == [task["rowIndex"] for task in everything]
+
+
+def test_search_pages_cover_every_match_once(load_main):
+    main = load_main(FAKE_SHEETS_ROWS=80)
+    client = main.app.test_client()
+
+    tasks, last = pages(client, "/search?q=教室&limit=7")
+
+    rows = [task["rowIndex"] for task in tasks]
+    assert len(rows) == len(set(rows)) == last["total"]
+
+
+def test_cursor_from_another_sort_is_rejected(load_main):
+    main = load_main(FAKE_SHEETS_ROWS=20)
+    client = main.app.test_client()
+    cursor = client.get("/get_tasks?sort=newest&limit=5").get_json()["nextCursor"]
+    search_cursor = client.get("/search?q=教室&limit=2").get_json()["nextCursor"]
+
+    assert client.get(f"/get_tasks?sort=row&cursor={cursor}").status_code == 400
+    assert client.get(f"/get_tasks?cursor={search_cursor}").status_code == 400
+    assert client.get(f"/search?q=教室&cursor={cursor}").status_code == 400
+
+
+@pytest.mark.parametrize("payload", [
+    ["row", ["x"]],
+    ["row", [True]],
+    ["row", 5],
+    ["oldest", [1, 2]],
+    ["nope", [1]],
+    {"a": 1},
+])
+def test_tampered_cursor_is_rejected(load_main, payload):
+    main = load_main(FAKE_SHEETS_ROWS=5)
+    client = main.app.test_client()
+    cursor = base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+    for sort in ("row", "open_first", "oldest"):
+        assert client.get(f"/get_tasks?sort={sort}&cursor={cursor}").status_code == 400
+    assert client.get("/get_tasks?cursor=not-base64!").status_code == 400
+
+
+def test_search_applies_the_date_range(load_main):
+    main = load_main(FAKE_SHEETS_ROWS=300)
+    client = main.app.test_client()
+    # 範例資料從 2025-01-01 08:00 起每 10 分鐘一筆
+    everything = client.get("/search?q=教室&limit=500").get_json()
+    one_day = client.get("/search?q=教室&since=2025-01-02&until=2025-01-02&limit=500").get_json()
+
+    assert 0 < one_day["total"] < everything["total"]
+    assert one_day["total"] == len(one_day["tasks"])
+    assert all(task["timestamp"].startswith("2025-01-02") for task in one_day["tasks"])
+
+
+def test_search_rejects_sort(load_main):
+    main = load_main(FAKE_SHEETS_ROWS=5)
+    client = main.app.test_client()
+
+    assert client.get("/search?q=教室&sort=newest").status_code == 400
@@ -0,0 +1,101 @@
+import pytest
+import requests
+
+from conftest import fake_worksheet, submit
+
+
+@pytest.fixture
+def main(load_main, tmp_path):
+    """本機資料庫模式；背景同步的間隔設得很長，由測試自行呼叫 replicate_once()。"""
+    return load_main(FAKE_SHEETS_ROWS=5, STORAGE_MODE="sqlite", SQLITE_PATH=tmp_path / "reports.db",
+                     REPLICATION_INTERVAL=1000)
+
+
+def sheet_rows(main):
+    return fake_worksheet(main).get_all_values()[1:]
+
+
+def test_new_reports_and_status_changes_reach_the_sheet(main):
+    client = main.app.test_client()
+    ticket = submit(client, "網路斷線").get_json()["ticket"]
+    main.replicator.replicate_once()
+    assert [row[6] for row in sheet_rows(main)].count(ticket) == 1
+
+    assert client.post('/update_status', json={"id": ticket, "newStatus": "已完成"}).status_code == 200
+    main.replicator.replicate_once()
+
+    row = next(row for row in sheet_rows(main) if row[6] == ticket)
+    assert row[5] == "已完成"
+    assert row[7]
+
+
+def test_append_whose_response_was_lost_is_not_repeated(main):
+    # 假工作表與 Sheets API 一樣不回傳尾端的空白儲存格，未完成報修讀回來時沒有 H 欄
+    fake = fake_worksheet(main)
+    append_rows = fake.append_rows
+    calls = []
+
+    def lost_response(rows, **kwargs):
+        result = append_rows(rows, **kwargs)
+        calls.append(len(rows))
+        if len(calls) == 1:
+            raise requests.Timeout("回應遺失")
+        return result
+
+    fake.append_rows = lost_response
+    client = main.app.test_client()
+    ticket = submit(client, "未完成的報修").get_json()["ticket"]
+
+    with pytest.raises(requests.Timeout):
+        main.replicator.replicate_once()
+    main.replicator.replicate_once()
+    main.replicator.replicate_once()
+
+    assert [row[6] for row in sheet_rows(main)].count(ticket) == 1
+    assert len(calls) == 1
+
+
+def test_manually_deleted_row_does_not_redirect_writes(main):
+    client = main.app.test_client()
+    for i in range(3):
+        submit(client, f"報修 {i}")
+    main.replicator.replicate_once()
+
+    # 有人直接在工作表上刪除第 3 列，其下各列往上移
+    deleted = sheet_rows(main)[1]
+    fake_worksheet(main)._delete_rows(2, 3)
+    submit(client, "刪除之後")
+    main.replicator.replicate_once()
+    main.replicator.replicate_once()
+
+    tickets = [row[6] for row in sheet_rows(main)]
+    assert len(tickets) == len(set(tickets)) == 8
+    assert deleted[6] not in tickets
+
+    # 更新被刪除列下方的報修，要寫到它現在的列
+    target = next(row for row in sheet_rows(main) if row[3] == "報修 1")
+    assert client.post('/update_status', json={"id": target[6], "newStatus": "已完成"}).status_code == 200
+    # 被刪除的那筆本機仍有資料，可以更新，但不能寫到別人的列上
+    assert client.post('/update_status', json={"id": deleted[6], "newStatus": "已完成"}).status_code == 200
+    before = {row[6]: row[5] for row in sheet_rows(main)}
+    main.replicator.replicate_once()
+
+    after = {row[6]: row[5] for row in sheet_rows(main)}
+    assert after[target[6]] == "已完成"
+    assert {ticket: status for ticket, status in after.items() if ticket != target[6]} == \
+        {ticket: status for ticket, status in before.items() if ticket != target[6]}
+
+
+def test_manual_status_edit_is_reconciled_into_the_local_store(main):
+    client = main.app.test_client()
+    ticket = submit(client, "椅子損壞").get_json()["ticket"]
+    main.replicator.replicate_once()
+
+    fake = fake_worksheet(main)
+    row_index = next(i for i, row in enumerate(fake.get_all_values(), start=1) if row[6] == ticket)
+    fake.update_cell(row_index, main.STATUS_COLUMN_INDEX, "處理中")
+    main.replicator.reconcile_interval = 0
+    main.replicator.replicate_once()
+
+    task = next(task for task in client.get('/get_tasks').get_json()["tasks"] if task["id"] == ticket)
+    assert task["status"] == "處理中"
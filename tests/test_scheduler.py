@@ -0,0 +1,89 @@
+import threading
+
+import pytest
+import requests
+
+from conftest import fake_worksheet, wait_for
+from fake_sheets import FakeSheetsError
+
+
+def failing(*errors):
+    """依序拋出 errors 中的例外，之後成功；回傳 (函式, 呼叫次數的清單)。"""
+    calls = []
+
+    def call():
+        calls.append(len(calls))
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return "ok"
+    return call, calls
+
+
+def test_user_lane_is_served_before_background(load_main):
+    main = load_main()
+    # 每 0.5 秒補充一個權杖，先用掉唯一的權杖，讓兩位等待者都必須排隊
+    scheduler = main.SheetsScheduler(reads_per_minute=120, writes_per_minute=120, burst=1)
+    scheduler.acquire('read')
+    served = []
+
+    def waiter(lane):
+        scheduler.acquire('read', lane=lane)
+        served.append(lane)
+
+    background = threading.Thread(target=waiter, args=(main.LANE_BACKGROUND,))
+    background.start()
+    wait_for(lambda: scheduler.stats()['read']['queueDepthByLane']['background'] == 1)
+    user = threading.Thread(target=waiter, args=(main.LANE_USER,))
+    user.start()
+    wait_for(lambda: scheduler.stats()['read']['queueDepthByLane']['user'] == 1)
+    background.join(5)
+    user.join(5)
+
+    # 背景工作先排隊，仍然讓使用者的請求先取得權杖
+    assert served == [main.LANE_USER, main.LANE_BACKGROUND]
+
+
+@pytest.mark.parametrize("error", [FakeSheetsError(503, "後端錯誤"), requests.Timeout("逾時")])
+def test_non_idempotent_write_is_not_retried_when_it_may_have_run(load_main, error):
+    main = load_main()
+    call, calls = failing(error)
+
+    with pytest.raises(type(error)):
+        main.sheets_scheduler.call('write', call, idempotent=False)
+
+    assert len(calls) == 1
+
+
+def test_non_idempotent_write_is_retried_when_rate_limited(load_main):
+    main = load_main()
+    call, calls = failing(FakeSheetsError(429, "配額用盡"))
+
+    assert main.sheets_scheduler.call('write', call, idempotent=False) == "ok"
+    assert len(calls) == 2
+
+
+@pytest.mark.parametrize("error", [FakeSheetsError(503, "後端錯誤"), requests.Timeout("逾時")])
+def test_idempotent_call_is_retried(load_main, error):
+    main = load_main()
+    call, calls = failing(error, error)
+
+    assert main.sheets_scheduler.call('read', call) == "ok"
+    assert len(calls) == 3
+
+
+def test_worksheet_methods_are_classified(load_main):
+    main = load_main(FAKE_SHEETS_ROWS=3)
+    fake = fake_worksheet(main)
+    append_rows, update_cell = fake.append_rows, fake.update_cell
+    appends, updates = failing(FakeSheetsError(503, "後端錯誤")), failing(FakeSheetsError(503, "後端錯誤"))
+    fake.append_rows = lambda *args, **kwargs: appends[0]() and append_rows(*args, **kwargs)
+    fake.update_cell = lambda *args, **kwargs: updates[0]() and update_cell(*args, **kwargs)
+
+    # 附加列重送可能重複附加，不重試；寫入固定儲存格可以放心重試
+    with pytest.raises(FakeSheetsError):
+        main.sheet.append_rows([["x"]])
+    main.sheet.update_cell(2, 6, "已完成")
+
+    assert len(appends[1]) == 1
+    assert len(updates[1]) == 2
+    assert fake.get_all_values()[1][5] == "已完成"
@@ -0,0 +1,73 @@
+import pytest
+
+from fake_sheets import HEADER_ROW
+
+
+def shard_rows(prefix, count):
+    return [[f"{prefix} 08:{i:02d}:00", f"學生{i}", "101 教室", f"{prefix} #{i}", "無指定", "待處理",
+             f"{prefix.replace('-', '')}{i:04d}"] for i in range(count)]
+
+
+@pytest.fixture
+def main(load_main):
+    """
+    按月分片：原本的工作表 10 筆 (虛擬列 2～11)，2025-02 分片 5 筆 (12～16)，2025-03 分片 4 筆 (17～20)。
+    """
+    main = load_main(SHEET_SHARDING="month", FAKE_SHEETS_ROWS=10)
+    spreadsheet = main.spreadsheet._worksheet
+    for key, count in (("2025-02", 5), ("2025-03", 4)):
+        worksheet = spreadsheet.add_worksheet(title=f"{main.WORKSHEET_NAME}_{key}", rows=1000, cols=8)
+        worksheet.append_rows([HEADER_ROW] + shard_rows(f"{key}-01", count))
+    main.sheet.refresh()
+    return main
+
+
+def shards(main):
+    return main.spreadsheet._worksheet._worksheets
+
+
+def flat_rows(main):
+    """各分片的資料列依序串接 (虛擬列號 2 起)。"""
+    return [list(row) for worksheet in shards(main) for row in worksheet.get_all_values()[1:]]
+
+
+def trimmed(rows):
+    rows = [list(row) for row in rows]
+    for row in rows:
+        while row and row[-1] == "":
+            row.pop()
+    return rows
+
+
+def test_ranges_spanning_shards_map_to_virtual_rows(main):
+    rows = flat_rows(main)
+    assert len(rows) == 19
+
+    assert main.sheet.get("A1:H1") == [HEADER_ROW]
+    assert main.sheet.get("A10:H18") == trimmed(rows[8:17])
+    assert main.sheet.get("A17:H") == trimmed(rows[15:])
+    assert main.sheet.batch_get(["G12:G12", "A2:B3"]) == [[[rows[10][6]]], [row[:2] for row in rows[:2]]]
+    assert main.sheet.col_values(7) == ["受理編號"] + [row[6] for row in rows]
+
+
+def test_writes_land_in_the_right_shard(main):
+    main.sheet.batch_update([{"range": "F13", "values": [["已完成"]]}, {"range": "F3", "values": [["處理中"]]}])
+
+    base, february, _ = shards(main)
+    assert february.get_all_values()[2][5] == "已完成"
+    assert base.get_all_values()[2][5] == "處理中"
+    assert main.sheet.get("F13")[0][0] == "已完成"
+
+
+def test_delete_rows_across_shards(main):
+    rows = flat_rows(main)
+
+    # 由大到小：15～17 跨越 2 月與 3 月分片，9～10 在原本的工作表
+    main.sheet.delete_rows([(15, 17), (9, 10)])
+
+    expected = [row for virtual, row in enumerate(rows, start=2) if virtual not in (9, 10, 15, 16, 17)]
+    assert flat_rows(main) == expected
+    assert [len(worksheet.get_all_values()) - 1 for worksheet in shards(main)] == [8, 3, 3]
+    # 刪除後的列數已更新，不必重新讀取也能正確換算虛擬列號
+    assert main.sheet.get("A2:H") == trimmed(expected)
+    assert main.sheet.get("G13:G13") == [[expected[11][6]]]
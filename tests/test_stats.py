@@ -0,0 +1,59 @@
+from conftest import fake_worksheet, submit, wait_for
+from fake_sheets import sample_ticket
+
+
+def stats(client):
+    return client.get('/stats').get_json()
+
+
+def test_incremental_stats_match_a_full_rebuild(load_main):
+    main = load_main(FAKE_SHEETS_ROWS=200)
+    client = main.app.test_client()
+    for i in range(10):
+        assert client.post('/update_status', json={"id": sample_ticket(i), "newStatus": "已完成"}).status_code == 200
+    client.post('/update_status', json={"id": sample_ticket(3), "newStatus": "處理中"})
+    submit(client, "新教室的投影機", deviceLocation="新教室")
+    wait_for(lambda: main.write_queue.pending_count() == 0)
+    incremental = stats(client)
+
+    main.task_cache.invalidate()
+    rebuilt = stats(client)
+
+    for key in ("total", "open", "byStatus", "byLocation", "byTeacher", "timeToFix"):
+        assert incremental[key] == rebuilt[key], key
+    assert rebuilt["total"] == 201
+    assert rebuilt["byLocation"]["新教室"]["open"] == 1
+
+
+def test_completed_at_round_trips_through_the_sheet(load_main):
+    main = load_main(FAKE_SHEETS_ROWS=0)
+    client = main.app.test_client()
+    ticket = submit(client, "冷氣不冷").get_json()["ticket"]
+    wait_for(lambda: ticket not in main.write_queue.pending_tickets())
+    assert client.post('/update_status', json={"id": ticket, "newStatus": "已完成"}).status_code == 200
+    before = stats(client)["timeToFix"]
+    completed_at = main.task_cache.completed_at([2])[2]
+
+    # 完整同步：完成時間以工作表上的內容為準，必須與寫入時的文字相同
+    main.task_cache.invalidate()
+    after = stats(client)["timeToFix"]
+
+    assert before == after and after["count"] == 1
+    row = next(row for row in fake_worksheet(main).get_all_values() if row[6] == ticket)
+    assert row[7] == completed_at == main.task_cache.completed_at([2])[2]
+
+
+def test_completed_at_in_sheet_display_format_is_counted(load_main):
+    main = load_main(FAKE_SHEETS_ROWS=0)
+    fake = fake_worksheet(main)
+    # 以 USER_ENTERED 寫入 (舊版或手動輸入) 的完成時間，讀回的是工作表的顯示格式
+    fake.append_rows([
+        ["2025-01-05 08:00:00", "甲", "101 教室", "燈不亮", "無指定", "已完成", "a00000000001", "2025/1/5 下午 2:00:00"],
+        ["2025-01-05 08:00:00", "乙", "101 教室", "門壞了", "無指定", "已完成", "a00000000002", "2025/1/5 10:00:00"],
+    ])
+    main.task_cache.invalidate()
+
+    time_to_fix = stats(main.app.test_client())["timeToFix"]
+
+    assert time_to_fix["count"] == 2
+    assert time_to_fix["p90Hours"] == 6
@@ -0,0 +1,129 @@
+import json
+import threading
+
+import requests
+
+from conftest import fake_worksheet, submit, wait_for
+from fake_sheets import FakeSheetsError
+
+
+def test_batches_are_written_in_order(load_main):
+    main = load_main(WRITE_BATCH_SIZE=5)
+    client = main.app.test_client()
+    tickets = [submit(client, f"描述 {i}").get_json()["ticket"] for i in range(12)]
+    wait_for(lambda: main.write_queue.pending_count() == 0)
+
+    rows = fake_worksheet(main).get_all_values()[1:]
+    assert [row[6] for row in rows] == tickets
+    assert [row[3] for row in rows] == [f"描述 {i}" for i in range(12)]
+
+
+def test_append_that_timed_out_after_landing_is_not_repeated(load_main):
+    main = load_main()
+    fake = fake_worksheet(main)
+    append_rows = fake.append_rows
+    calls = []
+
+    def lost_response(rows, **kwargs):
+        result = append_rows(rows, **kwargs)
+        calls.append(len(rows))
+        if len(calls) == 1:
+            raise requests.Timeout("回應遺失")
+        return result
+
+    fake.append_rows = lost_response
+    client = main.app.test_client()
+    assert submit(client, "只寫一次").status_code == 202
+    wait_for(lambda: main.write_queue.pending_count() == 0)
+
+    assert [row[3] for row in fake.get_all_values()].count("只寫一次") == 1
+
+
+def test_rejected_row_is_dead_lettered_and_the_rest_are_written(load_main):
+    main = load_main()
+    fake = fake_worksheet(main)
+    append_rows = fake.append_rows
+
+    def reject_bad_rows(rows, **kwargs):
+        if any(row[3] == "無效" for row in rows):
+            raise FakeSheetsError(400, "Invalid value")
+        return append_rows(rows, **kwargs)
+
+    fake.append_rows = reject_bad_rows
+    client = main.app.test_client()
+    for description in ("第一筆", "無效", "第三筆"):
+        assert submit(client, description).status_code == 202
+    wait_for(lambda: main.write_queue.pending_count() == 0)
+
+    descriptions = [row[3] for row in fake.get_all_values()]
+    assert "第一筆" in descriptions and "第三筆" in descriptions
+    assert "無效" not in descriptions
+    assert main.write_queue.dead_lettered == 1
+    with open(main.WRITE_DEAD_LETTER_PATH, encoding="utf-8") as f:
+        entries = [json.loads(line) for line in f]
+    assert [entry["row"][3] for entry in entries] == ["無效"]
+
+    # 之後送出的報修照常寫入
+    assert submit(client, "之後").status_code == 202
+    wait_for(lambda: "之後" in [row[3] for row in fake.get_all_values()])
+
+
+def test_oversized_field_is_rejected_at_submit(load_main):
+    main = load_main(MAX_REPORT_FIELD_CHARS=100)
+    client = main.app.test_client()
+
+    response = submit(client, "長" * 101)
+
+    assert response.status_code == 400
+    assert main.write_queue.pending_count() == 0
+
+
+def test_status_update_for_ticket_being_written_asks_to_retry(load_main):
+    main = load_main()
+    fake = fake_worksheet(main)
+    append_rows = fake.append_rows
+    writing, release = threading.Event(), threading.Event()
+
+    def stuck(rows, **kwargs):
+        writing.set()
+        release.wait(5)
+        return append_rows(rows, **kwargs)
+
+    fake.append_rows = stuck
+    client = main.app.test_client()
+    ticket = submit(client, "寫入中").get_json()["ticket"]
+    assert writing.wait(5)
+
+    response = client.post('/update_status', json={"id": ticket, "newStatus": "已完成"})
+    assert response.status_code == 409
+    assert response.headers["Retry-After"]
+
+    release.set()
+    wait_for(lambda: ticket not in main.write_queue.pending_tickets())
+    response = client.post('/update_status', json={"id": ticket, "newStatus": "已完成"})
+    assert response.status_code == 200
+
+
+def test_status_patched_in_the_queue_survives_a_lost_append_response(load_main):
+    main = load_main(WRITE_FLUSH_INTERVAL=0.5)
+    fake = fake_worksheet(main)
+    append_rows = fake.append_rows
+    calls = []
+
+    def lost_response(rows, **kwargs):
+        result = append_rows(rows, **kwargs)
+        calls.append(len(rows))
+        if len(calls) == 1:
+            raise requests.Timeout("回應遺失")
+        return result
+
+    fake.append_rows = lost_response
+    client = main.app.test_client()
+    ticket = submit(client, "先完成再改回處理中").get_json()["ticket"]
+    for status in ("已完成", "處理中"):
+        assert client.post('/update_status', json={"id": ticket, "newStatus": status}).status_code == 200
+    wait_for(lambda: main.write_queue.pending_count() == 0)
+
+    rows = [row for row in fake.get_all_values() if row[6] == ticket]
+    assert len(rows) == 1 and len(calls) == 1
+    assert rows[0][5] == "處理中" and rows[0][7] == ""